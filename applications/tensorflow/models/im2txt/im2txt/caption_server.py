@@ -0,0 +1,162 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Serve captions for images over HTTP with a long-lived model.
+
+The model is loaded once. Images are captioned by POSTing the encoded image to
+/caption, optionally with beam search parameters in the query string:
+
+  curl --data-binary @image.jpg \
+      "http://localhost:8080/caption?beam_size=5&max_caption_length=20"
+
+The response is a JSON object with the captions, whether the image's initial
+model state was cached and the request latency. GET /stats returns request and
+cache statistics.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+try:
+  from http import server as http_server  # Python 3.
+  from urllib.parse import parse_qs, urlparse
+except ImportError:
+  import BaseHTTPServer as http_server  # Python 2.
+  from urlparse import parse_qs, urlparse
+
+
+import tensorflow as tf
+
+from im2txt import configuration
+from im2txt import inference_wrapper
+from im2txt.inference_utils import caption_service
+from im2txt.inference_utils import vocabulary
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("checkpoint_path", "",
+                       "Model checkpoint file or directory containing a "
+                       "model checkpoint file.")
+tf.flags.DEFINE_string("vocab_file", "", "Text file containing the vocabulary.")
+tf.flags.DEFINE_string("host", "localhost", "Host name to serve on.")
+tf.flags.DEFINE_integer("port", 8080, "Port to serve on.")
+tf.flags.DEFINE_integer("cache_size", 1000,
+                        "Maximum number of image states kept in the cache.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+# Query parameters of /caption and their types.
+_CAPTION_PARAMS = {
+    "beam_size": int,
+    "max_caption_length": int,
+    "length_normalization_factor": float,
+}
+
+
+class CaptionRequestHandler(http_server.BaseHTTPRequestHandler):
+  """Handles caption and statistics requests to a CaptionService."""
+
+  def _send_json(self, code, response):
+    body = json.dumps(response).encode("utf-8")
+    self.send_response(code)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    if urlparse(self.path).path != "/stats":
+      self._send_json(404, {"error": "Not found: %s" % self.path})
+      return
+    self._send_json(200, self.server.caption_service.stats())
+
+  def do_POST(self):  # pylint: disable=invalid-name
+    url = urlparse(self.path)
+    if url.path != "/caption":
+      self._send_json(404, {"error": "Not found: %s" % self.path})
+      return
+    try:
+      kwargs = dict((name, _CAPTION_PARAMS[name](values[-1]))
+                    for name, values in parse_qs(url.query).items())
+    except (KeyError, ValueError) as e:
+      self._send_json(400, {"error": "Invalid query parameter: %s" % e})
+      return
+    for name in ["beam_size", "max_caption_length"]:
+      if name in kwargs and kwargs[name] < 1:
+        self._send_json(400, {"error": "%s must be at least 1" % name})
+        return
+
+    content_length = self.headers.get("Content-Length")
+    if content_length is None:
+      self._send_json(411, {"error": "Content-Length required"})
+      return
+    try:
+      content_length = int(content_length)
+    except ValueError:
+      content_length = -1
+    if content_length < 0:
+      self._send_json(400, {"error": "Invalid Content-Length: %s" %
+                                     self.headers.get("Content-Length")})
+      return
+    encoded_image = self.rfile.read(content_length)
+
+    try:
+      response = self.server.caption_service.caption(encoded_image, **kwargs)
+    except tf.errors.InvalidArgumentError as e:
+      # Raised by the model's image decoding.
+      self._send_json(400, {"error": "Invalid image: %s" % e.message})
+      return
+    except Exception as e:  # pylint: disable=broad-except
+      tf.logging.error("Captioning failed: %s", e)
+      self._send_json(500, {"error": "Captioning failed: %s" % e})
+      return
+    tf.logging.info("Captioned %d byte image in %.1f ms (cache %s)",
+                    len(encoded_image), response["latency_ms"],
+                    "hit" if response["cache_hit"] else "miss")
+    self._send_json(200, response)
+
+
+def main(_):
+  # Build the inference graph.
+  g = tf.Graph()
+  with g.as_default():
+    model = inference_wrapper.InferenceWrapper()
+    restore_fn = model.build_graph_from_config(configuration.ModelConfig(),
+                                               FLAGS.checkpoint_path)
+  g.finalize()
+
+  # Create the vocabulary.
+  vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
+
+  with tf.Session(graph=g) as sess:
+    # Load the model from checkpoint.
+    restore_fn(sess)
+
+    server = http_server.HTTPServer((FLAGS.host, FLAGS.port),
+                                    CaptionRequestHandler)
+    server.caption_service = caption_service.CaptionService(
+        sess, model, vocab, cache_size=FLAGS.cache_size)
+    tf.logging.info("Serving captions on http://%s:%d", FLAGS.host, FLAGS.port)
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+  tf.app.run()
@@ -78,6 +78,11 @@ This is done for two reasons:
      TensorFlow.
 
 Running this script using 16 threads may take around 1 hour on a HP Z420.
+
+Image-caption pairs are assigned to shards by a hash of the pair, and every
+shard is written with a manifest of the images and captions it was built from.
+Rerunning the script only rewrites the shards whose images, captions or
+vocabulary changed, e.g. after an interrupted run or when images are added.
 """
 
 from __future__ import absolute_import
@@ -87,9 +92,9 @@ from __future__ import print_function
 from collections import Counter
 from collections import namedtuple
 from datetime import datetime
+import hashlib
 import json
 import os.path
-import random
 import sys
 import threading
 
@@ -99,6 +104,8 @@ import nltk.tokenize
 import numpy as np
 import tensorflow as tf
 
+from im2txt.data import shard_writer
+
 tf.flags.DEFINE_string("train_image_dir", "/tmp/train2014/",
                        "Training image directory.")
 tf.flags.DEFINE_string("val_image_dir", "/tmp/val2014",
@@ -151,6 +158,7 @@ class Vocabulary(object):
     """
     self._vocab = vocab
     self._unk_id = unk_id
+    self._fingerprint = None
 
   def word_to_id(self, word):
     """Returns the integer id of a word string."""
@@ -159,6 +167,13 @@ class Vocabulary(object):
     else:
       return self._unk_id
 
+  def fingerprint(self):
+    """Returns a hash of the word to word_id mapping."""
+    if self._fingerprint is None:
+      self._fingerprint = hashlib.sha1(json.dumps(
+          sorted(self._vocab.items())).encode("utf-8")).hexdigest()
+    return self._fingerprint
+
 
 class ImageDecoder(object):
   """Helper class for decoding images in TensorFlow."""
@@ -237,62 +252,70 @@ def _to_sequence_example(image, decoder, vocab):
   return sequence_example
 
 
-def _process_image_files(thread_index, ranges, name, images, decoder, vocab,
-                         num_shards):
+def _process_image_files(thread_index, ranges, name, images, shards, decoder,
+                         vocab, num_shards):
   """Processes and saves a subset of images as TFRecord files in one thread.
 
   Args:
     thread_index: Integer thread identifier within [0, len(ranges)].
-    ranges: A list of pairs of integers specifying the ranges of the dataset to
+    ranges: A list of pairs of integers specifying the ranges of shards to
       process in parallel.
     name: Unique identifier specifying the dataset.
     images: List of ImageMetadata.
+    shards: A list of num_shards lists of indices into images, the
+      image-caption pairs of each shard.
     decoder: An ImageDecoder object.
     vocab: A Vocabulary object.
     num_shards: Integer number of shards for the output files.
   """
-  # Each thread produces N shards where N = num_shards / num_threads. For
-  # instance, if num_shards = 128, and num_threads = 2, then the first thread
-  # would produce shards [0, 64).
-  num_threads = len(ranges)
-  assert not num_shards % num_threads
-  num_shards_per_batch = int(num_shards / num_threads)
-
-  shard_ranges = np.linspace(ranges[thread_index][0], ranges[thread_index][1],
-                             num_shards_per_batch + 1).astype(int)
-  num_images_in_thread = ranges[thread_index][1] - ranges[thread_index][0]
+  # Each thread produces the shards in its range, e.g. if num_shards = 128 and
+  # num_threads = 2, then the first thread would produce shards [0, 64).
+  shard_range = xrange(ranges[thread_index][0], ranges[thread_index][1])
+  num_images_in_thread = sum(len(shards[shard]) for shard in shard_range)
 
   counter = 0
-  for s in xrange(num_shards_per_batch):
+  num_skipped = 0
+  for shard in shard_range:
     # Generate a sharded version of the file name, e.g. 'train-00002-of-00010'
-    shard = thread_index * num_shards_per_batch + s
     output_filename = "%s-%.5d-of-%.5d" % (name, shard, num_shards)
     output_file = os.path.join(FLAGS.output_dir, output_filename)
-    writer = tf.python_io.TFRecordWriter(output_file)
+
+    images_in_shard = [images[i] for i in shards[shard]]
+    # The shard also depends on its captions and the word ids they map to.
+    config = json.dumps([vocab.fingerprint(),
+                         [[image.image_id, image.captions]
+                          for image in images_in_shard]])
+    writer = shard_writer.ShardWriter(
+        output_file,
+        sorted(set(image.filename for image in images_in_shard)), config)
+    if writer.is_current():
+      num_skipped += 1
+      counter += len(images_in_shard)
+      print("%s [thread %d]: %s is up to date" %
+            (datetime.now(), thread_index, output_file))
+      sys.stdout.flush()
+      continue
 
     shard_counter = 0
-    images_in_shard = np.arange(shard_ranges[s], shard_ranges[s + 1], dtype=int)
-    for i in images_in_shard:
-      image = images[i]
-
-      sequence_example = _to_sequence_example(image, decoder, vocab)
-      if sequence_example is not None:
-        writer.write(sequence_example.SerializeToString())
-        shard_counter += 1
+    with writer as record_writer:
+      for image in images_in_shard:
+        sequence_example = _to_sequence_example(image, decoder, vocab)
+        if sequence_example is not None:
+          record_writer.write(sequence_example.SerializeToString())
+          shard_counter += 1
         counter += 1
 
-      if not counter % 1000:
-        print("%s [thread %d]: Processed %d of %d items in thread batch." %
-              (datetime.now(), thread_index, counter, num_images_in_thread))
-        sys.stdout.flush()
+        if not counter % 1000:
+          print("%s [thread %d]: Processed %d of %d items in thread batch." %
+                (datetime.now(), thread_index, counter, num_images_in_thread))
+          sys.stdout.flush()
 
-    writer.close()
     print("%s [thread %d]: Wrote %d image-caption pairs to %s" %
           (datetime.now(), thread_index, shard_counter, output_file))
     sys.stdout.flush()
-    shard_counter = 0
-  print("%s [thread %d]: Wrote %d image-caption pairs to %d shards." %
-        (datetime.now(), thread_index, counter, num_shards_per_batch))
+  print("%s [thread %d]: Processed %d image-caption pairs in %d shards, "
+        "%d of them up to date." %
+        (datetime.now(), thread_index, counter, len(shard_range), num_skipped))
   sys.stdout.flush()
 
 
@@ -309,14 +332,18 @@ def _process_dataset(name, images, vocab, num_shards):
   images = [ImageMetadata(image.image_id, image.filename, [caption])
             for image in images for caption in image.captions]
 
-  # Shuffle the ordering of images. Make the randomization repeatable.
-  random.seed(12345)
-  random.shuffle(images)
+  # Assign the image-caption pairs to shards by a hash of the pair. This also
+  # shuffles them, and unlike cutting a shuffled list into ranges it keeps
+  # most shards unchanged when images are added or removed, so that reruns
+  # only rewrite the shards that changed.
+  keys = ["%s\t%s" % (image.filename, " ".join(image.captions[0]))
+          for image in images]
+  shards = shard_writer.stable_partition(keys, num_shards)
 
-  # Break the images into num_threads batches. Batch i is defined as
-  # images[ranges[i][0]:ranges[i][1]].
+  # Break the shards into num_threads batches. Batch i is defined as
+  # shards[ranges[i][0]:ranges[i][1]].
   num_threads = min(num_shards, FLAGS.num_threads)
-  spacing = np.linspace(0, len(images), num_threads + 1).astype(np.int)
+  spacing = np.linspace(0, num_shards, num_threads + 1).astype(int)
   ranges = []
   threads = []
   for i in xrange(len(spacing) - 1):
@@ -329,9 +356,10 @@ def _process_dataset(name, images, vocab, num_shards):
   decoder = ImageDecoder()
 
   # Launch a thread for each batch.
-  print("Launching %d threads for spacings: %s" % (num_threads, ranges))
+  print("Launching %d threads for shard ranges: %s" % (num_threads, ranges))
   for thread_index in xrange(len(ranges)):
-    args = (thread_index, ranges, name, images, decoder, vocab, num_shards)
+    args = (thread_index, ranges, name, images, shards, decoder, vocab,
+            num_shards)
     t = threading.Thread(target=_process_image_files, args=args)
     t.start()
     threads.append(t)
@@ -0,0 +1,225 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Resumable writing of TFRecord shards for dataset conversion scripts.
+
+Every shard written by a ShardWriter gets a manifest next to it,
+`<shard>.manifest.json`, recording the content hash of each input file the
+shard was built from and a hash of any other conversion settings. When the
+conversion runs again, a shard whose manifest matches its current inputs is
+skipped. Input files whose size and modification time did not change are not
+read again; their hashes are taken from the manifest.
+
+Shards are written to a temporary file that is renamed into place once
+complete, and the manifest is written after the shard, so an interrupted run
+never leaves a partial shard that looks current.
+
+Skipping only pays off if the contents of most shards stay the same when a
+few inputs are added or removed. stable_partition assigns inputs to shards by
+a hash of their name for that purpose, instead of cutting a shuffled list
+into consecutive ranges, and stable_sample picks e.g. a validation split the
+same way.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import uuid
+
+import tensorflow as tf
+
+_MANIFEST_SUFFIX = ".manifest.json"
+_MANIFEST_VERSION = 1
+_READ_BLOCK_SIZE = 1 << 20
+
+
+def _as_bytes(value):
+  if isinstance(value, bytes):
+    return value
+  return value.encode("utf-8")
+
+
+def _key_hash(key):
+  return hashlib.sha1(_as_bytes(key)).hexdigest()
+
+
+def stable_partition(keys, num_partitions):
+  """Assigns items to partitions by a hash of their keys.
+
+  An item stays in its partition when other items are added or removed, and
+  items are ordered by the same hash within a partition, which also spreads
+  e.g. the classes of a dataset sorted by class.
+
+  Args:
+    keys: list of unique string keys, e.g. input file names.
+    num_partitions: number of partitions.
+
+  Returns:
+    A list of num_partitions lists of indices into keys.
+  """
+  hashes = [_key_hash(key) for key in keys]
+  partitions = [[] for _ in range(num_partitions)]
+  for index in sorted(range(len(keys)), key=lambda i: hashes[i]):
+    partitions[int(hashes[index], 16) % num_partitions].append(index)
+  return partitions
+
+
+def stable_sample(keys, num_samples):
+  """Picks the items with the num_samples smallest hashes of their keys.
+
+  Unlike slicing a shuffled list, adding or removing an item changes the
+  sample by at most one other item, so e.g. a validation split picked this
+  way barely changes when the dataset does.
+
+  Args:
+    keys: list of unique string keys, e.g. input file names.
+    num_samples: number of items to pick.
+
+  Returns:
+    A sorted list of min(num_samples, len(keys)) indices into keys.
+  """
+  hashes = [_key_hash(key) for key in keys]
+  return sorted(sorted(range(len(keys)), key=lambda i: hashes[i])[:num_samples])
+
+
+def manifest_filename(output_path):
+  return output_path + _MANIFEST_SUFFIX
+
+
+def _file_digest(path):
+  sha1 = hashlib.sha1()
+  with tf.gfile.GFile(path, "rb") as f:
+    while True:
+      block = f.read(_READ_BLOCK_SIZE)
+      if not block:
+        break
+      sha1.update(block)
+  return sha1.hexdigest()
+
+
+class ShardWriter(object):
+  """Writes one TFRecord shard, unless it is already up to date.
+
+  Usage:
+
+    shard = ShardWriter(output_path, input_paths, config)
+    if not shard.is_current():
+      with shard as writer:
+        for example in ...:
+          writer.write(example.SerializeToString())
+  """
+
+  def __init__(self, output_path, input_paths, config=""):
+    """Creates the writer.
+
+    Args:
+      output_path: path of the TFRecord shard.
+      input_paths: list of the files the shard is built from.
+      config: string with any other data or settings that the contents of
+        the shard depend on, e.g. a label map or the serialized captions.
+    """
+    self._output_path = output_path
+    self._input_paths = list(input_paths)
+    self._config_hash = _key_hash(config)
+    self._previous = self._read_manifest()
+    self._inputs = None
+    self._writer = None
+    self._tmp_path = None
+
+  @property
+  def output_path(self):
+    return self._output_path
+
+  def _read_manifest(self):
+    path = manifest_filename(self._output_path)
+    if not tf.gfile.Exists(path):
+      return None
+    try:
+      with tf.gfile.GFile(path, "r") as f:
+        manifest = json.loads(f.read())
+    except ValueError:
+      return None
+    if manifest.get("version") != _MANIFEST_VERSION:
+      return None
+    return manifest
+
+  def _current_inputs(self):
+    """Returns [path, size, mtime_nsec, sha1] of every input file."""
+    if self._inputs is None:
+      previous = {}
+      if self._previous:
+        previous = dict((entry[0], entry) for entry in self._previous["inputs"])
+      self._inputs = []
+      for path in self._input_paths:
+        stat = tf.gfile.Stat(path)
+        entry = previous.get(path)
+        if (entry is None or entry[1] != stat.length or
+            entry[2] != stat.mtime_nsec):
+          digest = _file_digest(path)
+        else:
+          digest = entry[3]
+        self._inputs.append([path, stat.length, stat.mtime_nsec, digest])
+    return self._inputs
+
+  def is_current(self):
+    """Whether the shard exists and was built from the current inputs."""
+    previous = self._previous
+    if (previous is None or previous["config"] != self._config_hash or
+        not tf.gfile.Exists(self._output_path) or
+        tf.gfile.Stat(self._output_path).length != previous["output_size"]):
+      return False
+    inputs = self._current_inputs()
+    if ([entry[3] for entry in inputs] !=
+        [entry[3] for entry in previous["inputs"]]):
+      return False
+    if inputs != previous["inputs"]:
+      # Same contents, e.g. a copy with new modification times. Record the
+      # new times so that the files are not hashed again next time.
+      self._write_manifest(previous["output_size"])
+    return True
+
+  def _write_manifest(self, output_size):
+    manifest = {
+        "version": _MANIFEST_VERSION,
+        "config": self._config_hash,
+        "output_size": output_size,
+        "inputs": self._current_inputs(),
+    }
+    path = manifest_filename(self._output_path)
+    tmp_path = "%s.tmp-%s" % (path, uuid.uuid4().hex)
+    with tf.gfile.GFile(tmp_path, "w") as f:
+      f.write(json.dumps(manifest))
+    tf.gfile.Rename(tmp_path, path, overwrite=True)
+
+  def __enter__(self):
+    # Hash the inputs before writing, so that changes made while the shard is
+    # written make the next run rebuild it.
+    self._current_inputs()
+    self._tmp_path = "%s.tmp-%s" % (self._output_path, uuid.uuid4().hex)
+    self._writer = tf.python_io.TFRecordWriter(self._tmp_path)
+    return self._writer
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._writer.close()
+    self._writer = None
+    if exc_type is not None:
+      tf.gfile.Remove(self._tmp_path)
+      return
+    output_size = tf.gfile.Stat(self._tmp_path).length
+    tf.gfile.Rename(self._tmp_path, self._output_path, overwrite=True)
+    self._write_manifest(output_size)
+
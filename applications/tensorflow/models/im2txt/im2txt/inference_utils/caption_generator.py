@@ -19,7 +19,6 @@ from __future__ import division
 from __future__ import print_function
 
 import heapq
-import math
 
 
 import numpy as np
@@ -148,64 +147,192 @@ class CaptionGenerator(object):
     Returns:
       A list of Caption sorted by descending score.
     """
-    # Feed in the image to get the initial state.
-    initial_state = self.model.feed_image(sess, encoded_image)
-
-    initial_beam = Caption(
-        sentence=[self.vocab.start_id],
-        state=initial_state[0],
-        logprob=0.0,
-        score=0.0,
-        metadata=[""])
-    partial_captions = TopN(self.beam_size)
-    partial_captions.push(initial_beam)
-    complete_captions = TopN(self.beam_size)
+    return self.batch_beam_search(sess, [encoded_image])[0]
+
+  def batch_beam_search(self, sess, encoded_images):
+    """Runs beam search caption generation on a batch of images.
+
+    Args:
+      sess: TensorFlow Session object.
+      encoded_images: A list of encoded image strings.
+
+    Returns:
+      A list with, for each image, a list of Caption sorted by descending score.
+    """
+    # Feed in the images to get the initial states.
+    initial_states = np.concatenate(
+        [self.model.feed_image(sess, encoded_image)
+         for encoded_image in encoded_images])
+    return self.batch_beam_search_from_states(sess, initial_states)
+
+  def batch_beam_search_from_states(self, sess, initial_states):
+    """Runs beam search caption generation from initial model states.
+
+    The partial captions of all images are advanced together, with a single
+    call to inference_step() per step. Beam state is kept in arrays indexed by
+    [image, beam] rather than in Caption objects: at every step the beam_size
+    most probable next words of each partial caption are found with
+    np.argpartition, and the beam_size best extensions of each image are then
+    selected among its beam_size x beam_size candidates. Images without any
+    partial caption left are retired from the batch.
+
+    Args:
+      sess: TensorFlow Session object.
+      initial_states: A numpy array of shape [num_images, state_size] holding
+        the states returned by feed_image().
+
+    Returns:
+      A list with, for each image, a list of Caption sorted by descending score.
+    """
+    num_images = initial_states.shape[0]
+    beam_size = self.beam_size
+    max_length = self.max_caption_length
+    state_shape = initial_states.shape[1:]
+
+    # Partial captions. Only the first beam of each image is alive initially.
+    sentences = np.zeros([num_images, beam_size, max_length], dtype=np.int64)
+    sentences[:, :, 0] = self.vocab.start_id
+    states = np.zeros((num_images, beam_size) + state_shape,
+                      dtype=initial_states.dtype)
+    states[:, 0] = initial_states
+    logprobs = np.zeros([num_images, beam_size])
+    alive = np.zeros([num_images, beam_size], dtype=bool)
+    alive[:, 0] = True
+    metadata = np.empty([num_images, beam_size, max_length], dtype=object)
+    metadata[:, :, 0] = ""
+    partial_length = 1
+    has_metadata = False
+
+    # Complete captions of each image, as a top beam_size by score.
+    complete_sentences = np.zeros_like(sentences)
+    complete_lengths = np.zeros([num_images, beam_size], dtype=np.int64)
+    complete_states = np.zeros_like(states)
+    complete_logprobs = np.zeros([num_images, beam_size])
+    complete_scores = np.full([num_images, beam_size], -np.inf)
+    complete_metadata = np.empty_like(metadata)
 
     # Run beam search.
-    for _ in range(self.max_caption_length - 1):
-      partial_captions_list = partial_captions.extract()
-      partial_captions.reset()
-      input_feed = np.array([c.sentence[-1] for c in partial_captions_list])
-      state_feed = np.array([c.state for c in partial_captions_list])
-
-      softmax, new_states, metadata = self.model.inference_step(sess,
-                                                                input_feed,
-                                                                state_feed)
-
-      for i, partial_caption in enumerate(partial_captions_list):
-        word_probabilities = softmax[i]
-        state = new_states[i]
-        # For this partial caption, get the beam_size most probable next words.
-        words_and_probs = list(enumerate(word_probabilities))
-        words_and_probs.sort(key=lambda x: -x[1])
-        words_and_probs = words_and_probs[0:self.beam_size]
-        # Each next word gives a new partial caption.
-        for w, p in words_and_probs:
-          if p < 1e-12:
-            continue  # Avoid log(0).
-          sentence = partial_caption.sentence + [w]
-          logprob = partial_caption.logprob + math.log(p)
-          score = logprob
-          if metadata:
-            metadata_list = partial_caption.metadata + [metadata[i]]
-          else:
-            metadata_list = None
-          if w == self.vocab.end_id:
-            if self.length_normalization_factor > 0:
-              score /= len(sentence)**self.length_normalization_factor
-            beam = Caption(sentence, state, logprob, score, metadata_list)
-            complete_captions.push(beam)
-          else:
-            beam = Caption(sentence, state, logprob, score, metadata_list)
-            partial_captions.push(beam)
-      if partial_captions.size() == 0:
+    for length in range(2, max_length + 1):
+      image_indices, beam_indices = np.nonzero(alive)
+      if not image_indices.size:
         # We have run out of partial candidates; happens when beam_size = 1.
         break
+      input_feed = sentences[image_indices, beam_indices, length - 2]
+      state_feed = states[image_indices, beam_indices]
+
+      softmax, new_states, step_metadata = self.model.inference_step(
+          sess, input_feed, state_feed)
+      has_metadata = has_metadata or bool(step_metadata)
+
+      # For each partial caption, get the beam_size most probable next words.
+      num_words = min(beam_size, softmax.shape[1])
+      if num_words < softmax.shape[1]:
+        words = np.argpartition(-softmax, num_words - 1,
+                                axis=1)[:, :num_words]
+      else:
+        words = np.tile(np.arange(softmax.shape[1]), [softmax.shape[0], 1])
+      rows = np.arange(softmax.shape[0])[:, np.newaxis]
+      probs = softmax[rows, words]
+      valid = probs >= 1e-12  # Avoid log(0).
+      candidate_logprobs = np.where(
+          valid,
+          logprobs[image_indices, beam_indices][:, np.newaxis] +
+          np.log(np.maximum(probs, 1e-12)), -np.inf)
+
+      # Scatter the candidates into a [num_images, beam_size * num_words]
+      # matrix; entry j * num_words + t extends beam j with its t-th word.
+      num_candidates = beam_size * num_words
+      flat_indices = (beam_indices[:, np.newaxis] * num_words +
+                      np.arange(num_words)[np.newaxis, :])
+      is_end = words == self.vocab.end_id
+      partial_scores = np.full([num_images, num_candidates], -np.inf)
+      partial_scores[image_indices[:, np.newaxis], flat_indices] = np.where(
+          is_end, -np.inf, candidate_logprobs)
+      end_logprobs = np.full([num_images, num_candidates], -np.inf)
+      end_logprobs[image_indices[:, np.newaxis], flat_indices] = np.where(
+          is_end, candidate_logprobs, -np.inf)
+      candidate_words = np.zeros([num_images, num_candidates], dtype=np.int64)
+      candidate_words[image_indices[:, np.newaxis], flat_indices] = words
+      candidate_rows = np.zeros([num_images, num_candidates], dtype=np.int64)
+      candidate_rows[image_indices[:, np.newaxis], flat_indices] = rows
+
+      # Captions ending with the end word compete for the complete captions.
+      end_scores = end_logprobs
+      if self.length_normalization_factor > 0:
+        end_scores = end_logprobs / length**self.length_normalization_factor
+      merged_scores = np.concatenate([complete_scores, end_scores], axis=1)
+      best = np.argsort(-merged_scores, axis=1, kind="mergesort")[:, :beam_size]
+      image_rows = np.arange(num_images)[:, np.newaxis]
+      # Gather each selected caption, either a previous complete caption or
+      # a new one built from its partial caption and end word.
+      from_new = best >= beam_size
+      kept = np.where(from_new, 0, best)
+      new = np.where(from_new, best - beam_size, 0)
+      new_beams = new // num_words
+      new_rows = candidate_rows[image_rows, new]
+      new_sentences = sentences[image_rows, new_beams]
+      new_sentences[:, :, length - 1] = candidate_words[image_rows, new]
+      new_metadata = metadata[image_rows, new_beams]
+      if step_metadata:
+        new_metadata[:, :, length - 1] = np.asarray(
+            step_metadata, dtype=object)[new_rows]
+      selected = from_new[..., np.newaxis]
+      complete_sentences = np.where(
+          selected, new_sentences, complete_sentences[image_rows, kept])
+      complete_metadata = np.where(
+          selected, new_metadata, complete_metadata[image_rows, kept])
+      complete_lengths = np.where(from_new, length,
+                                  complete_lengths[image_rows, kept])
+      complete_logprobs = np.where(from_new, end_logprobs[image_rows, new],
+                                   complete_logprobs[image_rows, kept])
+      complete_states = np.where(
+          from_new.reshape(from_new.shape + (1,) * len(state_shape)),
+          new_states[new_rows], complete_states[image_rows, kept])
+      complete_scores = merged_scores[image_rows, best]
+
+      # The best other extensions become the new partial captions.
+      best = np.argsort(-partial_scores, axis=1,
+                        kind="mergesort")[:, :beam_size]
+      alive = partial_scores[image_rows, best] > -np.inf
+      new_beams = best // num_words
+      new_rows = candidate_rows[image_rows, best]
+      sentences = sentences[image_rows, new_beams]
+      sentences[:, :, length - 1] = candidate_words[image_rows, best]
+      metadata = metadata[image_rows, new_beams]
+      if step_metadata:
+        metadata[:, :, length - 1] = np.asarray(
+            step_metadata, dtype=object)[new_rows]
+      states = new_states[new_rows]
+      logprobs = np.where(alive, partial_scores[image_rows, best], 0.0)
+      partial_length = length
 
     # If we have no complete captions then fall back to the partial captions.
     # But never output a mixture of complete and partial captions because a
     # partial caption could have a higher score than all the complete captions.
-    if not complete_captions.size():
-      complete_captions = partial_captions
-
-    return complete_captions.extract(sort=True)
+    # Metadata is only reported when the model returned some.
+    keep_metadata = has_metadata or partial_length == 1
+    results = []
+    for i in range(num_images):
+      captions = []
+      num_complete = np.sum(complete_scores[i] > -np.inf)
+      if num_complete:
+        for j in range(num_complete):
+          length = complete_lengths[i, j]
+          captions.append(Caption(
+              sentence=complete_sentences[i, j, :length].tolist(),
+              state=complete_states[i, j],
+              logprob=complete_logprobs[i, j],
+              score=complete_scores[i, j],
+              metadata=(complete_metadata[i, j, :length].tolist()
+                        if keep_metadata else None)))
+      else:
+        for j in np.nonzero(alive[i])[0]:
+          captions.append(Caption(
+              sentence=sentences[i, j, :partial_length].tolist(),
+              state=states[i, j],
+              logprob=logprobs[i, j],
+              score=logprobs[i, j],
+              metadata=(metadata[i, j, :partial_length].tolist()
+                        if keep_metadata else None)))
+      results.append(captions)
+    return results
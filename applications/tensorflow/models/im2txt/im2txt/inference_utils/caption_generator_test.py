@@ -173,6 +173,34 @@ class CaptionGeneratorTest(tf.test.TestCase):
     self._assertExpectedCaptions(
         expected, beam_size=4, length_normalization_factor=3)
 
+  def testBatchBeamSearch(self):
+    generator = caption_generator.CaptionGenerator(
+        model=FakeModel(), vocab=FakeVocab(), beam_size=4,
+        length_normalization_factor=3)
+    expected = generator.beam_search(sess=None, encoded_image=None)
+    batch_captions = generator.batch_beam_search(
+        sess=None, encoded_images=[None, None, None])
+
+    self.assertEqual(3, len(batch_captions))
+    for actual in batch_captions:
+      self.assertEqual([c.sentence for c in expected],
+                       [c.sentence for c in actual])
+      self.assertAllClose([c.score for c in expected],
+                          [c.score for c in actual])
+
+  def testBatchBeamSearchFromStates(self):
+    generator = caption_generator.CaptionGenerator(
+        model=FakeModel(), vocab=FakeVocab(), beam_size=3,
+        max_caption_length=2)
+    batch_captions = generator.batch_beam_search_from_states(
+        sess=None, initial_states=np.zeros([2, 1]))
+
+    # There are no complete sentences, so partial sentences are returned.
+    for actual in batch_captions:
+      self.assertEqual([[0, 4], [0, 3], [0, 2]], [c.sentence for c in actual])
+      self.assertAllClose([0.4, 0.3, 0.2],
+                          [math.exp(c.logprob) for c in actual])
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,155 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Long-lived captioning of encoded images with a cache of initial states."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import hashlib
+import math
+import time
+
+from im2txt.inference_utils import caption_generator
+
+
+def image_key(encoded_image):
+  """Returns the content hash identifying an encoded image."""
+  return hashlib.sha1(encoded_image).hexdigest()
+
+
+class InitialStateCache(object):
+  """Least recently used cache of the initial states returned by feed_image."""
+
+  def __init__(self, capacity=1000):
+    """Initializes the cache.
+
+    Args:
+      capacity: Maximum number of states kept in the cache.
+    """
+    self.capacity = capacity
+    self.hits = 0
+    self.misses = 0
+    self._states = collections.OrderedDict()
+
+  def size(self):
+    return len(self._states)
+
+  def get(self, key):
+    """Returns the state cached for key, or None."""
+    state = self._states.pop(key, None)
+    if state is None:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self._states[key] = state
+    return state
+
+  def put(self, key, state):
+    """Caches a state, evicting the least recently used one if full."""
+    self._states.pop(key, None)
+    if len(self._states) >= self.capacity:
+      self._states.popitem(last=False)
+    self._states[key] = state
+
+
+class CaptionService(object):
+  """Captions encoded images with a loaded image-to-text model.
+
+  Identical images are recognized by their content hash, and the initial model
+  state computed by feed_image() is kept in an InitialStateCache, so captioning
+  the same image again, e.g. with different beam search parameters, skips the
+  image model entirely and only runs the beam search.
+  """
+
+  def __init__(self, sess, model, vocab, cache_size=1000):
+    """Initializes the service.
+
+    Args:
+      sess: TensorFlow Session object with the model restored.
+      model: Object encapsulating a trained image-to-text model. Must have
+        methods feed_image() and inference_step().
+      vocab: A Vocabulary object.
+      cache_size: Maximum number of initial states kept in the cache.
+    """
+    self._sess = sess
+    self._model = model
+    self._vocab = vocab
+    self.cache = InitialStateCache(cache_size)
+    self.num_requests = 0
+    self.total_latency = 0.0
+
+  def initial_state(self, encoded_image):
+    """Returns the initial state of an image and whether it was cached."""
+    key = image_key(encoded_image)
+    state = self.cache.get(key)
+    if state is not None:
+      return state, True
+    state = self._model.feed_image(self._sess, encoded_image)
+    self.cache.put(key, state)
+    return state, False
+
+  def caption(self,
+              encoded_image,
+              beam_size=3,
+              max_caption_length=20,
+              length_normalization_factor=0.0):
+    """Generates captions for an encoded image.
+
+    Args:
+      encoded_image: An encoded image string.
+      beam_size: Beam size to use when generating captions.
+      max_caption_length: The maximum caption length before stopping the search.
+      length_normalization_factor: Length normalization factor of the caption
+        scores, see CaptionGenerator.
+
+    Returns:
+      A dict with the "captions", a list of dicts with the "sentence" and its
+      "probability" sorted by descending score, whether the initial state was
+      found in the cache ("cache_hit") and the request latency in milliseconds
+      ("latency_ms").
+    """
+    start_time = time.time()
+    state, cache_hit = self.initial_state(encoded_image)
+    generator = caption_generator.CaptionGenerator(
+        self._model,
+        self._vocab,
+        beam_size=beam_size,
+        max_caption_length=max_caption_length,
+        length_normalization_factor=length_normalization_factor)
+    captions = generator.batch_beam_search_from_states(self._sess, state)[0]
+
+    results = []
+    for caption in captions:
+      # Ignore begin and end words.
+      sentence = [self._vocab.id_to_word(w) for w in caption.sentence[1:-1]]
+      results.append({"sentence": " ".join(sentence),
+                      "probability": math.exp(caption.logprob)})
+    latency = time.time() - start_time
+    self.num_requests += 1
+    self.total_latency += latency
+    return {"captions": results,
+            "cache_hit": cache_hit,
+            "latency_ms": 1000.0 * latency}
+
+  def stats(self):
+    """Returns request, cache and mean latency statistics."""
+    return {"requests": self.num_requests,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "cache_size": self.cache.size(),
+            "mean_latency_ms": (1000.0 * self.total_latency /
+                                max(self.num_requests, 1))}
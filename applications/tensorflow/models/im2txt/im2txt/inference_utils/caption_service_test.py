@@ -0,0 +1,109 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for CaptionService."""
+
+
+
+import numpy as np
+import tensorflow as tf
+
+from im2txt.inference_utils import caption_service
+
+
+class FakeVocab(object):
+  """Fake Vocabulary for testing purposes."""
+
+  def __init__(self):
+    self.start_id = 0  # Word id denoting sentence start.
+    self.end_id = 1  # Word id denoting sentence end.
+
+  def id_to_word(self, word_id):
+    return "w%d" % word_id
+
+
+class FakeModel(object):
+  """Fake model whose captions only depend on the image, counting its calls."""
+
+  def __init__(self):
+    self.num_feed_image_calls = 0
+
+  # pylint: disable=unused-argument
+
+  def feed_image(self, sess, encoded_image):
+    # The state holds the first byte of the image, the next word.
+    self.num_feed_image_calls += 1
+    return np.array([[float(bytearray(encoded_image)[0])]])
+
+  def inference_step(self, sess, input_feed, state_feed):
+    # Predict the word held in the state, then the end word.
+    batch_size = input_feed.shape[0]
+    softmax_output = np.zeros([batch_size, 10])
+    for i in range(batch_size):
+      if input_feed[i] == 0:
+        softmax_output[i, int(state_feed[i, 0])] = 0.6
+        softmax_output[i, 1] = 0.4
+      else:
+        softmax_output[i, 1] = 1.0
+    return softmax_output, state_feed, None
+
+  # pylint: enable=unused-argument
+
+
+class InitialStateCacheTest(tf.test.TestCase):
+
+  def testLeastRecentlyUsedEviction(self):
+    cache = caption_service.InitialStateCache(capacity=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    self.assertEqual(1, cache.get("a"))
+    cache.put("c", 3)
+    self.assertEqual(None, cache.get("b"))
+    self.assertEqual(1, cache.get("a"))
+    self.assertEqual(3, cache.get("c"))
+    self.assertEqual(2, cache.size())
+    self.assertEqual(3, cache.hits)
+    self.assertEqual(1, cache.misses)
+
+
+class CaptionServiceTest(tf.test.TestCase):
+
+  def testCaption(self):
+    service = caption_service.CaptionService(None, FakeModel(), FakeVocab())
+    response = service.caption(b"\x05image", beam_size=2)
+
+    self.assertEqual(["w5", ""],
+                     [c["sentence"] for c in response["captions"]])
+    self.assertAllClose([0.6, 0.4],
+                        [c["probability"] for c in response["captions"]])
+    self.assertFalse(response["cache_hit"])
+    self.assertGreaterEqual(response["latency_ms"], 0.0)
+
+  def testIdenticalImagesSkipFeedImage(self):
+    model = FakeModel()
+    service = caption_service.CaptionService(None, model, FakeVocab())
+    service.caption(b"\x05image", beam_size=2)
+    response = service.caption(b"\x05image", beam_size=1)
+    service.caption(b"\x07image")
+
+    self.assertTrue(response["cache_hit"])
+    self.assertEqual(2, model.num_feed_image_calls)
+    stats = service.stats()
+    self.assertEqual(3, stats["requests"])
+    self.assertEqual(1, stats["cache_hits"])
+    self.assertEqual(2, stats["cache_size"])
+
+
+if __name__ == "__main__":
+  tf.test.main()
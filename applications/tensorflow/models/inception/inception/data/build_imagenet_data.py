@@ -87,12 +87,16 @@ from __future__ import division
 from __future__ import print_function
 
 from datetime import datetime
+import multiprocessing
 import os
 import random
+import struct
 import sys
 import threading
+import time
 
 import numpy as np
+from six.moves import queue
 import tensorflow as tf
 
 tf.app.flags.DEFINE_string('train_directory', '/tmp/',
@@ -109,6 +113,14 @@ tf.app.flags.DEFINE_integer('validation_shards', 128,
 
 tf.app.flags.DEFINE_integer('num_threads', 8,
                             'Number of threads to preprocess the images.')
+tf.app.flags.DEFINE_integer('num_processes', 0,
+                            'If positive, preprocess the images in this many '
+                            'processes instead of num_threads threads. Each '
+                            'process has its own ImageCoder and writes its '
+                            'own shards.')
+tf.app.flags.DEFINE_boolean('full_decode', False,
+                            'Fully decode every image to check it, instead of '
+                            'reading the dimensions from the JPEG header.')
 
 # The labels file contains a list of valid labels are held in this file.
 # Assumes that the file contains entries as such:
@@ -300,6 +312,56 @@ def _is_cmyk(filename):
   return filename.split('/')[-1] in blacklist
 
 
+# Start of frame markers, which precede the image dimensions. 0xC4 (DHT),
+# 0xC8 (JPG) and 0xCC (DAC) share the range but are not frames.
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - frozenset([0xC4, 0xC8, 0xCC])
+
+
+def _jpeg_dimensions(image_data):
+  """Reads the dimensions of a JPEG image from its frame header.
+
+  Only the markers up to the start of frame are parsed, the image itself is
+  not decoded.
+
+  Args:
+    image_data: string, JPEG encoded image.
+  Returns:
+    height: integer, image height in pixels.
+    width: integer, image width in pixels.
+    channels: integer, number of color components.
+  Raises:
+    ValueError: if image_data has no readable frame header.
+  """
+  if image_data[:2] != b'\xff\xd8':
+    raise ValueError('Not a JPEG image.')
+  pos = 2
+  while pos + 4 <= len(image_data):
+    prefix, marker = struct.unpack_from('>BB', image_data, pos)
+    if prefix != 0xFF:
+      raise ValueError('Invalid JPEG marker at byte %d.' % pos)
+    if marker == 0xFF:
+      # Fill byte.
+      pos += 1
+      continue
+    if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+      # Markers without a payload.
+      pos += 2
+      continue
+    if marker == 0xD9 or marker == 0xDA:
+      raise ValueError('No JPEG frame header before the image data.')
+    length, = struct.unpack_from('>H', image_data, pos + 2)
+    if marker in _JPEG_SOF_MARKERS:
+      if pos + 10 > len(image_data):
+        break
+      height, width, channels = struct.unpack_from('>HHB', image_data, pos + 5)
+      if not height or not width:
+        # The height may be defined later by a DNL marker.
+        raise ValueError('JPEG frame header without dimensions.')
+      return height, width, channels
+    pos += 2 + length
+  raise ValueError('Truncated JPEG header.')
+
+
 def _process_image(filename, coder):
   """Process a single image file.
 
@@ -325,6 +387,16 @@ def _process_image(filename, coder):
     print('Converting CMYK to RGB for %s' % filename)
     image_data = coder.cmyk_to_rgb(image_data)
 
+  # Grayscale and RGB JPEGs decode to RGB, so their header has the
+  # dimensions. Anything else goes through the decoder, which checks it.
+  if not FLAGS.full_decode:
+    try:
+      height, width, channels = _jpeg_dimensions(image_data)
+      if channels in (1, 3):
+        return image_data, height, width
+    except ValueError:
+      pass
+
   # Decode the RGB JPEG.
   image = coder.decode_jpeg(image_data)
 
@@ -342,7 +414,8 @@ def _process_image_files_batch(coder, thread_index, ranges, name, filenames,
   """Processes and saves list of images as TFRecord in 1 thread.
 
   Args:
-    coder: instance of ImageCoder to provide TensorFlow image coding utils.
+    coder: instance of ImageCoder to provide TensorFlow image coding utils,
+      or None to create one, e.g. in a worker process.
     thread_index: integer, unique batch to run index is within [0, len(ranges)).
     ranges: list of pairs of integers specifying ranges of each batches to
       analyze in parallel.
@@ -355,7 +428,14 @@ def _process_image_files_batch(coder, thread_index, ranges, name, filenames,
       list might contain from 0+ entries corresponding to the number of bounding
       box annotations for the image.
     num_shards: integer number of shards for this data set.
+  Returns:
+    counter: integer, number of images written.
+    duration: float, seconds spent processing images.
   """
+  if coder is None:
+    coder = ImageCoder()
+  start_time = time.time()
+
   # Each thread produces N shards where N = int(num_shards / num_threads).
   # For instance, if num_shards = 128, and the num_threads = 2, then the first
   # thread would produce shards [0, 64).
@@ -404,9 +484,52 @@ def _process_image_files_batch(coder, thread_index, ranges, name, filenames,
           (datetime.now(), thread_index, shard_counter, output_file))
     sys.stdout.flush()
     shard_counter = 0
-  print('%s [thread %d]: Wrote %d images to %d shards.' %
-        (datetime.now(), thread_index, counter, num_files_in_thread))
+  duration = time.time() - start_time
+  print('%s [thread %d]: Wrote %d images to %d shards, %.1f images/sec.' %
+        (datetime.now(), thread_index, counter, num_shards_per_batch,
+         counter / max(duration, 1e-6)))
   sys.stdout.flush()
+  return counter, duration
+
+
+def _run_image_files_batch(results, coder, thread_index, *args):
+  """Runs _process_image_files_batch and puts its statistics in results."""
+  counter, duration = _process_image_files_batch(coder, thread_index, *args)
+  results.put((thread_index, counter, duration))
+
+
+def _collect_worker_results(results, workers):
+  """Gathers the (index, counter, duration) of every worker.
+
+  Args:
+    results: queue the workers put their statistics in.
+    workers: list of threads or processes.
+  Returns:
+    list of (index, counter, duration) tuples, sorted by index.
+  Raises:
+    RuntimeError: if a worker process died before reporting.
+  """
+  stats = []
+  while len(stats) < len(workers):
+    try:
+      stats.append(results.get(timeout=1.0))
+    except queue.Empty:
+      if any(getattr(w, 'exitcode', None) for w in workers):
+        raise RuntimeError('A worker process failed, see the log above.')
+      if not any(w.is_alive() for w in workers):
+        raise RuntimeError('Workers exited without reporting.')
+  return sorted(stats)
+
+
+def _print_worker_rates(stats, duration):
+  """Prints the images/sec of every worker and of the whole data set."""
+  for index, counter, worker_duration in stats:
+    print('%s [worker %d]: %d images in %.1f sec, %.1f images/sec.' %
+          (datetime.now(), index, counter, worker_duration,
+           counter / max(worker_duration, 1e-6)))
+  total = sum(counter for _, counter, _ in stats)
+  print('%s: %d images in %.1f sec, %.1f images/sec overall.' %
+        (datetime.now(), total, duration, total / max(duration, 1e-6)))
 
 
 def _process_image_files(name, filenames, synsets, labels, humans,
@@ -430,32 +553,54 @@ def _process_image_files(name, filenames, synsets, labels, humans,
   assert len(filenames) == len(bboxes)
 
   # Break all images into batches with a [ranges[i][0], ranges[i][1]].
-  spacing = np.linspace(0, len(filenames), FLAGS.num_threads + 1).astype(np.int)
+  num_workers = FLAGS.num_processes or FLAGS.num_threads
+  spacing = np.linspace(0, len(filenames), num_workers + 1).astype(np.int)
   ranges = []
-  threads = []
   for i in range(len(spacing) - 1):
     ranges.append([spacing[i], spacing[i + 1]])
 
-  # Launch a thread for each batch.
-  print('Launching %d threads for spacings: %s' % (FLAGS.num_threads, ranges))
-  sys.stdout.flush()
-
-  # Create a mechanism for monitoring when all threads are finished.
-  coord = tf.train.Coordinator()
-
-  # Create a generic TensorFlow-based utility for converting all image codings.
-  coder = ImageCoder()
-
-  threads = []
-  for thread_index in range(len(ranges)):
-    args = (coder, thread_index, ranges, name, filenames,
-            synsets, labels, humans, bboxes, num_shards)
-    t = threading.Thread(target=_process_image_files_batch, args=args)
-    t.start()
-    threads.append(t)
+  start_time = time.time()
+  if FLAGS.num_processes:
+    # Every process creates its own ImageCoder, so the images are decoded
+    # without contention on a shared session or the GIL.
+    print('Launching %d processes for spacings: %s' % (num_workers, ranges))
+    sys.stdout.flush()
+    results = multiprocessing.Queue()
+    workers = []
+    for thread_index in range(len(ranges)):
+      args = (results, None, thread_index, ranges, name, filenames,
+              synsets, labels, humans, bboxes, num_shards)
+      p = multiprocessing.Process(target=_run_image_files_batch, args=args)
+      p.start()
+      workers.append(p)
+    stats = _collect_worker_results(results, workers)
+    for p in workers:
+      p.join()
+  else:
+    # Launch a thread for each batch.
+    print('Launching %d threads for spacings: %s' % (num_workers, ranges))
+    sys.stdout.flush()
 
-  # Wait for all the threads to terminate.
-  coord.join(threads)
+    # Create a mechanism for monitoring when all threads are finished.
+    coord = tf.train.Coordinator()
+
+    # Create a generic TensorFlow-based utility for converting all image
+    # codings.
+    coder = ImageCoder()
+
+    results = queue.Queue()
+    workers = []
+    for thread_index in range(len(ranges)):
+      args = (results, coder, thread_index, ranges, name, filenames,
+              synsets, labels, humans, bboxes, num_shards)
+      t = threading.Thread(target=_run_image_files_batch, args=args)
+      t.start()
+      workers.append(t)
+
+    # Wait for all the threads to terminate.
+    coord.join(workers)
+    stats = _collect_worker_results(results, workers)
+  _print_worker_rates(stats, time.time() - start_time)
   print('%s: Finished writing all %d images in data set.' %
         (datetime.now(), len(filenames)))
   sys.stdout.flush()
@@ -681,11 +826,13 @@ def _build_bounding_box_lookup(bounding_box_file):
 
 
 def main(unused_argv):
-  assert not FLAGS.train_shards % FLAGS.num_threads, (
-      'Please make the FLAGS.num_threads commensurate with FLAGS.train_shards')
-  assert not FLAGS.validation_shards % FLAGS.num_threads, (
-      'Please make the FLAGS.num_threads commensurate with '
-      'FLAGS.validation_shards')
+  num_workers = FLAGS.num_processes or FLAGS.num_threads
+  assert not FLAGS.train_shards % num_workers, (
+      'Please make the FLAGS.num_threads (or FLAGS.num_processes) '
+      'commensurate with FLAGS.train_shards')
+  assert not FLAGS.validation_shards % num_workers, (
+      'Please make the FLAGS.num_threads (or FLAGS.num_processes) '
+      'commensurate with FLAGS.validation_shards')
   print('Saving results to %s' % FLAGS.output_directory)
 
   # Build a map from synset to human-readable label.
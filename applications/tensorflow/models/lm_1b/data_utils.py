@@ -15,9 +15,13 @@
 
 """A library for loading 1B word benchmark dataset."""
 
+import hashlib
+import multiprocessing
+import os
 import random
 
 import numpy as np
+from six.moves import xrange
 import tensorflow as tf
 
 
@@ -160,6 +164,73 @@ class CharsVocabulary(Vocabulary):
                  for cur_word in sentence.split()]
     return np.vstack([self.bos_chars] + chars_ids + [self.eos_chars])
 
+  def fingerprint(self):
+    """Hash of everything encode_sentences depends on, to validate caches."""
+    h = hashlib.md5()
+    h.update(('%d %d %d %d\n' % (self.max_word_length, self.bos, self.eos,
+                                  self.unk)).encode('utf-8'))
+    for word in self._id_to_word:
+      h.update(word.encode('utf-8') if not isinstance(word, bytes) else word)
+      h.update(b'\n')
+    return h.hexdigest()
+
+  def encode_sentences(self, sentences):
+    """Encodes many sentences into flat arrays.
+
+    Only the ids are stored per word: the char ids of in-vocabulary words are
+    rows of word_char_ids, so char ids are kept just for the out of
+    vocabulary words.
+
+    Args:
+      sentences: list of sentences.
+
+    Returns:
+      dict with 'ids', the concatenated encode() of all sentences, 'offsets',
+      the start of every sentence in ids followed by len(ids), and
+      'oov_positions' and 'oov_chars', the positions in ids of the out of
+      vocabulary words and their char ids.
+    """
+    ids = []
+    offsets = [0]
+    oov_positions = []
+    oov_chars = []
+    for sentence in sentences:
+      ids.append(self.bos)
+      for word in sentence.split():
+        word_id = self._word_to_id.get(word)
+        if word_id is None:
+          oov_positions.append(len(ids))
+          oov_chars.append(self._convert_word_to_char_ids(word))
+          word_id = self.unk
+        ids.append(word_id)
+      ids.append(self.eos)
+      offsets.append(len(ids))
+    return {
+        'ids': np.array(ids, dtype=np.int32),
+        'offsets': np.array(offsets, dtype=np.int64),
+        'oov_positions': np.array(oov_positions, dtype=np.int64),
+        'oov_chars': np.array(oov_chars, dtype=np.int32).reshape(
+            [-1, self.max_word_length]),
+    }
+
+  def decode_sentences(self, encoded):
+    """Yields the (ids, char_ids) of every sentence of encode_sentences()."""
+    ids = encoded['ids']
+    offsets = encoded['offsets']
+    oov_positions = encoded['oov_positions']
+    oov_chars = encoded['oov_chars']
+    oov_offsets = np.searchsorted(oov_positions, offsets)
+    for i in xrange(len(offsets) - 1):
+      start, end = offsets[i], offsets[i + 1]
+      word_ids = ids[start:end]
+      chars_ids = self._word_char_ids[word_ids]
+      chars_ids[0] = self.bos_chars
+      chars_ids[-1] = self.eos_chars
+      oov_start, oov_end = oov_offsets[i], oov_offsets[i + 1]
+      chars_ids[oov_positions[oov_start:oov_end] - start] = (
+          oov_chars[oov_start:oov_end])
+      yield word_ids, chars_ids
+
 
 def get_batch(generator, batch_size, num_steps, max_word_length, pad=False):
   """Read batches of input."""
@@ -214,26 +285,118 @@ def get_batch(generator, batch_size, num_steps, max_word_length, pad=False):
     yield inputs, char_inputs, global_word_ids, targets, weights
 
 
+def _encoded_shard_filename(cache_dir, shard_name):
+  return os.path.join(cache_dir, os.path.basename(shard_name) + '.ids.npz')
+
+
+def load_encoded_shard(vocab, shard_name, cache_dir=None, fingerprint=None):
+  """Reads one file and encodes it with vocab.encode_sentences.
+
+  With a cache_dir, the encoded shard is saved there as a numpy file and read
+  back on later calls, as long as neither the shard nor the vocabulary
+  changed.
+
+  Args:
+    vocab: CharsVocabulary.
+    shard_name: file path.
+    cache_dir: directory for encoded shards, or None.
+    fingerprint: vocab.fingerprint(), computed if None.
+
+  Returns:
+    dict of numpy arrays, see CharsVocabulary.encode_sentences.
+  """
+  if cache_dir:
+    stat = tf.gfile.Stat(shard_name)
+    key = np.array([stat.length, stat.mtime_nsec], dtype=np.int64)
+    fingerprint = fingerprint or vocab.fingerprint()
+    cache_filename = _encoded_shard_filename(cache_dir, shard_name)
+    if os.path.exists(cache_filename):
+      with np.load(cache_filename) as cached:
+        if (str(cached['fingerprint']) == fingerprint and
+            np.array_equal(cached['key'], key)):
+          tf.logging.info('Loading cached data from: %s', cache_filename)
+          return dict((name, cached[name]) for name in
+                      ('ids', 'offsets', 'oov_positions', 'oov_chars'))
+
+  tf.logging.info('Loading data from: %s', shard_name)
+  with tf.gfile.Open(shard_name) as f:
+    sentences = f.readlines()
+  encoded = vocab.encode_sentences(sentences)
+
+  if cache_dir:
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+    # Write to a temporary file first so that readers never see a partial
+    # cache, e.g. from several evaluations sharing the cache_dir.
+    tmp_filename = '%s.tmp%d.npz' % (cache_filename, os.getpid())
+    np.savez(tmp_filename, fingerprint=np.array(fingerprint), key=key,
+             **encoded)
+    os.rename(tmp_filename, cache_filename)
+  return encoded
+
+
+# The vocabulary of a prefetch process, set once by _init_prefetch_process so
+# that it is not sent along with every shard.
+_prefetch_vocab = None
+
+
+def _init_prefetch_process(vocab):
+  global _prefetch_vocab
+  _prefetch_vocab = vocab
+
+
+def _prefetch_encoded_shard(shard_name, cache_dir, fingerprint):
+  return load_encoded_shard(_prefetch_vocab, shard_name, cache_dir,
+                            fingerprint)
+
+
 class LM1BDataset(object):
   """Utility class for 1B word benchmark dataset.
 
   The current implementation reads the data from the tokenized text files.
   """
 
-  def __init__(self, filepattern, vocab):
+  def __init__(self, filepattern, vocab, cache_dir=None, prefetch=True):
     """Initialize LM1BDataset reader.
 
     Args:
       filepattern: Dataset file pattern.
       vocab: Vocabulary.
+      cache_dir: If set, encoded shards are cached in this directory so that
+        later epochs and runs skip tokenization.
+      prefetch: Load and encode the next shard in a separate process while
+        the current one is consumed.
     """
     self._vocab = vocab
     self._all_shards = tf.gfile.Glob(filepattern)
     tf.logging.info('Found %d shards at %s', len(self._all_shards), filepattern)
+    self._cache_dir = cache_dir
+    self._fingerprint = vocab.fingerprint() if cache_dir else None
+    self._pool = None
+    if prefetch:
+      # Start the process now, before any session creates threads that a
+      # later fork would not carry over.
+      self._pool = multiprocessing.Pool(1, _init_prefetch_process, (vocab,))
+
+  def close(self):
+    """Stops the prefetch process."""
+    if self._pool is not None:
+      self._pool.terminate()
+      self._pool = None
+
+  def _load_random_shard_async(self):
+    """Randomly selects a file and starts reading it.
 
-  def _load_random_shard(self):
-    """Randomly select a file and read it."""
-    return self._load_shard(random.choice(self._all_shards))
+    Returns:
+      a function returning the encoded shard, see load_encoded_shard.
+    """
+    shard_name = random.choice(self._all_shards)
+    if self._pool is None:
+      encoded = self._load_shard(shard_name)
+      return lambda: encoded
+    return self._pool.apply_async(
+        _prefetch_encoded_shard,
+        (shard_name, self._cache_dir, self._fingerprint)).get
 
   def _load_shard(self, shard_name):
     """Read one file and convert to ids.
@@ -242,30 +405,30 @@ class LM1BDataset(object):
       shard_name: file path.
 
     Returns:
-      list of (id, char_id, global_word_id) tuples.
+      dict of numpy arrays, see CharsVocabulary.encode_sentences.
     """
-    tf.logging.info('Loading data from: %s', shard_name)
-    with tf.gfile.Open(shard_name) as f:
-      sentences = f.readlines()
-    chars_ids = [self.vocab.encode_chars(sentence) for sentence in sentences]
-    ids = [self.vocab.encode(sentence) for sentence in sentences]
+    return load_encoded_shard(self.vocab, shard_name, self._cache_dir,
+                              self._fingerprint)
 
-    global_word_ids = []
+  def _shard_sentences(self, encoded):
+    """Yields the (id, char_id, global_word_id) tuples of an encoded shard."""
+    num_words = len(encoded['ids']) - (len(encoded['offsets']) - 1)
+    tf.logging.info('Loaded %d words.', num_words)
+    tf.logging.info('Finished loading')
     current_idx = 0
-    for word_ids in ids:
+    for word_ids, chars_ids in self.vocab.decode_sentences(encoded):
       current_size = len(word_ids) - 1  # without <BOS> symbol
-      cur_ids = np.arange(current_idx, current_idx + current_size)
-      global_word_ids.append(cur_ids)
+      global_word_ids = np.arange(current_idx, current_idx + current_size)
       current_idx += current_size
-
-    tf.logging.info('Loaded %d words.', current_idx)
-    tf.logging.info('Finished loading')
-    return zip(ids, chars_ids, global_word_ids)
+      yield word_ids, chars_ids, global_word_ids
 
   def _get_sentence(self, forever=True):
+    next_shard = self._load_random_shard_async()
     while True:
-      ids = self._load_random_shard()
-      for current_ids in ids:
+      encoded = next_shard()
+      if forever:
+        next_shard = self._load_random_shard_async()
+      for current_ids in self._shard_sentences(encoded):
         yield current_ids
       if not forever:
         break
@@ -19,22 +19,28 @@ Example usage:
     ./create_pascal_tf_record --data_dir=/home/user/VOCdevkit \
         --year=VOC2012 \
         --output_path=/home/user/pascal.record
+
+Large annotation sets can be converted in parallel into several shards, e.g.
+with --num_shards=16 --num_workers=8. The output does not depend on the
+number of workers.
 """
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
 import hashlib
 import io
+import json
 import logging
 import os
 
-from lxml import etree
 import PIL.Image
 import tensorflow as tf
 
 from object_detection.utils import dataset_util
 from object_detection.utils import label_map_util
+from object_detection.utils import tf_record_creation_util
 
 
 flags = tf.app.flags
@@ -49,6 +55,11 @@ flags.DEFINE_string('label_map_path', 'data/pascal_label_map.pbtxt',
                     'Path to label map proto')
 flags.DEFINE_boolean('ignore_difficult_instances', False, 'Whether to ignore '
                      'difficult instances')
+flags.DEFINE_integer('num_shards', 1, 'Number of output shards. With more than '
+                     'one, they are named <output_path>-00000-of-<num_shards>.')
+flags.DEFINE_integer('num_workers', 0, 'Number of worker processes that parse '
+                     'annotations and write shards. 0 converts everything in '
+                     'the main process.')
 FLAGS = flags.FLAGS
 
 SETS = ['train', 'val', 'trainval', 'test']
@@ -81,8 +92,7 @@ def dict_to_tf_example(data,
   Raises:
     ValueError: if the image pointed to by data['filename'] is not a valid JPEG
   """
-  img_path = os.path.join(data['folder'], image_subdirectory, data['filename'])
-  full_path = os.path.join(dataset_directory, img_path)
+  full_path = _image_path(dataset_directory, data, image_subdirectory)
   with tf.gfile.GFile(full_path) as fid:
     encoded_jpg = fid.read()
   encoded_jpg_io = io.BytesIO(encoded_jpg)
@@ -140,6 +150,11 @@ def dict_to_tf_example(data,
   return example
 
 
+def _image_path(dataset_directory, data, image_subdirectory='JPEGImages'):
+  return os.path.join(dataset_directory, data['folder'], image_subdirectory,
+                      data['filename'])
+
+
 def main(_):
   if FLAGS.set not in SETS:
     raise ValueError('set must be in : {}'.format(SETS))
@@ -151,30 +166,30 @@ def main(_):
   if FLAGS.year != 'merged':
     years = [FLAGS.year]
 
-  writer = tf.python_io.TFRecordWriter(FLAGS.output_path)
-
   label_map_dict = label_map_util.get_label_map_dict(FLAGS.label_map_path)
 
+  annotation_paths = []
   for year in years:
     logging.info('Reading from PASCAL %s dataset.', year)
     examples_path = os.path.join(data_dir, year, 'ImageSets', 'Main',
                                  'aeroplane_' + FLAGS.set + '.txt')
     annotations_dir = os.path.join(data_dir, year, FLAGS.annotations_dir)
     examples_list = dataset_util.read_examples_list(examples_path)
-    for idx, example in enumerate(examples_list):
-      if idx % 100 == 0:
-        logging.info('On image %d of %d', idx, len(examples_list))
-      path = os.path.join(annotations_dir, example + '.xml')
-      with tf.gfile.GFile(path, 'r') as fid:
-        xml_str = fid.read()
-      xml = etree.fromstring(xml_str)
-      data = dataset_util.recursive_parse_xml_to_dict(xml)['annotation']
-
-      tf_example = dict_to_tf_example(data, FLAGS.data_dir, label_map_dict,
-                                      FLAGS.ignore_difficult_instances)
-      writer.write(tf_example.SerializeToString())
-
-  writer.close()
+    annotation_paths.extend(os.path.join(annotations_dir, example + '.xml')
+                            for example in examples_list)
+  annotations = tf_record_creation_util.read_annotations(annotation_paths,
+                                                         FLAGS.num_workers)
+
+  create_tf_example = functools.partial(
+      dict_to_tf_example, dataset_directory=data_dir,
+      label_map_dict=label_map_dict,
+      ignore_difficult_instances=FLAGS.ignore_difficult_instances)
+  image_path_fn = functools.partial(_image_path, data_dir)
+  config = json.dumps([sorted(label_map_dict.items()),
+                       FLAGS.ignore_difficult_instances])
+  tf_record_creation_util.write_sharded_tf_records(
+      FLAGS.output_path, annotations, create_tf_example, image_path_fn,
+      config, FLAGS.num_shards, FLAGS.num_workers)
 
 
 if __name__ == '__main__':
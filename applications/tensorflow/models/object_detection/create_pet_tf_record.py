@@ -25,25 +25,33 @@ Example usage:
         --output_dir=/home/user/pet/output
 """
 
+import functools
 import hashlib
 import io
+import json
 import logging
 import os
 import random
 import re
 
-from lxml import etree
 import PIL.Image
 import tensorflow as tf
 
 from object_detection.utils import dataset_util
 from object_detection.utils import label_map_util
+from object_detection.utils import tf_record_creation_util
 
 flags = tf.app.flags
 flags.DEFINE_string('data_dir', '', 'Root directory to raw pet dataset.')
 flags.DEFINE_string('output_dir', '', 'Path to directory to output TFRecords.')
 flags.DEFINE_string('label_map_path', 'data/pet_label_map.pbtxt',
                     'Path to label map proto')
+flags.DEFINE_integer('num_shards', 1, 'Number of shards of each output. With '
+                     'more than one, they are named '
+                     'pet_train.record-00000-of-<num_shards> and so on.')
+flags.DEFINE_integer('num_workers', 0, 'Number of worker processes that parse '
+                     'annotations and write shards. 0 converts everything in '
+                     'the main process.')
 FLAGS = flags.FLAGS
 
 
@@ -148,7 +156,9 @@ def create_tf_record(output_filename,
                      label_map_dict,
                      annotations_dir,
                      image_dir,
-                     examples):
+                     examples,
+                     num_shards=1,
+                     num_workers=0):
   """Creates a TFRecord file from examples.
 
   Args:
@@ -157,25 +167,28 @@ def create_tf_record(output_filename,
     annotations_dir: Directory where annotation files are stored.
     image_dir: Directory where image files are stored.
     examples: Examples to parse and save to tf record.
+    num_shards: Number of output shards. With more than one, they are named
+      output_filename-00000-of-<num_shards> and so on.
+    num_workers: Number of worker processes that parse annotations and write
+      shards. With 0 everything is converted in the calling process.
   """
-  writer = tf.python_io.TFRecordWriter(output_filename)
-  for idx, example in enumerate(examples):
-    if idx % 100 == 0:
-      logging.info('On image %d of %d', idx, len(examples))
+  paths = []
+  for example in examples:
     path = os.path.join(annotations_dir, 'xmls', example + '.xml')
-
     if not os.path.exists(path):
       logging.warning('Could not find %s, ignoring example.', path)
       continue
-    with tf.gfile.GFile(path, 'r') as fid:
-      xml_str = fid.read()
-    xml = etree.fromstring(xml_str)
-    data = dataset_util.recursive_parse_xml_to_dict(xml)['annotation']
-
-    tf_example = dict_to_tf_example(data, label_map_dict, image_dir)
-    writer.write(tf_example.SerializeToString())
+    paths.append(path)
+  annotations = tf_record_creation_util.read_annotations(paths, num_workers)
 
-  writer.close()
+  create_tf_example = functools.partial(
+      dict_to_tf_example, label_map_dict=label_map_dict,
+      image_subdirectory=image_dir)
+  image_path_fn = lambda data: os.path.join(image_dir, data['filename'])
+  config = json.dumps(sorted(label_map_dict.items()))
+  tf_record_creation_util.write_sharded_tf_records(
+      output_filename, annotations, create_tf_example, image_path_fn, config,
+      num_shards, num_workers)
 
 
 # TODO: Add test for pet/PASCAL main files.
@@ -203,9 +216,11 @@ def main(_):
   train_output_path = os.path.join(FLAGS.output_dir, 'pet_train.record')
   val_output_path = os.path.join(FLAGS.output_dir, 'pet_val.record')
   create_tf_record(train_output_path, label_map_dict, annotations_dir,
-                   image_dir, train_examples)
+                   image_dir, train_examples, FLAGS.num_shards,
+                   FLAGS.num_workers)
   create_tf_record(val_output_path, label_map_dict, annotations_dir,
-                   image_dir, val_examples)
+                   image_dir, val_examples, FLAGS.num_shards,
+                   FLAGS.num_workers)
 
 if __name__ == '__main__':
   tf.app.run()
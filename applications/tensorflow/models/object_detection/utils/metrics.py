@@ -13,7 +13,13 @@
 # limitations under the License.
 # ==============================================================================
 
-"""Functions for computing metrics like precision, recall, CorLoc and etc."""
+"""Functions for computing metrics like precision, recall, CorLoc and etc.
+
+Precision, recall and average precision can also be computed in a streaming
+fashion from fixed-size histograms of true/false positive counts over score
+bins (see StreamingPrecisionRecall), which keeps memory constant regardless of
+the number of detections.
+"""
 from __future__ import division
 
 import numpy as np
@@ -142,3 +148,232 @@ def compute_cor_loc(num_gt_imgs_per_class,
       num_gt_imgs_per_class == 0,
       np.nan,
       num_images_correctly_detected_per_class / num_gt_imgs_per_class)
+
+
+def compute_score_histogram(scores, labels, num_bins, min_score=0.0,
+                            max_score=1.0):
+  """Counts true and false positives in uniform score bins.
+
+  Args:
+    scores: A float numpy array representing detection score
+    labels: A boolean numpy array representing true/false positive labels
+    num_bins: Number of bins dividing [min_score, max_score]. Scores outside
+      the range are counted in the first or last bin.
+    min_score: Lower end of the score range.
+    max_score: Upper end of the score range.
+
+  Raises:
+    ValueError: if the input is not of the correct format
+
+  Returns:
+    tp_counts: An int numpy array of shape [num_bins] with the number of true
+      positives per bin, in increasing score order.
+    fp_counts: An int numpy array of shape [num_bins] with the number of false
+      positives per bin.
+  """
+  if num_bins <= 0:
+    raise ValueError("num_bins must be positive.")
+  if max_score <= min_score:
+    raise ValueError("max_score must be larger than min_score.")
+  if len(scores) != len(labels):
+    raise ValueError("scores and labels must be of the same size.")
+  bins = np.floor((np.asarray(scores, dtype=float) - min_score) * (
+      num_bins / (max_score - min_score))).astype(np.int64)
+  bins = np.clip(bins, 0, num_bins - 1)
+  labels = np.asarray(labels, dtype=bool)
+  tp_counts = np.bincount(bins[labels], minlength=num_bins)
+  fp_counts = np.bincount(bins[~labels], minlength=num_bins)
+  return tp_counts, fp_counts
+
+
+def compute_precision_recall_from_histogram(tp_counts, fp_counts, num_gt):
+  """Compute precision and recall at every score bin threshold.
+
+  Args:
+    tp_counts: An int numpy array of true positive counts per score bin, in
+      increasing score order.
+    fp_counts: An int numpy array of false positive counts per score bin.
+    num_gt: Number of ground truth instances
+
+  Returns:
+    precision: Precision when keeping the detections of the highest scoring
+      bins, one value per non-empty bin in decreasing score order. None if no
+      ground truth labels are present.
+    recall: The corresponding recall. None if no ground truth labels are
+      present.
+  """
+  if num_gt == 0:
+    return None, None
+  tp_counts = tp_counts[::-1]
+  fp_counts = fp_counts[::-1]
+  is_non_empty = (tp_counts + fp_counts) > 0
+  cum_true_positives = np.cumsum(tp_counts)[is_non_empty]
+  cum_detections = np.cumsum(tp_counts + fp_counts)[is_non_empty]
+  precision = cum_true_positives.astype(float) / cum_detections
+  recall = cum_true_positives.astype(float) / num_gt
+  return precision, recall
+
+
+def compute_average_precision_from_histogram(tp_counts, fp_counts, num_gt):
+  """Approximates Average Precision from score histograms with an error bound.
+
+  The histogram does not record the order of detections within a bin. The
+  VOCdevkit average precision of any ordering consistent with the bins lies
+  between the value obtained by ranking every bin's false positives before its
+  true positives (lower bound) and the value obtained by ranking them after its
+  true positives (upper bound), since moving a true positive ahead of a false
+  positive can only increase the interpolated precision. The midpoint of the
+  two bounds is returned, so the exact average precision differs from it by at
+  most half their difference. The bound shrinks as bins get finer and is zero
+  when no bin mixes true and false positives.
+
+  Args:
+    tp_counts: An int numpy array of true positive counts per score bin, in
+      increasing score order.
+    fp_counts: An int numpy array of false positive counts per score bin.
+    num_gt: Number of ground truth instances
+
+  Raises:
+    ValueError: if there are more true positives than ground truth instances.
+
+  Returns:
+    average_precision: The approximate area under the precision recall curve.
+      NaN if there are no ground truth instances.
+    error_bound: Upper bound on the absolute difference between
+      average_precision and the exact average precision.
+  """
+  if num_gt < np.sum(tp_counts):
+    raise ValueError("Number of true positives must be smaller than num_gt.")
+  if num_gt == 0:
+    return np.nan, 0.0
+  tp_counts = tp_counts[::-1].astype(float)
+  fp_counts = fp_counts[::-1].astype(float)
+  cum_true_positives = np.cumsum(tp_counts)
+  cum_detections = np.cumsum(tp_counts + fp_counts)
+  has_true_positives = tp_counts > 0
+  # Precision right after the last true positive of every bin. Within a run of
+  # true positives precision does not decrease, so the interpolated precision
+  # of each of them is the maximum of these values over the bin and later bins.
+  best_precision = np.where(
+      has_true_positives,
+      cum_true_positives / np.maximum(cum_detections - fp_counts, 1.0), 0.0)
+  worst_precision = np.where(
+      has_true_positives,
+      cum_true_positives / np.maximum(cum_detections, 1.0), 0.0)
+  upper = np.sum(tp_counts * np.maximum.accumulate(
+      best_precision[::-1])[::-1]) / num_gt
+  lower = np.sum(tp_counts * np.maximum.accumulate(
+      worst_precision[::-1])[::-1]) / num_gt
+  return (upper + lower) / 2.0, (upper - lower) / 2.0
+
+
+class StreamingPrecisionRecall(object):
+  """Accumulates per-class true/false positive counts in score histograms.
+
+  Memory is O(num_classes * num_bins) regardless of the number of added
+  detections. While a class has seen at most max_exact_detections detections,
+  its raw scores and labels are also kept, and average precision is computed
+  exactly with compute_precision_recall and compute_average_precision.
+  """
+
+  def __init__(self, num_classes, num_bins=1000, min_score=0.0, max_score=1.0,
+               max_exact_detections=10000):
+    """Constructor.
+
+    Args:
+      num_classes: Number of object classes.
+      num_bins: Number of score bins per class.
+      min_score: Lower end of the score range.
+      max_score: Upper end of the score range.
+      max_exact_detections: Number of detections per class up to which the
+        raw scores are kept for exact evaluation. 0 disables exact mode.
+    """
+    self.num_classes = num_classes
+    self.num_bins = num_bins
+    self.min_score = min_score
+    self.max_score = max_score
+    self.max_exact_detections = max_exact_detections
+    self.tp_counts = np.zeros([num_classes, num_bins], dtype=np.int64)
+    self.fp_counts = np.zeros([num_classes, num_bins], dtype=np.int64)
+    self.num_gt_per_class = np.zeros(num_classes, dtype=np.int64)
+    self._exact_scores = [[] for _ in range(num_classes)]
+    self._exact_labels = [[] for _ in range(num_classes)]
+    self._num_detections = np.zeros(num_classes, dtype=np.int64)
+
+  def add_groundtruth(self, num_gt_per_class):
+    """Adds ground truth instance counts.
+
+    Args:
+      num_gt_per_class: An int numpy array of shape [num_classes].
+    """
+    self.num_gt_per_class += num_gt_per_class
+
+  def add_detections(self, class_index, scores, labels):
+    """Adds scored true/false positive detections of one class.
+
+    Args:
+      class_index: The class of the detections.
+      scores: A float numpy array representing detection score
+      labels: A boolean numpy array representing true/false positive labels
+    """
+    tp_counts, fp_counts = compute_score_histogram(
+        scores, labels, self.num_bins, self.min_score, self.max_score)
+    self.tp_counts[class_index] += tp_counts
+    self.fp_counts[class_index] += fp_counts
+    self._num_detections[class_index] += len(scores)
+    if self.is_exact(class_index):
+      self._exact_scores[class_index].append(np.asarray(scores, dtype=float))
+      self._exact_labels[class_index].append(np.asarray(labels, dtype=bool))
+    else:
+      self._exact_scores[class_index] = []
+      self._exact_labels[class_index] = []
+
+  def is_exact(self, class_index):
+    """Returns whether the raw detections of a class are still kept."""
+    return self._num_detections[class_index] <= self.max_exact_detections
+
+  def compute_precision_recall(self, class_index):
+    """Compute precision and recall of a class.
+
+    Args:
+      class_index: The class to evaluate.
+
+    Returns:
+      precision: see compute_precision_recall, or
+        compute_precision_recall_from_histogram if the class is not exact.
+      recall: The corresponding recall.
+    """
+    num_gt = self.num_gt_per_class[class_index]
+    if self.is_exact(class_index):
+      scores, labels = self._get_exact_detections(class_index)
+      return compute_precision_recall(scores, labels, num_gt)
+    return compute_precision_recall_from_histogram(
+        self.tp_counts[class_index], self.fp_counts[class_index], num_gt)
+
+  def compute_average_precision(self, class_index):
+    """Compute Average Precision of a class.
+
+    Args:
+      class_index: The class to evaluate.
+
+    Returns:
+      average_precision: The exact average precision if the class is exact,
+        otherwise the histogram approximation.
+      error_bound: Bound on the absolute error of average_precision, 0 for
+        exact classes.
+    """
+    if self.is_exact(class_index):
+      precision, recall = self.compute_precision_recall(class_index)
+      return compute_average_precision(precision, recall), 0.0
+    return compute_average_precision_from_histogram(
+        self.tp_counts[class_index], self.fp_counts[class_index],
+        self.num_gt_per_class[class_index])
+
+  def _get_exact_detections(self, class_index):
+    if not self._exact_scores[class_index]:
+      return np.array([], dtype=float), np.array([], dtype=bool)
+    scores = np.concatenate(self._exact_scores[class_index])
+    labels = np.concatenate(self._exact_labels[class_index])
+    self._exact_scores[class_index] = [scores]
+    self._exact_labels[class_index] = [labels]
+    return scores, labels
@@ -75,5 +75,80 @@ class MetricsTest(tf.test.TestCase):
     self.assertTrue(np.isnan(ap))
 
 
+class StreamingMetricsTest(tf.test.TestCase):
+
+  def setUp(self):
+    self.num_gt = 10
+    self.scores = np.array([0.4, 0.3, 0.6, 0.2, 0.7, 0.1, 0.65], dtype=float)
+    self.labels = np.array([0, 1, 1, 0, 0, 1, 0], dtype=bool)
+
+  def test_compute_score_histogram(self):
+    tp_counts, fp_counts = metrics.compute_score_histogram(
+        np.array([-1.0, 0.05, 0.3, 0.35, 0.99, 2.0]),
+        np.array([1, 0, 1, 1, 0, 1], dtype=bool), num_bins=4)
+    self.assertAllEqual(tp_counts, [1, 2, 0, 1])
+    self.assertAllEqual(fp_counts, [1, 0, 0, 1])
+
+  def test_histogram_with_separated_scores_is_exact(self):
+    precision, recall = metrics.compute_precision_recall(
+        self.scores, self.labels, self.num_gt)
+    expected_ap = metrics.compute_average_precision(precision, recall)
+    tp_counts, fp_counts = metrics.compute_score_histogram(
+        self.scores, self.labels, num_bins=100)
+    ap, error_bound = metrics.compute_average_precision_from_histogram(
+        tp_counts, fp_counts, self.num_gt)
+    self.assertAlmostEqual(expected_ap, ap)
+    self.assertAlmostEqual(0.0, error_bound)
+    precision_from_histogram, recall_from_histogram = (
+        metrics.compute_precision_recall_from_histogram(
+            tp_counts, fp_counts, self.num_gt))
+    self.assertAllClose(precision, precision_from_histogram)
+    self.assertAllClose(recall, recall_from_histogram)
+
+  def test_coarse_histogram_bounds_exact_ap(self):
+    precision, recall = metrics.compute_precision_recall(
+        self.scores, self.labels, self.num_gt)
+    expected_ap = metrics.compute_average_precision(precision, recall)
+    tp_counts, fp_counts = metrics.compute_score_histogram(
+        self.scores, self.labels, num_bins=2)
+    ap, error_bound = metrics.compute_average_precision_from_histogram(
+        tp_counts, fp_counts, self.num_gt)
+    self.assertGreater(error_bound, 0.0)
+    self.assertLessEqual(abs(ap - expected_ap), error_bound)
+
+  def test_histogram_ap_no_groundtruth(self):
+    ap, error_bound = metrics.compute_average_precision_from_histogram(
+        np.zeros(3, dtype=int), np.ones(3, dtype=int), 0)
+    self.assertTrue(np.isnan(ap))
+    self.assertEqual(0.0, error_bound)
+
+  def test_streaming_precision_recall_exact_mode(self):
+    streaming = metrics.StreamingPrecisionRecall(
+        2, num_bins=2, max_exact_detections=100)
+    streaming.add_groundtruth(np.array([self.num_gt, 0]))
+    streaming.add_detections(0, self.scores[:3], self.labels[:3])
+    streaming.add_detections(0, self.scores[3:], self.labels[3:])
+    precision, recall = metrics.compute_precision_recall(
+        self.scores, self.labels, self.num_gt)
+    self.assertTrue(streaming.is_exact(0))
+    ap, error_bound = streaming.compute_average_precision(0)
+    self.assertAlmostEqual(
+        metrics.compute_average_precision(precision, recall), ap)
+    self.assertEqual(0.0, error_bound)
+    self.assertTrue(np.isnan(streaming.compute_average_precision(1)[0]))
+
+  def test_streaming_precision_recall_histogram_mode(self):
+    streaming = metrics.StreamingPrecisionRecall(
+        1, num_bins=2, max_exact_detections=5)
+    streaming.add_groundtruth(np.array([self.num_gt]))
+    streaming.add_detections(0, self.scores, self.labels)
+    self.assertFalse(streaming.is_exact(0))
+    tp_counts, fp_counts = metrics.compute_score_histogram(
+        self.scores, self.labels, num_bins=2)
+    expected = metrics.compute_average_precision_from_histogram(
+        tp_counts, fp_counts, self.num_gt)
+    self.assertAllClose(expected, streaming.compute_average_precision(0))
+
+
 if __name__ == '__main__':
   tf.test.main()
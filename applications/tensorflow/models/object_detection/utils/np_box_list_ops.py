@@ -23,6 +23,7 @@ Example box operations that are supported:
 import numpy as np
 
 from object_detection.utils import np_box_list
+from object_detection.utils import np_box_nms
 from object_detection.utils import np_box_ops
 
 
@@ -208,29 +209,95 @@ def non_max_suppression(boxlist,
     else:
       return boxlist
 
-  boxes = boxlist.get()
-  num_boxes = boxlist.num_boxes()
-  # is_index_valid is True only for all remaining valid boxes,
-  is_index_valid = np.full(num_boxes, 1, dtype=bool)
-  selected_indices = []
-  num_output = 0
-  for i in xrange(num_boxes):
-    if num_output < max_output_size:
-      if is_index_valid[i]:
-        num_output += 1
-        selected_indices.append(i)
-        is_index_valid[i] = False
-        valid_indices = np.where(is_index_valid)[0]
-        if valid_indices.size == 0:
-          break
-
-        intersect_over_union = np_box_ops.iou(
-            np.expand_dims(boxes[i, :], axis=0), boxes[valid_indices, :])
-        intersect_over_union = np.squeeze(intersect_over_union, axis=0)
-        is_index_valid[valid_indices] = np.logical_and(
-            is_index_valid[valid_indices],
-            intersect_over_union <= iou_threshold)
-  return gather(boxlist, np.array(selected_indices))
+  selected_indices = np_box_nms.non_max_suppression_sorted(
+      boxlist.get(), max_output_size, iou_threshold)
+  return gather(boxlist, selected_indices)
+
+
+def soft_non_max_suppression(boxlist,
+                             max_output_size=10000,
+                             iou_threshold=0.3,
+                             sigma=0.5,
+                             score_threshold=0.001,
+                             method=np_box_nms.SoftNmsMethod.LINEAR):
+  """Soft non maximum suppression.
+
+  Instead of pruning boxes that overlap already selected boxes, their scores
+  are decayed according to the overlap, see
+  np_box_nms.soft_non_max_suppression.
+
+  Args:
+    boxlist: BoxList holding N boxes.  Must contain a 'scores' field
+      representing detection scores. All scores belong to the same class.
+    max_output_size: maximum number of retained boxes
+    iou_threshold: overlap above which the linear method decays scores.
+    sigma: width of the gaussian decay.
+    score_threshold: boxes whose decayed scores do not exceed this value are
+      removed.
+    method: a np_box_nms.SoftNmsMethod value.
+
+  Returns:
+    a BoxList holding M boxes where M <= max_output_size, with the 'scores'
+    field replaced by the decayed scores.
+  Raises:
+    ValueError: if 'scores' field does not exist
+    ValueError: if max_output_size < 0
+  """
+  if not boxlist.has_field('scores'):
+    raise ValueError('Field scores does not exist')
+  if max_output_size < 0:
+    raise ValueError('max_output_size must be bigger than 0.')
+  selected_indices, selected_scores = np_box_nms.soft_non_max_suppression(
+      boxlist.get(), boxlist.get_field('scores'), max_output_size,
+      iou_threshold, sigma, score_threshold, method)
+  fields = [field for field in boxlist.get_extra_fields() if field != 'scores']
+  selected_boxlist = gather(boxlist, selected_indices, fields)
+  selected_boxlist.add_field('scores', selected_scores)
+  return selected_boxlist
+
+
+def batched_non_max_suppression(boxlist,
+                                max_output_size=10000,
+                                iou_threshold=1.0,
+                                score_threshold=-10.0):
+  """Per-class non maximum suppression in a single pass.
+
+  Boxes are only suppressed by boxes of the same class. All classes are
+  processed together by translating the boxes of each class to a disjoint
+  region (see np_box_nms.batched_non_max_suppression).
+
+  Args:
+    boxlist: BoxList holding N boxes.  Must contain a rank-1 'scores' field
+      and a rank-1 integer 'classes' field.
+    max_output_size: maximum number of retained boxes over all classes.
+    iou_threshold: intersection over union threshold.
+    score_threshold: minimum score threshold. Remove the boxes with scores
+                     less than this value.
+
+  Returns:
+    a BoxList holding M boxes where M <= max_output_size, sorted by
+    decreasing score.
+  Raises:
+    ValueError: if 'scores' or 'classes' field does not exist
+    ValueError: if threshold is not in [0, 1]
+    ValueError: if max_output_size < 0
+  """
+  if not boxlist.has_field('scores'):
+    raise ValueError('Field scores does not exist')
+  if not boxlist.has_field('classes'):
+    raise ValueError('Field classes does not exist')
+  if iou_threshold < 0. or iou_threshold > 1.0:
+    raise ValueError('IOU threshold must be in [0, 1]')
+  if max_output_size < 0:
+    raise ValueError('max_output_size must be bigger than 0.')
+
+  boxlist = filter_scores_greater_than(boxlist, score_threshold)
+  if boxlist.num_boxes() == 0:
+    return boxlist
+  selected_indices = np_box_nms.batched_non_max_suppression(
+      boxlist.get(), boxlist.get_field('scores'),
+      boxlist.get_field('classes'), max_output_size, iou_threshold)
+  return gather(boxlist, selected_indices)
 
 
 def multi_class_non_max_suppression(boxlist, score_thresh, iou_thresh,
@@ -410,5 +410,38 @@ class NonMaximumSuppressionTest(tf.test.TestCase):
     self.assertAllClose(boxes, expected_boxes)
 
 
+class SoftNonMaximumSuppressionTest(tf.test.TestCase):
+
+  def test_decays_overlapping_scores(self):
+    boxlist = np_box_list.BoxList(
+        np.array([[0, 0, 1, 1], [0, 0, 1, 0.5], [0, 10, 1, 11]], dtype=float))
+    boxlist.add_field('scores', np.array([0.9, 0.8, 0.7]))
+    boxlist.add_field('labels', np.array([1, 2, 3]))
+    nms_boxlist = np_box_list_ops.soft_non_max_suppression(
+        boxlist, max_output_size=10, iou_threshold=0.3)
+    self.assertAllClose(nms_boxlist.get_field('scores'), [0.9, 0.7, 0.4])
+    self.assertAllEqual(nms_boxlist.get_field('labels'), [1, 3, 2])
+
+
+class BatchedNonMaximumSuppressionTest(tf.test.TestCase):
+
+  def test_suppresses_within_classes_only(self):
+    boxlist = np_box_list.BoxList(
+        np.array([[0, 0, 1, 1], [0, 0.1, 1, 1.1], [0, 0, 1, 1],
+                  [0, 10, 1, 11]], dtype=float))
+    boxlist.add_field('scores', np.array([0.9, 0.8, 0.7, 0.6]))
+    boxlist.add_field('classes', np.array([0, 0, 1, 1]))
+    nms_boxlist = np_box_list_ops.batched_non_max_suppression(
+        boxlist, max_output_size=10, iou_threshold=0.5)
+    self.assertAllClose(nms_boxlist.get_field('scores'), [0.9, 0.7, 0.6])
+    self.assertAllEqual(nms_boxlist.get_field('classes'), [0, 1, 1])
+
+  def test_with_no_classes_field(self):
+    boxlist = np_box_list.BoxList(np.array([[0, 0, 1, 1]], dtype=float))
+    boxlist.add_field('scores', np.array([0.9]))
+    with self.assertRaises(ValueError):
+      np_box_list_ops.batched_non_max_suppression(boxlist, 10, 0.5)
+
+
 if __name__ == '__main__':
   tf.test.main()
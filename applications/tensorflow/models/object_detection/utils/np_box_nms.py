@@ -0,0 +1,285 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Vectorized non maximum suppression for [N, 4] numpy arrays of boxes.
+
+The greedy NMS in this module processes candidate boxes in blocks instead of
+one box at a time:
+
+  * Each block of candidates is first checked against all boxes kept from
+    previous blocks. The IOU against kept boxes is computed in tiles of at most
+    `tile_size` boxes so the intermediate [block_size, tile_size] matrices stay
+    small enough to live in cache.
+  * The candidates that survive are resolved against each other with a boolean
+    overlap mask. Iterating "keep a box unless a kept, higher scoring box in the
+    block overlaps it" to a fixed point reproduces the sequential greedy result
+    exactly, with a handful of array operations per block.
+
+Soft-NMS and per-class (batched) NMS are provided on top of the same IOU
+helper. Batched NMS shifts the boxes of each class by a class dependent offset
+so that boxes of different classes never overlap, and then runs a single NMS.
+"""
+import numpy as np
+
+from object_detection.utils import np_box_ops
+
+
+class SoftNmsMethod(object):
+  """Enum class for the score decay function of soft-NMS.
+
+  Attributes:
+    LINEAR: scores are multiplied by (1 - iou) when iou > iou_threshold.
+    GAUSSIAN: scores are multiplied by exp(-iou^2 / sigma).
+  """
+  LINEAR = 1
+  GAUSSIAN = 2
+
+
+def _iou_with_areas(boxes1, areas1, boxes2, areas2):
+  """Computes pairwise iou given precomputed box areas.
+
+  Args:
+    boxes1: a numpy array with shape [N, 4] holding N boxes.
+    areas1: a numpy array with shape [N] holding the areas of boxes1.
+    boxes2: a numpy array with shape [M, 4] holding M boxes.
+    areas2: a numpy array with shape [M] holding the areas of boxes2.
+
+  Returns:
+    a numpy array with shape [N, M] representing pairwise iou scores.
+  """
+  intersect_heights = (
+      np.minimum(boxes1[:, 2:3], boxes2[:, 2]) -
+      np.maximum(boxes1[:, 0:1], boxes2[:, 0]))
+  np.maximum(intersect_heights, 0.0, out=intersect_heights)
+  intersect_widths = (
+      np.minimum(boxes1[:, 3:4], boxes2[:, 3]) -
+      np.maximum(boxes1[:, 1:2], boxes2[:, 1]))
+  np.maximum(intersect_widths, 0.0, out=intersect_widths)
+  intersect = intersect_heights * intersect_widths
+  union = areas1[:, np.newaxis] + areas2[np.newaxis, :] - intersect
+  return intersect / union
+
+
+def non_max_suppression_sorted(boxes,
+                               max_output_size=10000,
+                               iou_threshold=1.0,
+                               block_size=256,
+                               tile_size=512):
+  """Greedy non maximum suppression over boxes sorted by descending score.
+
+  Produces exactly the same selection as visiting the boxes in order and
+  pruning every remaining box whose IOU with the visited box is larger than
+  `iou_threshold` (a NaN IOU, e.g. between two empty boxes, also prunes).
+
+  Args:
+    boxes: a numpy array with shape [N, 4] holding N boxes, sorted by
+      descending score.
+    max_output_size: maximum number of retained boxes.
+    iou_threshold: intersection over union threshold.
+    block_size: number of candidate boxes resolved together.
+    tile_size: maximum number of kept boxes an IOU tile is computed against.
+
+  Returns:
+    a 1-d int numpy array with the indices of the selected boxes, in
+    increasing order.
+
+  Raises:
+    ValueError: if block_size or tile_size are not positive.
+  """
+  if block_size <= 0 or tile_size <= 0:
+    raise ValueError('block_size and tile_size must be positive.')
+  num_boxes = boxes.shape[0]
+  max_output_size = min(max_output_size, num_boxes)
+  if max_output_size <= 0:
+    return np.zeros([0], dtype=np.int64)
+
+  areas = np_box_ops.area(boxes)
+  kept_boxes = np.empty([max_output_size, 4], dtype=boxes.dtype)
+  kept_areas = np.empty([max_output_size], dtype=areas.dtype)
+  selected_indices = np.empty([max_output_size], dtype=np.int64)
+  num_selected = 0
+
+  for block_start in range(0, num_boxes, block_size):
+    block_end = min(block_start + block_size, num_boxes)
+    block_boxes = boxes[block_start:block_end]
+    block_areas = areas[block_start:block_end]
+
+    # Prune candidates overlapping boxes kept from previous blocks.
+    is_index_valid = np.ones(block_end - block_start, dtype=bool)
+    for tile_start in range(0, num_selected, tile_size):
+      tile_end = min(tile_start + tile_size, num_selected)
+      valid_indices = np.where(is_index_valid)[0]
+      intersect_over_union = _iou_with_areas(
+          block_boxes[valid_indices], block_areas[valid_indices],
+          kept_boxes[tile_start:tile_end], kept_areas[tile_start:tile_end])
+      is_index_valid[valid_indices] = np.all(
+          intersect_over_union <= iou_threshold, axis=1)
+      if not is_index_valid.any():
+        break
+    valid_indices = np.where(is_index_valid)[0]
+    if valid_indices.size == 0:
+      continue
+
+    # Resolve the surviving candidates against each other. overlaps[i, j] is
+    # True when the higher scoring box i would prune box j if i is kept.
+    candidate_boxes = block_boxes[valid_indices]
+    candidate_areas = block_areas[valid_indices]
+    overlaps = np.triu(
+        ~(_iou_with_areas(candidate_boxes, candidate_areas, candidate_boxes,
+                          candidate_areas) <= iou_threshold), 1)
+    is_kept = np.ones(valid_indices.size, dtype=bool)
+    while True:
+      next_is_kept = ~np.any(overlaps[is_kept], axis=0)
+      if np.array_equal(next_is_kept, is_kept):
+        break
+      is_kept = next_is_kept
+
+    kept_in_block = valid_indices[is_kept][:max_output_size - num_selected]
+    num_kept = kept_in_block.size
+    selected_indices[num_selected:num_selected + num_kept] = (
+        block_start + kept_in_block)
+    kept_boxes[num_selected:num_selected + num_kept] = (
+        block_boxes[kept_in_block])
+    kept_areas[num_selected:num_selected + num_kept] = (
+        block_areas[kept_in_block])
+    num_selected += num_kept
+    if num_selected >= max_output_size:
+      break
+  return selected_indices[:num_selected]
+
+
+def non_max_suppression(boxes,
+                        scores,
+                        max_output_size=10000,
+                        iou_threshold=1.0,
+                        block_size=256,
+                        tile_size=512):
+  """Greedy non maximum suppression.
+
+  Args:
+    boxes: a numpy array with shape [N, 4] holding N boxes.
+    scores: a numpy array with shape [N] holding the box scores.
+    max_output_size: maximum number of retained boxes.
+    iou_threshold: intersection over union threshold.
+    block_size: number of candidate boxes resolved together.
+    tile_size: maximum number of kept boxes an IOU tile is computed against.
+
+  Returns:
+    a 1-d int numpy array with the indices of the selected boxes into `boxes`,
+    sorted by descending score.
+  """
+  order = np.argsort(scores)[::-1]
+  selected = non_max_suppression_sorted(
+      boxes[order], max_output_size, iou_threshold, block_size, tile_size)
+  return order[selected]
+
+
+def soft_non_max_suppression(boxes,
+                             scores,
+                             max_output_size=10000,
+                             iou_threshold=0.3,
+                             sigma=0.5,
+                             score_threshold=0.001,
+                             method=SoftNmsMethod.LINEAR):
+  """Soft non maximum suppression (Bodla et al., 2017).
+
+  Instead of pruning overlapping boxes, the scores of the remaining boxes are
+  decayed by their overlap with each selected box. Boxes whose decayed score
+  drops to `score_threshold` or below are discarded.
+
+  Args:
+    boxes: a numpy array with shape [N, 4] holding N boxes.
+    scores: a numpy array with shape [N] holding the box scores.
+    max_output_size: maximum number of retained boxes.
+    iou_threshold: overlap above which the linear method decays scores.
+    sigma: width of the gaussian decay.
+    score_threshold: boxes with decayed scores not exceeding this value are
+      removed.
+    method: a SoftNmsMethod value.
+
+  Returns:
+    selected_indices: a 1-d int numpy array with the indices of the selected
+      boxes into `boxes`, in selection order.
+    selected_scores: a 1-d float numpy array with the decayed scores of the
+      selected boxes.
+
+  Raises:
+    ValueError: if method is not a valid SoftNmsMethod or sigma is not positive.
+  """
+  if method != SoftNmsMethod.LINEAR and method != SoftNmsMethod.GAUSSIAN:
+    raise ValueError('Invalid soft-NMS method')
+  if sigma <= 0.0:
+    raise ValueError('sigma must be positive.')
+  areas = np_box_ops.area(boxes)
+  current_scores = scores.astype(np.float64)
+  remaining = np.where(current_scores > score_threshold)[0]
+  selected_indices = []
+  selected_scores = []
+  while remaining.size and len(selected_indices) < max_output_size:
+    best = np.argmax(current_scores[remaining])
+    index = remaining[best]
+    selected_indices.append(index)
+    selected_scores.append(current_scores[index])
+    remaining = np.delete(remaining, best)
+    if not remaining.size:
+      break
+    intersect_over_union = _iou_with_areas(
+        boxes[index:index + 1], areas[index:index + 1], boxes[remaining],
+        areas[remaining])[0]
+    if method == SoftNmsMethod.LINEAR:
+      decay = np.where(intersect_over_union > iou_threshold,
+                       1.0 - intersect_over_union, 1.0)
+    else:
+      decay = np.exp(-(intersect_over_union * intersect_over_union) / sigma)
+    current_scores[remaining] *= decay
+    remaining = remaining[current_scores[remaining] > score_threshold]
+  return (np.array(selected_indices, dtype=np.int64),
+          np.array(selected_scores, dtype=np.float64))
+
+
+def batched_non_max_suppression(boxes,
+                                scores,
+                                classes,
+                                max_output_size=10000,
+                                iou_threshold=1.0,
+                                block_size=256,
+                                tile_size=512):
+  """Per-class non maximum suppression in a single pass.
+
+  Boxes of class c are translated by c * (coordinate span + 1) along both axes,
+  which places every class in its own disjoint region. A single greedy NMS over
+  the translated boxes is then equivalent to running NMS for every class
+  separately and merging the results by score.
+
+  Args:
+    boxes: a numpy array with shape [N, 4] holding N boxes.
+    scores: a numpy array with shape [N] holding the box scores.
+    classes: a 1-d int numpy array with shape [N] holding the box classes.
+    max_output_size: maximum number of retained boxes over all classes.
+    iou_threshold: intersection over union threshold.
+    block_size: number of candidate boxes resolved together.
+    tile_size: maximum number of kept boxes an IOU tile is computed against.
+
+  Returns:
+    a 1-d int numpy array with the indices of the selected boxes into `boxes`,
+    sorted by descending score.
+  """
+  if boxes.shape[0] == 0:
+    return np.zeros([0], dtype=np.int64)
+  span = np.max(boxes) - np.min(boxes) + 1.0
+  offsets = (classes - np.min(classes)).astype(boxes.dtype) * span
+  return non_max_suppression(boxes + offsets[:, np.newaxis], scores,
+                             max_output_size, iou_threshold, block_size,
+                             tile_size)
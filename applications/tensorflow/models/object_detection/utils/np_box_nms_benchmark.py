@@ -0,0 +1,122 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+r"""Timing benchmark for the numpy non maximum suppression engine.
+
+Compares np_box_nms.non_max_suppression_sorted against the box-at-a-time loop
+previously used by np_box_list_ops.non_max_suppression on random boxes.
+
+To run, use:
+  python object_detection/utils/np_box_nms_benchmark.py \
+      --num_boxes=100,1000,5000,20000 --iou_threshold=0.5
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from object_detection.utils import np_box_nms
+from object_detection.utils import np_box_ops
+
+
+def loop_non_max_suppression(boxes, max_output_size, iou_threshold):
+  """Reference NMS visiting one box per iteration, boxes sorted by score."""
+  num_boxes = boxes.shape[0]
+  is_index_valid = np.full(num_boxes, 1, dtype=bool)
+  selected_indices = []
+  for i in range(num_boxes):
+    if len(selected_indices) >= max_output_size:
+      break
+    if is_index_valid[i]:
+      selected_indices.append(i)
+      is_index_valid[i] = False
+      valid_indices = np.where(is_index_valid)[0]
+      if valid_indices.size == 0:
+        break
+      intersect_over_union = np.squeeze(np_box_ops.iou(
+          np.expand_dims(boxes[i, :], axis=0), boxes[valid_indices, :]), axis=0)
+      is_index_valid[valid_indices] = np.logical_and(
+          is_index_valid[valid_indices],
+          intersect_over_union <= iou_threshold)
+  return np.array(selected_indices, dtype=np.int64)
+
+
+def random_boxes(num_boxes, seed=0):
+  """Generates boxes scattered over a 1000x1000 image, sorted by score."""
+  rng = np.random.RandomState(seed)
+  centers = rng.uniform(0, 1000, size=[num_boxes, 2])
+  sizes = rng.uniform(10, 100, size=[num_boxes, 2])
+  boxes = np.hstack([centers - sizes / 2, centers + sizes / 2])
+  scores = rng.uniform(size=num_boxes)
+  return boxes[np.argsort(scores)[::-1]]
+
+
+def time_function(fn, num_runs):
+  """Returns the best wall time of num_runs calls to fn."""
+  best = float('inf')
+  for _ in range(num_runs):
+    start_time = time.time()
+    fn()
+    best = min(best, time.time() - start_time)
+  return best
+
+
+def run_benchmark(flags):
+  """Runs both implementations for every requested number of boxes."""
+  print('%8s %12s %12s %8s %8s' % ('boxes', 'loop (s)', 'engine (s)',
+                                   'speedup', 'kept'))
+  for num_boxes in [int(n) for n in flags.num_boxes.split(',')]:
+    boxes = random_boxes(num_boxes)
+    expected = loop_non_max_suppression(boxes, flags.max_output_size,
+                                        flags.iou_threshold)
+    selected = np_box_nms.non_max_suppression_sorted(
+        boxes, flags.max_output_size, flags.iou_threshold, flags.block_size,
+        flags.tile_size)
+    if not np.array_equal(expected, selected):
+      raise RuntimeError('Selections differ for %d boxes.' % num_boxes)
+    loop_time = time_function(
+        lambda: loop_non_max_suppression(  # pylint: disable=g-long-lambda
+            boxes, flags.max_output_size, flags.iou_threshold),
+        flags.num_runs)
+    engine_time = time_function(
+        lambda: np_box_nms.non_max_suppression_sorted(  # pylint: disable=g-long-lambda
+            boxes, flags.max_output_size, flags.iou_threshold,
+            flags.block_size, flags.tile_size),
+        flags.num_runs)
+    print('%8d %12.4f %12.4f %7.1fx %8d' % (num_boxes, loop_time, engine_time,
+                                            loop_time / engine_time,
+                                            selected.size))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--num_boxes', type=str,
+                      default='100,500,1000,5000,10000,20000',
+                      help='Comma separated numbers of boxes to benchmark.')
+  parser.add_argument('--iou_threshold', type=float, default=0.5,
+                      help='IOU threshold for suppression.')
+  parser.add_argument('--max_output_size', type=int, default=10000,
+                      help='Maximum number of retained boxes.')
+  parser.add_argument('--block_size', type=int, default=256,
+                      help='Number of candidate boxes resolved together.')
+  parser.add_argument('--tile_size', type=int, default=512,
+                      help='Number of kept boxes per IOU tile.')
+  parser.add_argument('--num_runs', type=int, default=3,
+                      help='Number of timed runs, the best one is reported.')
+  run_benchmark(parser.parse_args())
@@ -0,0 +1,130 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for object_detection.utils.np_box_nms."""
+
+import numpy as np
+import tensorflow as tf
+
+from object_detection.utils import np_box_nms
+from object_detection.utils import np_box_nms_benchmark
+
+
+class NonMaxSuppressionSortedTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._boxes = np.array([[0, 10, 1, 11],
+                            [0, 0, 1, 1],
+                            [0, 0.1, 1, 1.1],
+                            [0, -0.1, 1, 0.9],
+                            [0, 10.1, 1, 11.1],
+                            [0, 100, 1, 101]],
+                           dtype=float)
+
+  def test_select_from_three_clusters(self):
+    selected = np_box_nms.non_max_suppression_sorted(self._boxes, 10, 0.5)
+    self.assertAllEqual(selected, [0, 1, 5])
+
+  def test_max_output_size(self):
+    selected = np_box_nms.non_max_suppression_sorted(self._boxes, 2, 0.5)
+    self.assertAllEqual(selected, [0, 1])
+
+  def test_empty_input(self):
+    selected = np_box_nms.non_max_suppression_sorted(
+        np.zeros([0, 4], dtype=float), 10, 0.5)
+    self.assertEqual(selected.size, 0)
+
+  def test_invalid_block_size(self):
+    with self.assertRaises(ValueError):
+      np_box_nms.non_max_suppression_sorted(self._boxes, 10, 0.5, block_size=0)
+
+  def test_matches_loop_for_random_boxes(self):
+    for seed in range(5):
+      boxes = np_box_nms_benchmark.random_boxes(600, seed=seed)
+      for iou_threshold in [0.0, 0.3, 0.7]:
+        for block_size, tile_size in [(1, 1), (16, 7), (256, 512)]:
+          expected = np_box_nms_benchmark.loop_non_max_suppression(
+              boxes, 100, iou_threshold)
+          selected = np_box_nms.non_max_suppression_sorted(
+              boxes, 100, iou_threshold, block_size, tile_size)
+          self.assertAllEqual(selected, expected)
+
+
+class NonMaxSuppressionTest(tf.test.TestCase):
+
+  def test_returns_indices_sorted_by_score(self):
+    boxes = np.array([[0, 0, 1, 1], [0, 10, 1, 11], [0, 0.1, 1, 1.1]],
+                     dtype=float)
+    scores = np.array([0.5, 0.9, 0.8])
+    selected = np_box_nms.non_max_suppression(boxes, scores, 10, 0.5)
+    self.assertAllEqual(selected, [1, 2])
+
+
+class SoftNonMaxSuppressionTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._boxes = np.array([[0, 0, 1, 1], [0, 0, 1, 0.5], [0, 10, 1, 11]],
+                           dtype=float)
+    self._scores = np.array([0.9, 0.8, 0.7])
+
+  def test_linear_decay(self):
+    selected, scores = np_box_nms.soft_non_max_suppression(
+        self._boxes, self._scores, iou_threshold=0.3)
+    self.assertAllEqual(selected, [0, 2, 1])
+    self.assertAllClose(scores, [0.9, 0.7, 0.4])
+
+  def test_gaussian_decay(self):
+    selected, scores = np_box_nms.soft_non_max_suppression(
+        self._boxes, self._scores, sigma=0.5,
+        method=np_box_nms.SoftNmsMethod.GAUSSIAN)
+    self.assertAllEqual(selected, [0, 2, 1])
+    self.assertAllClose(scores, [0.9, 0.7, 0.8 * np.exp(-0.25 / 0.5)])
+
+  def test_score_threshold_removes_decayed_boxes(self):
+    selected, _ = np_box_nms.soft_non_max_suppression(
+        self._boxes, self._scores, iou_threshold=0.3, score_threshold=0.5)
+    self.assertAllEqual(selected, [0, 2])
+
+  def test_invalid_method(self):
+    with self.assertRaises(ValueError):
+      np_box_nms.soft_non_max_suppression(self._boxes, self._scores, method=3)
+
+
+class BatchedNonMaxSuppressionTest(tf.test.TestCase):
+
+  def test_matches_per_class_nms(self):
+    boxes = np_box_nms_benchmark.random_boxes(400)
+    rng = np.random.RandomState(1)
+    scores = rng.uniform(size=400)
+    classes = rng.randint(0, 5, size=400)
+    selected = np_box_nms.batched_non_max_suppression(
+        boxes, scores, classes, 10000, 0.3)
+    expected = []
+    for class_idx in range(5):
+      class_indices = np.where(classes == class_idx)[0]
+      expected.extend(class_indices[np_box_nms.non_max_suppression(
+          boxes[class_indices], scores[class_indices], 10000, 0.3)])
+    self.assertAllEqual(np.sort(selected), np.sort(expected))
+    self.assertTrue(np.all(np.diff(scores[selected]) <= 0))
+
+  def test_boxes_of_different_classes_do_not_suppress(self):
+    boxes = np.array([[0, 0, 1, 1], [0, 0, 1, 1]], dtype=float)
+    selected = np_box_nms.batched_non_max_suppression(
+        boxes, np.array([0.9, 0.8]), np.array([1, 2]), 10, 0.5)
+    self.assertAllEqual(selected, [0, 1])
+
+
+if __name__ == '__main__':
+  tf.test.main()
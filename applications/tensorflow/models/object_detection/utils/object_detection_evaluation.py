@@ -21,19 +21,35 @@ Precision, Recall, CorLoc of the provided detection results.
 It supports the following operations:
 1) Add ground truth information of images sequentially.
 2) Add detection result of images sequentially.
-3) Evaluate detection metrics on already inserted detection results.
+3) Evaluate detection metrics on already inserted detection results. Calling
+   evaluate again after adding more images only recomputes the classes that
+   received new data.
 4) Write evaluation result into a pickle file for future processing or
    visualization.
+5) Export the accumulated per-class statistics as an EvaluationState and merge
+   states computed on disjoint shards of images, e.g. by worker processes (see
+   evaluate_shards_in_parallel).
 
 Note: This module operates on numpy boxes and box lists.
 """
 
+import collections
 import logging
+import multiprocessing
+
 import numpy as np
 
 from object_detection.utils import metrics
 from object_detection.utils import per_image_evaluation
 
+# Accumulated statistics of an ObjectDetectionEvaluation. scores_per_class and
+# tp_fp_labels_per_class hold a single concatenated numpy array per class.
+EvaluationState = collections.namedtuple('EvaluationState', [
+    'num_gt_instances_per_class', 'num_gt_imgs_per_class', 'scores_per_class',
+    'tp_fp_labels_per_class', 'num_images_correctly_detected_per_class',
+    'detection_keys'
+])
+
 
 class ObjectDetectionEvaluation(object):
   """Evaluate Object Detection Result."""
@@ -63,9 +79,11 @@ class ObjectDetectionEvaluation(object):
     self.precisions_per_class = []
     self.recalls_per_class = []
     self.corloc_per_class = np.ones(self.num_class, dtype=float)
+    self._precision_recall_per_class = [None] * self.num_class
+    self._is_class_updated = np.ones(self.num_class, dtype=bool)
 
   def clear_detections(self):
-    self.detection_keys = {}
+    self.detection_keys = set()
     self.scores_per_class = [[] for _ in range(self.num_class)]
     self.tp_fp_labels_per_class = [[] for _ in range(self.num_class)]
     self.num_images_correctly_detected_per_class = np.zeros(self.num_class)
@@ -73,6 +91,8 @@ class ObjectDetectionEvaluation(object):
     self.precisions_per_class = []
     self.recalls_per_class = []
     self.corloc_per_class = np.ones(self.num_class, dtype=float)
+    self._precision_recall_per_class = [None] * self.num_class
+    self._is_class_updated = np.ones(self.num_class, dtype=bool)
 
   def add_single_ground_truth_image_info(self,
                                          image_key,
@@ -154,6 +174,8 @@ class ObjectDetectionEvaluation(object):
     for i in range(self.num_class):
       self.scores_per_class[i].append(scores[i])
       self.tp_fp_labels_per_class[i].append(tp_fp_labels[i])
+      if scores[i].size:
+        self._is_class_updated[i] = True
     (self.num_images_correctly_detected_per_class
     ) += is_class_correctly_detected_in_image
 
@@ -176,9 +198,80 @@ class ObjectDetectionEvaluation(object):
       num_gt_instances = np.sum(groundtruth_class_labels[
           ~groundtruth_is_difficult_list] == class_index)
       self.num_gt_instances_per_class[class_index] += num_gt_instances
+      if num_gt_instances:
+        self._is_class_updated[class_index] = True
       if np.any(groundtruth_class_labels == class_index):
         self.num_gt_imgs_per_class[class_index] += 1
 
+  def _consolidate_detections(self):
+    """Concatenates the per-image arrays of every class into a single array."""
+    for class_index in range(self.num_class):
+      if len(self.scores_per_class[class_index]) != 1:
+        self.scores_per_class[class_index] = [
+            _concatenate_or_empty(self.scores_per_class[class_index], float)]
+        self.tp_fp_labels_per_class[class_index] = [
+            _concatenate_or_empty(self.tp_fp_labels_per_class[class_index],
+                                  bool)]
+
+  def get_state(self):
+    """Returns the accumulated statistics as an EvaluationState.
+
+    The state only holds per-class statistics (and the keys of the detected
+    images), so it is much smaller than the ground truth database and cheap to
+    send between processes.
+
+    Returns:
+      an EvaluationState.
+    """
+    self._consolidate_detections()
+    return EvaluationState(
+        num_gt_instances_per_class=self.num_gt_instances_per_class.copy(),
+        num_gt_imgs_per_class=self.num_gt_imgs_per_class.copy(),
+        scores_per_class=[scores[0] for scores in self.scores_per_class],
+        tp_fp_labels_per_class=[
+            tp_fp_labels[0] for tp_fp_labels in self.tp_fp_labels_per_class],
+        num_images_correctly_detected_per_class=(
+            self.num_images_correctly_detected_per_class.copy()),
+        detection_keys=frozenset(self.detection_keys))
+
+  def merge_state(self, state):
+    """Merges statistics accumulated on a disjoint set of images.
+
+    Both the ground truth statistics and the detection results of the state are
+    added, so the ground truth of the images in the state must not also be added
+    to this evaluation.
+
+    Args:
+      state: an EvaluationState, e.g. returned by get_state of an
+          ObjectDetectionEvaluation with the same number of classes.
+
+    Raises:
+      ValueError: if the state has a different number of classes or contains
+          detections of images that were already added.
+    """
+    if len(state.scores_per_class) != self.num_class:
+      raise ValueError('Cannot merge a state with %d classes into an '
+                       'evaluation with %d classes.' %
+                       (len(state.scores_per_class), self.num_class))
+    duplicate_keys = self.detection_keys.intersection(state.detection_keys)
+    if duplicate_keys:
+      raise ValueError('Detection results of %d images have already been '
+                       'added, e.g. %s.' % (len(duplicate_keys),
+                                            next(iter(duplicate_keys))))
+    self.detection_keys.update(state.detection_keys)
+    self.num_gt_instances_per_class += state.num_gt_instances_per_class
+    self.num_gt_imgs_per_class += state.num_gt_imgs_per_class
+    (self.num_images_correctly_detected_per_class
+    ) += state.num_images_correctly_detected_per_class
+    for class_index in range(self.num_class):
+      self.scores_per_class[class_index].append(
+          state.scores_per_class[class_index])
+      self.tp_fp_labels_per_class[class_index].append(
+          state.tp_fp_labels_per_class[class_index])
+      if (state.scores_per_class[class_index].size or
+          state.num_gt_instances_per_class[class_index]):
+        self._is_class_updated[class_index] = True
+
   def evaluate(self):
     """Compute evaluation result.
 
@@ -196,17 +289,26 @@ class ObjectDetectionEvaluation(object):
       logging.warn(
           'The following classes have no ground truth examples: %s',
           np.squeeze(np.argwhere(self.num_gt_instances_per_class == 0)))
+    self._consolidate_detections()
+    self.precisions_per_class = []
+    self.recalls_per_class = []
     for class_index in range(self.num_class):
       if self.num_gt_instances_per_class[class_index] == 0:
         continue
-      scores = np.concatenate(self.scores_per_class[class_index])
-      tp_fp_labels = np.concatenate(self.tp_fp_labels_per_class[class_index])
-      precision, recall = metrics.compute_precision_recall(
-          scores, tp_fp_labels, self.num_gt_instances_per_class[class_index])
+      # Classes without new detections or ground truth since the previous call
+      # reuse their precision and recall.
+      if self._is_class_updated[class_index]:
+        scores = self.scores_per_class[class_index][0]
+        tp_fp_labels = self.tp_fp_labels_per_class[class_index][0]
+        precision, recall = metrics.compute_precision_recall(
+            scores, tp_fp_labels, self.num_gt_instances_per_class[class_index])
+        self._precision_recall_per_class[class_index] = (precision, recall)
+        self.average_precision_per_class[class_index] = (
+            metrics.compute_average_precision(precision, recall))
+        self._is_class_updated[class_index] = False
+      precision, recall = self._precision_recall_per_class[class_index]
       self.precisions_per_class.append(precision)
       self.recalls_per_class.append(recall)
-      average_precision = metrics.compute_average_precision(precision, recall)
-      self.average_precision_per_class[class_index] = average_precision
 
     self.corloc_per_class = metrics.compute_cor_loc(
         self.num_gt_imgs_per_class,
@@ -224,6 +326,70 @@ class ObjectDetectionEvaluation(object):
                       self.corloc_per_class)
 
 
+def _concatenate_or_empty(arrays, dtype):
+  if not arrays:
+    return np.array([], dtype=dtype)
+  return np.concatenate(arrays)
+
+
+def _evaluate_shard(args):
+  """Evaluates a shard of images and returns its EvaluationState."""
+  shard, num_groundtruth_classes, evaluation_kwargs = args
+  evaluation = ObjectDetectionEvaluation(num_groundtruth_classes,
+                                         **evaluation_kwargs)
+  for (image_key, groundtruth_boxes, groundtruth_class_labels,
+       groundtruth_is_difficult_list, detected_boxes, detected_scores,
+       detected_class_labels) in shard:
+    if groundtruth_boxes is not None:
+      evaluation.add_single_ground_truth_image_info(
+          image_key, groundtruth_boxes, groundtruth_class_labels,
+          groundtruth_is_difficult_list)
+    evaluation.add_single_detected_image_info(
+        image_key, detected_boxes, detected_scores, detected_class_labels)
+  return evaluation.get_state()
+
+
+def evaluate_shards_in_parallel(shards,
+                                num_groundtruth_classes,
+                                num_processes=None,
+                                **evaluation_kwargs):
+  """Runs per-image evaluation of disjoint shards in a process pool.
+
+  Every worker evaluates one shard with its own ObjectDetectionEvaluation and
+  returns its EvaluationState, which is merged into the returned evaluation in
+  shard order. Call evaluate() on the result to compute the metrics.
+
+  Args:
+    shards: a list of shards. Each shard is an iterable of
+        (image_key, groundtruth_boxes, groundtruth_class_labels,
+        groundtruth_is_difficult_list, detected_boxes, detected_scores,
+        detected_class_labels) tuples, with the same meaning as the arguments of
+        add_single_ground_truth_image_info and add_single_detected_image_info.
+        groundtruth_boxes may be None for images without ground truth, and
+        groundtruth_is_difficult_list may be None when no box is difficult.
+    num_groundtruth_classes: number of ground truth object classes.
+    num_processes: number of worker processes. Defaults to the number of CPUs.
+    **evaluation_kwargs: additional arguments of ObjectDetectionEvaluation,
+        e.g. matching_iou_threshold.
+
+  Returns:
+    an ObjectDetectionEvaluation holding the merged statistics of all shards.
+  """
+  evaluation = ObjectDetectionEvaluation(num_groundtruth_classes,
+                                         **evaluation_kwargs)
+  pool = multiprocessing.Pool(num_processes)
+  try:
+    for state in pool.imap(
+        _evaluate_shard,
+        [(shard, num_groundtruth_classes, evaluation_kwargs)
+         for shard in shards]):
+      evaluation.merge_state(state)
+  finally:
+    pool.close()
+    pool.join()
+  return evaluation
+
+
 class EvalResult(object):
 
   def __init__(self, average_precisions, precisions, recalls, all_corloc):
@@ -121,5 +121,94 @@ class ObjectDetectionEvaluationTest(tf.test.TestCase):
     self.assertAlmostEqual(expected_mean_corloc, mean_corloc)
 
 
+def _make_images():
+  """Returns (key, gt boxes, gt labels, gt difficult, det boxes, det scores,
+  det labels) tuples for a few images."""
+  return [
+      ("img1", np.array([[0, 0, 1, 1], [0, 0, 2, 2]], dtype=float),
+       np.array([0, 1], dtype=int), None,
+       np.array([[0, 0, 1, 1], [0, 0, 2, 2.1], [5, 5, 6, 6]], dtype=float),
+       np.array([0.9, 0.6, 0.4], dtype=float), np.array([0, 1, 0], dtype=int)),
+      ("img2", np.array([[10, 10, 11, 11], [10, 10, 12, 12]], dtype=float),
+       np.array([0, 0], dtype=int), np.array([False, True], dtype=bool),
+       np.array([[10, 10, 12, 12], [10, 10, 11, 11]], dtype=float),
+       np.array([0.8, 0.3], dtype=float), np.array([0, 0], dtype=int)),
+      ("img3", np.array([[0, 0, 4, 4]], dtype=float),
+       np.array([1], dtype=int), None,
+       np.array([[0, 0, 4, 4], [0, 0, 3.9, 4]], dtype=float),
+       np.array([0.7, 0.5], dtype=float), np.array([1, 1], dtype=int)),
+      ("img4", None, None, None,
+       np.array([[0, 0, 1, 1]], dtype=float),
+       np.array([0.95], dtype=float), np.array([1], dtype=int)),
+  ]
+
+
+def _add_images(od_eval, images):
+  for (image_key, gt_boxes, gt_labels, gt_difficult, det_boxes, det_scores,
+       det_labels) in images:
+    if gt_boxes is not None:
+      od_eval.add_single_ground_truth_image_info(image_key, gt_boxes,
+                                                 gt_labels, gt_difficult)
+    od_eval.add_single_detected_image_info(image_key, det_boxes, det_scores,
+                                           det_labels)
+
+
+class MergeableObjectDetectionEvaluationTest(tf.test.TestCase):
+
+  def _assert_same_metrics(self, expected, actual):
+    self.assertAllClose(expected[0], actual[0])
+    self.assertAlmostEqual(expected[1], actual[1])
+    for expected_precision, precision in zip(expected[2], actual[2]):
+      self.assertAllClose(expected_precision, precision)
+    for expected_recall, recall in zip(expected[3], actual[3]):
+      self.assertAllClose(expected_recall, recall)
+    self.assertAllClose(expected[4], actual[4])
+
+  def setUp(self):
+    self.images = _make_images()
+    self.od_eval = object_detection_evaluation.ObjectDetectionEvaluation(2)
+    _add_images(self.od_eval, self.images)
+    self.expected_metrics = self.od_eval.evaluate()
+
+  def test_merge_state(self):
+    od_eval = object_detection_evaluation.ObjectDetectionEvaluation(2)
+    for shard in [self.images[:1], self.images[1:3], self.images[3:]]:
+      shard_eval = object_detection_evaluation.ObjectDetectionEvaluation(2)
+      _add_images(shard_eval, shard)
+      od_eval.merge_state(shard_eval.get_state())
+    self.assertAllEqual(od_eval.num_gt_instances_per_class,
+                        self.od_eval.num_gt_instances_per_class)
+    self._assert_same_metrics(self.expected_metrics, od_eval.evaluate())
+
+  def test_merge_state_with_duplicate_images(self):
+    od_eval = object_detection_evaluation.ObjectDetectionEvaluation(2)
+    shard_eval = object_detection_evaluation.ObjectDetectionEvaluation(2)
+    _add_images(shard_eval, self.images[:1])
+    od_eval.merge_state(shard_eval.get_state())
+    with self.assertRaises(ValueError):
+      od_eval.merge_state(shard_eval.get_state())
+
+  def test_merge_state_with_different_number_of_classes(self):
+    od_eval = object_detection_evaluation.ObjectDetectionEvaluation(3)
+    with self.assertRaises(ValueError):
+      od_eval.merge_state(self.od_eval.get_state())
+
+  def test_incremental_evaluate(self):
+    od_eval = object_detection_evaluation.ObjectDetectionEvaluation(2)
+    _add_images(od_eval, self.images[:2])
+    od_eval.evaluate()
+    _add_images(od_eval, self.images[2:])
+    metrics = od_eval.evaluate()
+    self._assert_same_metrics(self.expected_metrics, metrics)
+    self.assertEqual(len(metrics[2]), 2)
+    self._assert_same_metrics(self.expected_metrics, od_eval.evaluate())
+
+  def test_evaluate_shards_in_parallel(self):
+    od_eval = object_detection_evaluation.evaluate_shards_in_parallel(
+        [self.images[:2], self.images[2:]], 2, num_processes=2,
+        matching_iou_threshold=0.5)
+    self._assert_same_metrics(self.expected_metrics, od_eval.evaluate())
+
+
 if __name__ == "__main__":
   tf.test.main()
@@ -18,11 +18,21 @@
 Annotate each detected result as true positives or false positive according to
 a predefined IOU ratio. Non Maximum Supression is used by default. Multi class
 detection is supported by default.
+
+By default the detections of all classes of an image are labeled at once with
+array operations (see PerImageEvaluation._compute_tp_fp_and_cor_loc). The
+per-class implementation is kept as a reference and can be selected with
+use_vectorized_matching=False.
 """
 import numpy as np
 
 from object_detection.utils import np_box_list
 from object_detection.utils import np_box_list_ops
+from object_detection.utils import np_box_nms
+from object_detection.utils import np_box_ops
+
+# Score threshold applied by np_box_list_ops.non_max_suppression by default.
+_NMS_SCORE_THRESHOLD = -10.0
 
 
 class PerImageEvaluation(object):
@@ -32,7 +42,8 @@ class PerImageEvaluation(object):
                num_groundtruth_classes,
                matching_iou_threshold=0.5,
                nms_iou_threshold=0.3,
-               nms_max_output_boxes=50):
+               nms_max_output_boxes=50,
+               use_vectorized_matching=True):
     """Initialized PerImageEvaluation by evaluation parameters.
 
     Args:
@@ -41,11 +52,14 @@ class PerImageEvaluation(object):
           the threshold to consider whether a detection is true positive or not
       nms_iou_threshold: IOU threshold used in Non Maximum Suppression.
       nms_max_output_boxes: Number of maximum output boxes in NMS.
+      use_vectorized_matching: Whether to label the detections of all classes
+          at once instead of looping over classes and detections.
     """
     self.matching_iou_threshold = matching_iou_threshold
     self.nms_iou_threshold = nms_iou_threshold
     self.nms_max_output_boxes = nms_max_output_boxes
     self.num_groundtruth_classes = num_groundtruth_classes
+    self.use_vectorized_matching = use_vectorized_matching
 
   def compute_object_detection_metrics(self, detected_boxes, detected_scores,
                                        detected_class_labels, groundtruth_boxes,
@@ -82,6 +96,11 @@ class PerImageEvaluation(object):
     detected_boxes, detected_scores, detected_class_labels = (
         self._remove_invalid_boxes(detected_boxes, detected_scores,
                                    detected_class_labels))
+    if self.use_vectorized_matching:
+      return self._compute_tp_fp_and_cor_loc(
+          detected_boxes, detected_scores, detected_class_labels,
+          groundtruth_boxes, groundtruth_class_labels,
+          groundtruth_is_difficult_lists)
     scores, tp_fp_labels = self._compute_tp_fp(
         detected_boxes, detected_scores, detected_class_labels,
         groundtruth_boxes, groundtruth_class_labels,
@@ -91,6 +110,224 @@ class PerImageEvaluation(object):
         groundtruth_boxes, groundtruth_class_labels)
     return scores, tp_fp_labels, is_class_correctly_detected_in_image
 
+  def _compute_tp_fp_and_cor_loc(self, detected_boxes, detected_scores,
+                                 detected_class_labels, groundtruth_boxes,
+                                 groundtruth_class_labels,
+                                 groundtruth_is_difficult_lists):
+    """Labels detections of all classes and computes CorLoc at once.
+
+    Equivalent to _compute_tp_fp followed by _compute_cor_loc: detections are
+    sorted by class and descending score, NMS is applied per class, and every
+    detection is compared to the ground truth box of its class with the
+    largest IOU. Among the detections matched to the same non-difficult box,
+    the highest scoring one is the true positive; detections matched to
+    difficult boxes are dropped.
+
+    Args:
+      detected_boxes: A float numpy array of shape [N, 4], representing N
+          regions of detected object regions.
+          Each row is of the format [y_min, x_min, y_max, x_max]
+      detected_scores: A float numpy array of shape [N, 1], representing
+          the confidence scores of the detected N object instances.
+      detected_class_labels: A integer numpy array of shape [N, 1], repreneting
+          the class labels of the detected N object instances.
+      groundtruth_boxes: A float numpy array of shape [M, 4], representing M
+          regions of object instances in ground truth
+      groundtruth_class_labels: An integer numpy array of shape [M, 1],
+          representing M class labels of object instances in ground truth
+      groundtruth_is_difficult_lists: A boolean numpy array of length M denoting
+          whether a ground truth box is a difficult instance or not
+
+    Returns:
+      scores: A list of C float numpy arrays, see
+          compute_object_detection_metrics.
+      tp_fp_labels: A list of C boolean numpy arrays.
+      is_class_correctly_detected_in_image: a numpy integer array of shape [C].
+    """
+    num_classes = self.num_groundtruth_classes
+    is_known_class = np.logical_and(detected_class_labels >= 0,
+                                    detected_class_labels < num_classes)
+    detected_boxes = detected_boxes[is_known_class]
+    detected_scores = detected_scores[is_known_class]
+    detected_class_labels = detected_class_labels[is_known_class]
+    num_detections = detected_scores.size
+
+    order = self._sort_detections_by_class_and_score(detected_scores,
+                                                     detected_class_labels)
+    boxes = detected_boxes[order]
+    scores = detected_scores[order]
+    classes = detected_class_labels[order]
+    class_starts = np.searchsorted(classes, np.arange(num_classes + 1))
+
+    max_overlaps, max_overlap_gt_ids = self._compute_max_overlaps_per_class(
+        boxes, classes, groundtruth_boxes, groundtruth_class_labels)
+    is_matched = max_overlaps >= self.matching_iou_threshold
+
+    # CorLoc only looks at the highest scoring detection of every class before
+    # NMS; among equal scores the first one in input order, as np.argmax does.
+    is_class_correctly_detected_in_image = np.zeros(num_classes, dtype=int)
+    has_detections = class_starts[:-1] < class_starts[1:]
+    first_in_input_order = np.lexsort((np.arange(num_detections),
+                                       -detected_scores, detected_class_labels))
+    sorted_position = np.empty(num_detections, dtype=int)
+    sorted_position[order] = np.arange(num_detections)
+    is_class_correctly_detected_in_image[has_detections] = is_matched[
+        sorted_position[first_in_input_order[
+            class_starts[:-1][has_detections]]]]
+
+    is_selected = self._select_detections_per_class(boxes, scores,
+                                                    class_starts)
+    is_matched &= is_selected
+    groundtruth_is_difficult_lists = groundtruth_is_difficult_lists.astype(bool)
+    is_matched_to_difficult_box = np.logical_and(
+        is_matched, groundtruth_is_difficult_lists[max_overlap_gt_ids]
+        if groundtruth_boxes.size else False)
+    candidate_ids = np.where(
+        np.logical_and(is_matched, ~is_matched_to_difficult_box))[0]
+    # The first (highest scoring) detection matched to a box detects it.
+    _, first_match = np.unique(max_overlap_gt_ids[candidate_ids],
+                               return_index=True)
+    tp_fp_labels = np.zeros(num_detections, dtype=bool)
+    tp_fp_labels[candidate_ids[first_match]] = True
+
+    is_kept = np.logical_and(is_selected, ~is_matched_to_difficult_box)
+    result_scores = []
+    result_tp_fp_labels = []
+    for start, end in zip(class_starts[:-1], class_starts[1:]):
+      is_kept_at_class = is_kept[start:end]
+      result_scores.append(scores[start:end][is_kept_at_class])
+      result_tp_fp_labels.append(tp_fp_labels[start:end][is_kept_at_class])
+    return (result_scores, result_tp_fp_labels,
+            is_class_correctly_detected_in_image)
+
+  def _compute_max_overlaps_per_class(self, detected_boxes,
+                                      detected_class_labels, groundtruth_boxes,
+                                      groundtruth_class_labels):
+    """Finds the ground truth box of the same class overlapping most.
+
+    IOU is only computed for (detection, ground truth) pairs of the same class.
+    The pairs of all detections are laid out in one flat array, grouped by
+    detection, and reduced with segment-wise maxima.
+
+    Args:
+      detected_boxes: A numpy array of shape [N, 4] of detected boxes.
+      detected_class_labels: A 1-d integer numpy array of length N.
+      groundtruth_boxes: A numpy array of shape [M, 4] of ground truth boxes.
+      groundtruth_class_labels: A 1-d integer numpy array of length M.
+
+    Returns:
+      max_overlaps: A float numpy array of length N with the largest IOU, or -1
+          for detections of classes without ground truth.
+      max_overlap_gt_ids: An integer numpy array of length N with the index of
+          the first ground truth box reaching that IOU, or 0 if there is none.
+    """
+    num_detections = detected_boxes.shape[0]
+    max_overlaps = np.full(num_detections, -1.0)
+    max_overlap_gt_ids = np.zeros(num_detections, dtype=int)
+    if not num_detections or not groundtruth_boxes.size:
+      return max_overlaps, max_overlap_gt_ids
+
+    gt_order = np.argsort(groundtruth_class_labels, kind='mergesort')
+    gt_class_starts = np.searchsorted(
+        groundtruth_class_labels[gt_order],
+        np.arange(self.num_groundtruth_classes + 1))
+    num_pairs = np.diff(gt_class_starts)[detected_class_labels]
+    pair_detection_ids = np.repeat(np.arange(num_detections), num_pairs)
+    pair_starts = np.cumsum(num_pairs) - num_pairs
+    pair_gt_ids = gt_order[
+        np.repeat(gt_class_starts[detected_class_labels] - pair_starts,
+                  num_pairs) + np.arange(pair_detection_ids.size)]
+    if not pair_gt_ids.size:
+      return max_overlaps, max_overlap_gt_ids
+
+    pair_detected_boxes = detected_boxes[pair_detection_ids]
+    pair_groundtruth_boxes = groundtruth_boxes[pair_gt_ids]
+    intersect = (
+        np.maximum(np.minimum(pair_detected_boxes[:, 2],
+                              pair_groundtruth_boxes[:, 2]) -
+                   np.maximum(pair_detected_boxes[:, 0],
+                              pair_groundtruth_boxes[:, 0]), 0.0) *
+        np.maximum(np.minimum(pair_detected_boxes[:, 3],
+                              pair_groundtruth_boxes[:, 3]) -
+                   np.maximum(pair_detected_boxes[:, 1],
+                              pair_groundtruth_boxes[:, 1]), 0.0))
+    union = (np_box_ops.area(pair_detected_boxes) +
+             np_box_ops.area(pair_groundtruth_boxes) - intersect)
+    pair_iou = intersect / union
+
+    has_pairs = num_pairs > 0
+    segment_starts = pair_starts[has_pairs]
+    segment_max = np.maximum.reduceat(pair_iou, segment_starts)
+    # First pair of every segment reaching the maximum, as np.argmax would.
+    is_max = pair_iou == np.repeat(segment_max, num_pairs[has_pairs])
+    first_max = np.minimum.reduceat(
+        np.where(is_max, np.arange(pair_iou.size), pair_iou.size),
+        segment_starts)
+    first_max = np.where(first_max < pair_iou.size, first_max, segment_starts)
+    max_overlaps[has_pairs] = segment_max
+    max_overlap_gt_ids[has_pairs] = pair_gt_ids[first_max]
+    return max_overlaps, max_overlap_gt_ids
+
+  def _sort_detections_by_class_and_score(self, detected_scores,
+                                         detected_class_labels):
+    """Orders detections by class, then by descending score.
+
+    Within a class, equal scores are ordered exactly as the per-class path
+    orders them (np_box_list_ops.non_max_suppression sorts the detections
+    passing its score threshold with sort_by_field), so that NMS and matching
+    pick the same detections. Detections failing the threshold come last.
+
+    Args:
+      detected_scores: A 1-d numpy array of length N of detection scores.
+      detected_class_labels: A 1-d integer numpy array of length N.
+
+    Returns:
+      order: A 1-d integer numpy array of length N.
+    """
+    class_order = np.argsort(detected_class_labels, kind='mergesort')
+    sorted_classes = detected_class_labels[class_order]
+    boundaries = np.flatnonzero(np.diff(sorted_classes)) + 1
+    order = []
+    for class_indices in np.split(class_order, boundaries):
+      class_scores = detected_scores[class_indices]
+      is_valid = class_scores > _NMS_SCORE_THRESHOLD
+      valid_indices = class_indices[is_valid]
+      order.append(valid_indices[np.argsort(class_scores[is_valid])[::-1]])
+      order.append(class_indices[~is_valid])
+    if not order:
+      return np.zeros(0, dtype=int)
+    return np.concatenate(order)
+
+  def _select_detections_per_class(self, boxes, scores, class_starts):
+    """Returns a boolean mask of the detections surviving per-class NMS.
+
+    Args:
+      boxes: A numpy array of shape [N, 4] grouped by class and sorted by
+          descending score within each class.
+      scores: A 1-d numpy array of length N with the corresponding scores.
+      class_starts: A 1-d numpy array of length C + 1 with the start of every
+          class group, followed by N.
+
+    Returns:
+      is_selected: A boolean numpy array of length N.
+    """
+    is_selected = scores > _NMS_SCORE_THRESHOLD
+    if self.nms_iou_threshold == 1.0:
+      # NMS is disabled, only keep the top scoring boxes of every class.
+      rank = np.arange(scores.size) - np.repeat(class_starts[:-1],
+                                                np.diff(class_starts))
+      return np.logical_and(is_selected, rank < self.nms_max_output_boxes)
+    is_nms_selected = np.zeros_like(is_selected)
+    for start, end in zip(class_starts[:-1], class_starts[1:]):
+      if start == end:
+        continue
+      class_indices = start + np.where(is_selected[start:end])[0]
+      selected = np_box_nms.non_max_suppression_sorted(
+          boxes[class_indices], self.nms_max_output_boxes,
+          self.nms_iou_threshold)
+      is_nms_selected[class_indices[selected]] = True
+    return is_nms_selected
+
   def _compute_cor_loc(self, detected_boxes, detected_scores,
                        detected_class_labels, groundtruth_boxes,
                        groundtruth_class_labels):
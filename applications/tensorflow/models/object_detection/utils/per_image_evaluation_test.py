@@ -208,5 +208,65 @@ class CorLocTest(tf.test.TestCase):
                                    is_class_correctly_detected_in_image))
 
 
+class VectorizedMatchingTest(tf.test.TestCase):
+
+  def setUp(self):
+    self.detected_boxes = np.array([[0, 0, 1, 1], [0, 0, 1.1, 1], [0, 0, 2, 2],
+                                    [0, 0, 10, 10], [5, 5, 6, 6], [0, 0, 3, 3],
+                                    [0, 0, 3, 3.1], [0, 0, 9, 10]],
+                                   dtype=float)
+    self.detected_scores = np.array([0.6, 0.8, 0.5, 0.7, 0.4, 0.9, 0.9, 0.3],
+                                    dtype=float)
+    self.detected_class_labels = np.array([0, 0, 0, 0, 1, 2, 2, 0], dtype=int)
+    self.groundtruth_boxes = np.array([[0, 0, 1, 1], [0, 0, 10, 10],
+                                       [0, 0, 3, 3], [5, 5, 6, 6]],
+                                      dtype=float)
+    self.groundtruth_class_labels = np.array([0, 0, 2, 2], dtype=int)
+    self.groundtruth_is_difficult_list = np.array([False, True, False, False],
+                                                  dtype=bool)
+
+  def _compute_metrics(self, use_vectorized_matching, nms_iou_threshold):
+    per_image_eval = per_image_evaluation.PerImageEvaluation(
+        3, 0.5, nms_iou_threshold, 10000, use_vectorized_matching)
+    return per_image_eval.compute_object_detection_metrics(
+        self.detected_boxes, self.detected_scores, self.detected_class_labels,
+        self.groundtruth_boxes, self.groundtruth_class_labels,
+        self.groundtruth_is_difficult_list)
+
+  def test_tp_fp_with_difficult_boxes(self):
+    scores, tp_fp_labels, is_class_correctly_detected_in_image = (
+        self._compute_metrics(True, 1.0))
+    expected_scores = [np.array([0.8, 0.6, 0.5], dtype=float),
+                       np.array([0.4], dtype=float),
+                       np.array([0.9, 0.9], dtype=float)]
+    expected_tp_fp_labels = [np.array([True, False, False]),
+                             np.array([False]),
+                             np.array([True, False])]
+    for i in range(3):
+      self.assertAllClose(expected_scores[i], scores[i])
+      self.assertAllEqual(expected_tp_fp_labels[i], tp_fp_labels[i])
+    self.assertAllEqual([1, 0, 1], is_class_correctly_detected_in_image)
+
+  def test_matches_per_class_matching(self):
+    for nms_iou_threshold in [1.0, 0.5]:
+      expected = self._compute_metrics(False, nms_iou_threshold)
+      actual = self._compute_metrics(True, nms_iou_threshold)
+      for i in range(3):
+        self.assertAllClose(expected[0][i], actual[0][i])
+        self.assertAllEqual(expected[1][i], actual[1][i])
+      self.assertAllEqual(expected[2], actual[2])
+
+  def test_no_groundtruth(self):
+    per_image_eval = per_image_evaluation.PerImageEvaluation(3, 0.5, 1.0, 2)
+    scores, tp_fp_labels, is_class_correctly_detected_in_image = (
+        per_image_eval.compute_object_detection_metrics(
+            self.detected_boxes, self.detected_scores,
+            self.detected_class_labels, np.zeros([0, 4], dtype=float),
+            np.array([], dtype=int), np.array([], dtype=bool)))
+    self.assertAllClose([0.8, 0.7], scores[0])
+    self.assertAllEqual([False, False], tp_fp_labels[0])
+    self.assertAllEqual([0, 0, 0], is_class_correctly_detected_in_image)
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,165 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Parallel conversion of annotated images to sharded TFRecord files.
+
+Used by the dataset conversion scripts, e.g. create_pascal_tf_record.py:
+
+  annotations = tf_record_creation_util.read_annotations(xml_paths,
+                                                         num_workers)
+  tf_record_creation_util.write_sharded_tf_records(
+      output_path, annotations, create_tf_example, image_path_fn,
+      config, num_shards, num_workers)
+
+Annotation files are parsed in worker processes, and every worker process
+converts and writes whole output shards. Annotations are assigned to shards by
+a hash of their path and keep their input order within a shard, so the output
+does not depend on the number of workers. With a single shard it is written in
+input order to output_path itself.
+
+Each shard is written with a slim ShardWriter, so rerunning a conversion only
+rewrites the shards whose annotations, images or config changed.
+"""
+
+import logging
+import multiprocessing
+
+from lxml import etree
+import tensorflow as tf
+
+from datasets import shard_writer
+from object_detection.utils import dataset_util
+
+# Number of annotation files sent to a worker process at once.
+_PARSE_CHUNK_SIZE = 64
+
+
+def _read_annotation(path):
+  with tf.gfile.GFile(path, 'r') as fid:
+    xml_str = fid.read()
+  xml = etree.fromstring(xml_str)
+  return dataset_util.recursive_parse_xml_to_dict(xml)['annotation']
+
+
+def _map(fn, items, num_workers, chunksize=1):
+  """Yields fn(item) in order, in num_workers processes if num_workers > 0."""
+  if num_workers <= 0 or len(items) <= 1:
+    for item in items:
+      yield fn(item)
+    return
+  pool = multiprocessing.Pool(min(num_workers, len(items)))
+  try:
+    for result in pool.imap(fn, items, chunksize):
+      yield result
+  finally:
+    pool.terminate()
+
+
+def read_annotations(paths, num_workers=0):
+  """Parses PASCAL style XML annotation files.
+
+  Args:
+    paths: list of paths of XML annotation files.
+    num_workers: number of worker processes to parse the files in. With 0 they
+      are parsed in the calling process.
+
+  Returns:
+    A list of (path, data) pairs in the order of paths, where data is the dict
+    holding the fields of the <annotation> element, as returned by
+    dataset_util.recursive_parse_xml_to_dict.
+  """
+  data = _map(_read_annotation, paths, num_workers, _PARSE_CHUNK_SIZE)
+  return list(zip(paths, list(data)))
+
+
+def shard_filenames(output_path, num_shards):
+  """Returns the TFRecord file names of a conversion with num_shards shards.
+
+  Args:
+    output_path: path of the output, e.g. /tmp/pascal_train.record.
+    num_shards: number of shards.
+
+  Returns:
+    [output_path] for a single shard, else the paths of the shards,
+    e.g. /tmp/pascal_train.record-00002-of-00010.
+  """
+  if num_shards == 1:
+    return [output_path]
+  return ['%s-%.5d-of-%.5d' % (output_path, shard, num_shards)
+          for shard in range(num_shards)]
+
+
+def _write_shard(args):
+  """Converts the annotations of one shard and writes them, in a worker."""
+  (output_path, annotations, input_paths, create_tf_example, config) = args
+  shard = shard_writer.ShardWriter(output_path, input_paths, config)
+  if shard.is_current():
+    return output_path, 0, True
+  with shard as writer:
+    for _, data in annotations:
+      tf_example = create_tf_example(data)
+      writer.write(tf_example.SerializeToString())
+  return output_path, len(annotations), False
+
+
+def write_sharded_tf_records(output_path,
+                             annotations,
+                             create_tf_example,
+                             image_path_fn,
+                             config='',
+                             num_shards=1,
+                             num_workers=0):
+  """Converts annotations to tf.Examples and writes them as TFRecord shards.
+
+  Args:
+    output_path: path of the output, see shard_filenames.
+    annotations: list of (annotation path, data) pairs as returned by
+      read_annotations.
+    create_tf_example: function from an annotation data dict to a
+      tf.train.Example. With num_workers > 0 it has to be picklable, e.g. a
+      functools.partial of a module level function.
+    image_path_fn: function from an annotation data dict to the path of its
+      image, used to detect changed images.
+    config: string with the other settings the examples depend on, e.g. the
+      label map. Shards are rewritten when it changes.
+    num_shards: number of output shards.
+    num_workers: number of worker processes that convert and write shards
+      concurrently. With 0 the shards are written in the calling process.
+
+  Returns:
+    The list of the shard file names.
+  """
+  output_paths = shard_filenames(output_path, num_shards)
+  partitions = shard_writer.stable_partition(
+      [path for path, _ in annotations], num_shards)
+  tasks = []
+  for shard_path, partition in zip(output_paths, partitions):
+    shard_annotations = [annotations[i] for i in sorted(partition)]
+    input_paths = []
+    for path, data in shard_annotations:
+      input_paths.append(path)
+      input_paths.append(image_path_fn(data))
+    tasks.append((shard_path, shard_annotations, input_paths,
+                  create_tf_example, config))
+
+  logging.info('Writing %d annotations to %d shards with %d workers.',
+               len(annotations), num_shards, num_workers)
+  for shard_path, num_written, skipped in _map(_write_shard, tasks,
+                                               num_workers):
+    if skipped:
+      logging.info('%s is up to date.', shard_path)
+    else:
+      logging.info('Wrote %d examples to %s.', num_written, shard_path)
+  return output_paths
@@ -0,0 +1,91 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for object_detection.utils.tf_record_creation_util."""
+
+import os
+import tensorflow as tf
+
+from object_detection.utils import dataset_util
+from object_detection.utils import tf_record_creation_util
+
+
+def _create_tf_example(data):
+  return tf.train.Example(features=tf.train.Features(feature={
+      'image/filename': dataset_util.bytes_feature(data['filename']),
+  }))
+
+
+class TfRecordCreationUtilTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._dir = self.get_temp_dir()
+    self._annotation_paths = []
+    for i in range(20):
+      path = os.path.join(self._dir, 'image%d.xml' % i)
+      with tf.gfile.GFile(path, 'w') as f:
+        f.write('<annotation><folder>images</folder>'
+                '<filename>image%d.jpg</filename></annotation>' % i)
+      with tf.gfile.GFile(self._image_path({'filename': 'image%d.jpg' % i}),
+                          'w') as f:
+        f.write('image %d' % i)
+      self._annotation_paths.append(path)
+
+  def _image_path(self, data):
+    return os.path.join(self._dir, data['filename'])
+
+  def _write(self, name, num_shards, num_workers):
+    annotations = tf_record_creation_util.read_annotations(
+        self._annotation_paths, num_workers)
+    output_paths = tf_record_creation_util.write_sharded_tf_records(
+        os.path.join(self._dir, name), annotations, _create_tf_example,
+        self._image_path, num_shards=num_shards, num_workers=num_workers)
+    return [list(tf.python_io.tf_record_iterator(path))
+            for path in output_paths]
+
+  def test_read_annotations(self):
+    annotations = tf_record_creation_util.read_annotations(
+        self._annotation_paths[:2], num_workers=2)
+    self.assertEqual(annotations, [
+        (self._annotation_paths[0],
+         {'folder': 'images', 'filename': 'image0.jpg'}),
+        (self._annotation_paths[1],
+         {'folder': 'images', 'filename': 'image1.jpg'})])
+
+  def test_single_shard_keeps_input_order(self):
+    records = self._write('single.record', num_shards=1, num_workers=0)
+    self.assertEqual(len(records), 1)
+    self.assertEqual(records[0], [
+        _create_tf_example({'filename': 'image%d.jpg' % i}).SerializeToString()
+        for i in range(20)])
+
+  def test_output_does_not_depend_on_num_workers(self):
+    serial = self._write('serial.record', num_shards=4, num_workers=0)
+    parallel = self._write('parallel.record', num_shards=4, num_workers=3)
+    self.assertEqual(serial, parallel)
+    self.assertEqual(sorted(sum(serial, [])),
+                     sorted(self._write('single.record', 1, 0)[0]))
+
+  def test_shard_filenames(self):
+    self.assertEqual(
+        tf_record_creation_util.shard_filenames('/tmp/out.record', 1),
+        ['/tmp/out.record'])
+    self.assertEqual(
+        tf_record_creation_util.shard_filenames('/tmp/out.record', 2),
+        ['/tmp/out.record-00000-of-00002', '/tmp/out.record-00001-of-00002'])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -24,6 +24,11 @@ Example usage:
   manager.load_model(model_config_2, vocabulary_file_2, embedding_matrix_file_2,
                      checkpoint_path_2)
   encodings = manager.encode(data)
+
+With EncoderManager(parallel=True) the input is tokenized once for all models
+and the models run concurrently, each in its own thread. With cache_size > 0
+the manager keeps the encodings of the most recently encoded sentences and
+only runs the models on sentences it has not seen.
 """
 
 from __future__ import absolute_import
@@ -31,7 +36,7 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
-
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 import tensorflow as tf
@@ -42,9 +47,23 @@ from skip_thoughts import skip_thoughts_encoder
 class EncoderManager(object):
   """Manager class for loading and encoding with skip-thoughts models."""
 
-  def __init__(self):
+  def __init__(self, parallel=False, cache_size=0):
+    """Initializes the manager.
+
+    Args:
+      parallel: If True, tokenize the input once and share the words between
+        the models, and run the models concurrently in a thread pool.
+      cache_size: Number of sentence encodings to keep in a least recently
+        used cache. 0 disables the cache.
+    """
     self.encoders = []
     self.sessions = []
+    self._parallel = parallel
+    self._pool = None
+    self._cache_size = cache_size
+    # Maps (sentence, use_norm, use_eos) to the concatenated encodings, least
+    # recently used first.
+    self._cache = collections.OrderedDict()
 
   def load_model(self, model_config, vocabulary_file, embedding_matrix_file,
                  checkpoint_path):
@@ -79,22 +98,69 @@ class EncoderManager(object):
 
     g = tf.Graph()
     with g.as_default():
-      encoder = skip_thoughts_encoder.SkipThoughtsEncoder(word_embeddings)
+      encoder = skip_thoughts_encoder.SkipThoughtsEncoder(
+          word_embeddings, embedding_matrix=embedding_matrix)
       restore_model = encoder.build_graph_from_config(model_config,
                                                       checkpoint_path)
 
     sess = tf.Session(graph=g)
     restore_model(sess)
 
+    self._add_encoder(encoder, sess)
+
+  def _add_encoder(self, encoder, sess):
+    """Adds a loaded encoder and the Session running its graph."""
     self.encoders.append(encoder)
     self.sessions.append(sess)
+    # Cached encodings are concatenations over all models.
+    self._cache.clear()
+    if self._pool is not None:
+      self._pool.close()
+      self._pool = None
+
+  def _encode_all(self, data, use_norm, verbose, batch_size, use_eos,
+                  bucket_by_length):
+    """Encodes data with every model and concatenates the encodings."""
+    if not data:
+      dim = sum(
+          sess.graph.get_tensor_by_name("encoder/thought_vectors:0")
+          .get_shape()[1].value for sess in self.sessions)
+      return np.zeros((0, dim), dtype=np.float32)
+
+    tokenized = self._parallel
+    if tokenized:
+      data = self.encoders[0].tokenize(data)
+
+    def _encode(encoder_and_sess):
+      encoder, sess = encoder_and_sess
+      return np.array(
+          encoder.encode(
+              sess,
+              data,
+              use_norm=use_norm,
+              verbose=verbose,
+              batch_size=batch_size,
+              use_eos=use_eos,
+              bucket_by_length=bucket_by_length,
+              tokenized=tokenized))
+
+    models = list(zip(self.encoders, self.sessions))
+    if self._parallel and len(models) > 1:
+      if self._pool is None:
+        self._pool = ThreadPool(len(models))
+      encoded = self._pool.map(_encode, models)
+    else:
+      encoded = [_encode(model) for model in models]
+
+    return np.concatenate(encoded, axis=1)
 
   def encode(self,
              data,
              use_norm=True,
              verbose=False,
              batch_size=128,
-             use_eos=False):
+             use_eos=False,
+             bucket_by_length=False):
     """Encodes a sequence of sentences as skip-thought vectors.
 
     Args:
@@ -103,6 +169,8 @@ class EncoderManager(object):
       verbose: Whether to log every batch.
       batch_size: Batch size for the RNN encoders.
       use_eos: If True, append the end-of-sentence word to each input sentence.
+      bucket_by_length: If True, batch sentences of similar length together to
+        reduce padding. The output is still in input order.
 
     Returns:
       thought_vectors: A list of numpy arrays corresponding to 'data'.
@@ -114,21 +182,41 @@ class EncoderManager(object):
       raise ValueError(
           "Must call load_model at least once before calling encode.")
 
-    encoded = []
-    for encoder, sess in zip(self.encoders, self.sessions):
-      encoded.append(
-          np.array(
-              encoder.encode(
-                  sess,
-                  data,
-                  use_norm=use_norm,
-                  verbose=verbose,
-                  batch_size=batch_size,
-                  use_eos=use_eos)))
-
-    return np.concatenate(encoded, axis=1)
+    if not self._cache_size or not data:
+      return self._encode_all(data, use_norm, verbose, batch_size, use_eos,
+                              bucket_by_length)
+
+    keys = [(item, use_norm, use_eos) for item in data]
+    # Encode every sentence that is not cached once.
+    missing = list(collections.OrderedDict(
+        (key, None) for key in keys if key not in self._cache))
+    if missing:
+      encoded = self._encode_all([key[0] for key in missing], use_norm,
+                                 verbose, batch_size, use_eos,
+                                 bucket_by_length)
+      # Copy the rows, so that the cache does not keep all of encoded alive.
+      new_encodings = dict(
+          (key, vector.copy()) for key, vector in zip(missing, encoded))
+    else:
+      new_encodings = {}
+
+    thought_vectors = []
+    for key in keys:
+      if key in new_encodings:
+        vector = new_encodings[key]
+      else:
+        vector = self._cache.pop(key)
+      self._cache[key] = vector
+      thought_vectors.append(vector)
+    while len(self._cache) > self._cache_size:
+      self._cache.popitem(last=False)
+
+    return np.array(thought_vectors)
 
   def close(self):
-    """Closes the active TensorFlow Sessions."""
+    """Closes the active TensorFlow Sessions and the thread pool."""
     for sess in self.sessions:
       sess.close()
+    if self._pool is not None:
+      self._pool.close()
+      self._pool = None
@@ -0,0 +1,157 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for tensorflow_models.skip_thoughts.encoder_manager."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import zlib
+
+import numpy as np
+import tensorflow as tf
+
+from skip_thoughts import encoder_manager
+
+
+class FakeSession(object):
+  """Stands in for a Session, only holding a graph with the encoder output."""
+
+  def __init__(self, thought_dim):
+    self.graph = tf.Graph()
+    with self.graph.as_default():
+      tf.placeholder(tf.float32, (None, thought_dim),
+                     name="encoder/thought_vectors")
+
+  def close(self):
+    pass
+
+
+class FakeEncoder(object):
+  """Stands in for a SkipThoughtsEncoder, recording what it encodes.
+
+  The encoding of a sentence is a pseudo random function of its words and the
+  encoder's seed.
+  """
+
+  def __init__(self, thought_dim, seed):
+    self._thought_dim = thought_dim
+    self._seed = seed
+    self.num_tokenized = 0
+    self.encoded = []
+
+  def tokenize(self, data):
+    self.num_tokenized += len(data)
+    return [item.split() for item in data]
+
+  def encode(self, sess, data, use_norm=True, verbose=True, batch_size=128,
+             use_eos=False, bucket_by_length=False, tokenized=False):
+    del sess, verbose, batch_size, bucket_by_length  # Unused.
+    if not tokenized:
+      data = self.tokenize(data)
+    thought_vectors = []
+    for words in data:
+      if use_eos:
+        words = words + ["</S>"]
+      self.encoded.append(" ".join(words))
+      seed = zlib.crc32(" ".join(words).encode("utf-8")) + self._seed
+      vector = np.random.RandomState(seed % (1 << 31)).randn(self._thought_dim)
+      if use_norm:
+        vector /= np.linalg.norm(vector)
+      thought_vectors.append(vector.astype(np.float32))
+    return thought_vectors
+
+
+class EncoderManagerTest(tf.test.TestCase):
+
+  def _manager(self, **kwargs):
+    manager = encoder_manager.EncoderManager(**kwargs)
+    for thought_dim, seed in [(3, 0), (4, 1)]:
+      manager._add_encoder(FakeEncoder(thought_dim, seed),
+                           FakeSession(thought_dim))
+    return manager
+
+  def _expected(self, data, **kwargs):
+    return self._manager().encode(data, **kwargs)
+
+  def _num_encoded(self, manager):
+    return [len(encoder.encoded) for encoder in manager.encoders]
+
+  def testConcatenatesEncoders(self):
+    manager = self._manager()
+    thought_vectors = manager.encode(["a b", "c"])
+    self.assertEqual(thought_vectors.shape, (2, 7))
+    self.assertAllClose(
+        thought_vectors[:, :3],
+        manager.encoders[0].encode(None, ["a b", "c"]))
+
+  def testParallelMatchesSerial(self):
+    data = ["sentence %d" % i for i in range(20)]
+    manager = self._manager(parallel=True)
+    self.assertAllClose(manager.encode(data), self._expected(data))
+    # The input is tokenized once for both models.
+    self.assertEqual(
+        [encoder.num_tokenized for encoder in manager.encoders], [20, 0])
+    manager.close()
+
+  def testCacheEncodesEachNewSentenceOnce(self):
+    manager = self._manager(cache_size=10)
+    data = ["a", "b", "a", "c", "b"]
+    self.assertAllClose(manager.encode(data), self._expected(data))
+    self.assertEqual(self._num_encoded(manager), [3, 3])
+
+    # Cached and new sentences are returned in input order.
+    data = ["c", "d", "a"]
+    self.assertAllClose(manager.encode(data), self._expected(data))
+    self.assertEqual(manager.encoders[0].encoded, ["a", "b", "c", "d"])
+
+  def testCacheIsKeyedByOptions(self):
+    manager = self._manager(cache_size=10)
+    manager.encode(["a"])
+    manager.encode(["a"], use_norm=False)
+    manager.encode(["a"], use_eos=True)
+    manager.encode(["a"], use_norm=False)
+    self.assertEqual(self._num_encoded(manager), [3, 3])
+    self.assertAllClose(manager.encode(["a"], use_norm=False),
+                        self._expected(["a"], use_norm=False))
+
+  def testCacheEvictsLeastRecentlyUsed(self):
+    manager = self._manager(cache_size=2)
+    manager.encode(["a", "b"])
+    manager.encode(["a"])
+    manager.encode(["c"])
+    # "b" was the least recently used sentence.
+    manager.encode(["a", "c"])
+    self.assertEqual(self._num_encoded(manager), [3, 3])
+    manager.encode(["b"])
+    self.assertEqual(self._num_encoded(manager), [4, 4])
+
+  def testAddingModelClearsCache(self):
+    manager = self._manager(cache_size=10)
+    manager.encode(["a"])
+    manager._add_encoder(FakeEncoder(5, 2), FakeSession(5))
+    thought_vectors = manager.encode(["a"])
+    self.assertEqual(thought_vectors.shape, (1, 12))
+    self.assertEqual(self._num_encoded(manager), [2, 2, 1])
+
+  def testEmptyInput(self):
+    for kwargs in [{}, {"cache_size": 10}, {"parallel": True}]:
+      manager = self._manager(**kwargs)
+      self.assertEqual(manager.encode([]).shape, (0, 7))
+      manager.close()
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -91,17 +91,48 @@ def _batch_and_pad(sequences):
   return np.array(batch_embeddings), np.array(batch_mask)
 
 
+def _length_sorted_batches(lengths, batch_size):
+  """Groups sequences of similar length into batches.
+
+  Args:
+    lengths: A list of sequence lengths.
+    batch_size: Maximum number of sequences per batch.
+
+  Returns:
+    A list of int arrays of indices into lengths, each with at most batch_size
+    sequences. Sequences are sorted by length, so every batch only needs
+    padding up to the length of its own longest sequence.
+  """
+  order = np.argsort(lengths, kind="mergesort")
+  return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
 class SkipThoughtsEncoder(object):
   """Skip-thoughts sentence encoder."""
 
-  def __init__(self, embeddings):
+  def __init__(self, embeddings, embedding_matrix=None):
     """Initializes the encoder.
 
     Args:
       embeddings: Dictionary of word to embedding vector (1D numpy array).
+      embedding_matrix: Optional [num_words, emb_dim] numpy array whose rows
+        are the vectors of embeddings, in the iteration order of embeddings.
+        Used by the bucket_by_length mode of encode(), which otherwise builds
+        its own copy of the vectors.
+
+    Raises:
+      ValueError: If embedding_matrix and embeddings have different sizes.
     """
-    self._sentence_detector = nltk.data.load("tokenizers/punkt/english.pickle")
+    if embedding_matrix is not None and len(embedding_matrix) != len(
+        embeddings):
+      raise ValueError("Expected %d rows in embedding_matrix, got %d" %
+                       (len(embeddings), len(embedding_matrix)))
+    # Loaded on first use.
+    self._sentence_detector = None
     self._embeddings = embeddings
+    self._embedding_matrix = embedding_matrix
+    # Built on first use by the bucket_by_length mode of encode().
+    self._word_ids = None
 
   def _create_restore_fn(self, checkpoint_path, saver):
     """Creates a function that restores a model from checkpoint.
@@ -184,22 +215,41 @@ class SkipThoughtsEncoder(object):
 
   def _tokenize(self, item):
     """Tokenizes an input string into a list of words."""
+    if self._sentence_detector is None:
+      self._sentence_detector = nltk.data.load(
+          "tokenizers/punkt/english.pickle")
     tokenized = []
     for s in self._sentence_detector.tokenize(item):
       tokenized.extend(nltk.tokenize.word_tokenize(s))
 
     return tokenized
 
+  def tokenize(self, data):
+    """Tokenizes a list of input strings into lists of words.
+
+    The result can be passed to encode() with tokenized=True, e.g. to
+    tokenize once for several encoders.
+    """
+    return [self._tokenize(item) for item in data]
+
+  def _words(self, item, tokenized, use_eos):
+    """Returns the words of an input string, or a copy of a list of words."""
+    words = list(item) if tokenized else self._tokenize(item)
+    if use_eos:
+      words.append(special_words.EOS)
+    return words
+
   def _word_to_embedding(self, w):
     """Returns the embedding of a word."""
     return self._embeddings.get(w, self._embeddings[special_words.UNK])
 
-  def _preprocess(self, data, use_eos):
+  def _preprocess(self, data, use_eos, tokenized=False):
     """Preprocesses text for the encoder.
 
     Args:
       data: A list of input strings.
       use_eos: Whether to append the end-of-sentence word to each sentence.
+      tokenized: Whether data holds lists of words instead of strings.
 
     Returns:
       embeddings: A list of word embedding sequences corresponding to the input
@@ -207,35 +257,132 @@ class SkipThoughtsEncoder(object):
     """
     preprocessed_data = []
     for item in data:
-      tokenized = self._tokenize(item)
-      if use_eos:
-        tokenized.append(special_words.EOS)
-      preprocessed_data.append([self._word_to_embedding(w) for w in tokenized])
+      words = self._words(item, tokenized, use_eos)
+      preprocessed_data.append([self._word_to_embedding(w) for w in words])
+    return preprocessed_data
+
+  def _build_embedding_matrix(self):
+    """Builds the word to id map and, if needed, the embedding matrix."""
+    if self._word_ids is not None:
+      return
+    words = list(self._embeddings.keys())
+    self._word_ids = dict((w, i) for i, w in enumerate(words))
+    if self._embedding_matrix is None:
+      self._embedding_matrix = np.array([self._embeddings[w] for w in words])
+
+  def _preprocess_ids(self, data, use_eos, tokenized=False):
+    """Preprocesses text into word ids for the encoder.
+
+    Args:
+      data: A list of input strings.
+      use_eos: Whether to append the end-of-sentence word to each sentence.
+      tokenized: Whether data holds lists of words instead of strings.
+
+    Returns:
+      ids: A list of int arrays of word ids corresponding to the input
+        strings.
+    """
+    self._build_embedding_matrix()
+    unk_id = self._word_ids[special_words.UNK]
+    preprocessed_data = []
+    for item in data:
+      words = self._words(item, tokenized, use_eos)
+      preprocessed_data.append(np.array(
+          [self._word_ids.get(w, unk_id) for w in words], dtype=np.int64))
     return preprocessed_data
 
+  def _encode_bucketed(self, sess, data, verbose, batch_size, use_eos,
+                       tokenized):
+    """Encodes sentences in batches of similar length.
+
+    Args:
+      sess: TensorFlow Session.
+      data: A list of input strings.
+      verbose: Whether to log every batch.
+      batch_size: Batch size for the encoder.
+      use_eos: Whether to append the end-of-sentence word to each input
+        sentence.
+      tokenized: Whether data holds lists of words instead of strings.
+
+    Returns:
+      thought_vectors: A numpy array with the skip-thought encodings of the
+        sentences in 'data', in input order.
+
+    Raises:
+      ValueError: If a sentence has no words.
+    """
+    data = self._preprocess_ids(data, use_eos, tokenized)
+    if not data:
+      return np.zeros((0, 0), dtype=np.float32)
+    lengths = [len(ids) for ids in data]
+    if min(lengths) <= 0:
+      raise ValueError("Expected 0 < len(seq), got an empty sentence")
+
+    thought_vectors = None
+    batches = _length_sorted_batches(lengths, batch_size)
+    for batch, indices in enumerate(batches):
+      if verbose:
+        tf.logging.info("Batch %d / %d.", batch, len(batches))
+
+      batch_len = lengths[indices[-1]]
+      ids = np.zeros((len(indices), batch_len), dtype=np.int64)
+      mask = np.zeros((len(indices), batch_len), dtype=np.int8)
+      for row, i in enumerate(indices):
+        ids[row, :lengths[i]] = data[i]
+        mask[row, :lengths[i]] = 1
+      embeddings = np.take(self._embedding_matrix, ids, axis=0)
+      # Zero the padding, like _batch_and_pad does.
+      embeddings[mask == 0] = 0
+      feed_dict = {
+          "encode_emb:0": embeddings,
+          "encode_mask:0": mask,
+      }
+      batch_vectors = sess.run("encoder/thought_vectors:0", feed_dict=feed_dict)
+      if thought_vectors is None:
+        thought_vectors = np.empty((len(data), batch_vectors.shape[1]),
+                                   dtype=batch_vectors.dtype)
+      thought_vectors[indices] = batch_vectors
+
+    return thought_vectors
+
   def encode(self,
              sess,
              data,
              use_norm=True,
              verbose=True,
              batch_size=128,
-             use_eos=False):
+             use_eos=False,
+             bucket_by_length=False,
+             tokenized=False):
     """Encodes a sequence of sentences as skip-thought vectors.
 
     Args:
       sess: TensorFlow Session.
-      data: A list of input strings.
+      data: A list of input strings, or of lists of words if tokenized is True.
       use_norm: Whether to normalize skip-thought vectors to unit L2 norm.
       verbose: Whether to log every batch.
       batch_size: Batch size for the encoder.
       use_eos: Whether to append the end-of-sentence word to each input
         sentence.
+      bucket_by_length: Whether to batch sentences of similar length together
+        instead of in input order, which reduces padding. The encodings are
+        still returned in input order.
+      tokenized: Whether data holds lists of words as returned by tokenize()
+        instead of strings.
 
     Returns:
       thought_vectors: A list of numpy arrays corresponding to the skip-thought
         encodings of sentences in 'data'.
     """
-    data = self._preprocess(data, use_eos)
+    if bucket_by_length:
+      thought_vectors = self._encode_bucketed(sess, data, verbose, batch_size,
+                                              use_eos, tokenized)
+      if use_norm:
+        thought_vectors /= np.linalg.norm(thought_vectors, axis=1,
+                                          keepdims=True)
+      return list(thought_vectors)
+
+    data = self._preprocess(data, use_eos, tokenized)
     thought_vectors = []
 
     batch_indices = np.arange(0, len(data), batch_size)
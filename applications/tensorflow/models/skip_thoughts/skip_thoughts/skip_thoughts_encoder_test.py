@@ -0,0 +1,117 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for tensorflow_models.skip_thoughts.skip_thoughts_encoder."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+import numpy as np
+import tensorflow as tf
+
+from skip_thoughts import skip_thoughts_encoder
+from skip_thoughts.data import special_words
+
+
+class FakeSession(object):
+  """Stands in for a Session running the encoder graph.
+
+  The "thought vector" of a sentence is a position weighted sum of its
+  unmasked word embeddings, so it depends on the words, their order and the
+  mask, but not on the other sentences of the batch.
+  """
+
+  def __init__(self, emb_dim, thought_dim):
+    self._weights = np.random.RandomState(1).randn(
+        emb_dim, thought_dim).astype(np.float32)
+    self.batch_lengths = []
+
+  def run(self, fetches, feed_dict):
+    assert fetches == "encoder/thought_vectors:0"
+    embeddings = feed_dict["encode_emb:0"]
+    mask = feed_dict["encode_mask:0"].astype(np.float32)
+    self.batch_lengths.append(mask.shape[1])
+    positions = np.arange(1, mask.shape[1] + 1, dtype=np.float32)
+    # Padded embeddings have to be zero.
+    assert not np.any(embeddings[mask == 0])
+    summed = np.einsum("bld,bl,l->bd", embeddings, mask, positions)
+    return np.tanh(summed.dot(self._weights))
+
+
+class WhitespaceEncoder(skip_thoughts_encoder.SkipThoughtsEncoder):
+  """SkipThoughtsEncoder that splits on whitespace instead of using NLTK."""
+
+  def _tokenize(self, item):
+    return item.split()
+
+
+class SkipThoughtsEncoderTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(SkipThoughtsEncoderTest, self).setUp()
+    rng = np.random.RandomState(0)
+    words = [special_words.EOS, special_words.UNK] + [
+        "w%d" % i for i in range(20)]
+    self._embedding_matrix = rng.randn(len(words), 4).astype(np.float32)
+    self._embeddings = collections.OrderedDict(
+        zip(words, self._embedding_matrix))
+    # Sentences of very different lengths, with unknown words.
+    self._data = [" ".join("w%d" % rng.randint(25)
+                           for _ in range(rng.randint(1, 30)))
+                  for _ in range(50)]
+
+  def testLengthSortedBatches(self):
+    batches = skip_thoughts_encoder._length_sorted_batches([3, 1, 2, 1, 5], 2)
+    self.assertEqual([list(batch) for batch in batches], [[1, 3], [2, 0], [4]])
+
+  def _encode(self, encoder, **kwargs):
+    sess = FakeSession(4, 3)
+    thought_vectors = encoder.encode(
+        sess, self._data, verbose=False, batch_size=8, **kwargs)
+    return np.array(thought_vectors), sess
+
+  def testBucketByLengthMatchesDefault(self):
+    for embedding_matrix in [None, self._embedding_matrix]:
+      for use_eos in [False, True]:
+        for use_norm in [False, True]:
+          encoder = WhitespaceEncoder(
+              self._embeddings, embedding_matrix=embedding_matrix)
+          expected, _ = self._encode(encoder, use_eos=use_eos,
+                                     use_norm=use_norm)
+          bucketed, sess = self._encode(encoder, use_eos=use_eos,
+                                        use_norm=use_norm,
+                                        bucket_by_length=True)
+          self.assertEqual(expected.shape, (50, 3))
+          self.assertAllClose(bucketed, expected, atol=1e-6)
+          # Batches of sorted sentences need less padding.
+          self.assertEqual(sess.batch_lengths,
+                           sorted(sess.batch_lengths))
+
+  def testBucketByLengthSharesEmbeddingMatrix(self):
+    encoder = WhitespaceEncoder(
+        self._embeddings, embedding_matrix=self._embedding_matrix)
+    self._encode(encoder, bucket_by_length=True)
+    self.assertIs(encoder._embedding_matrix, self._embedding_matrix)
+
+  def testEmptyInput(self):
+    encoder = WhitespaceEncoder(self._embeddings)
+    self.assertEqual(
+        encoder.encode(FakeSession(4, 3), [], bucket_by_length=True), [])
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -27,14 +27,14 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import math
+import json
 import os
-import random
 import sys
 
 import tensorflow as tf
 
 from datasets import dataset_utils
+from datasets import shard_writer
 
 # The URL where the Flowers data can be downloaded.
 _DATA_URL = 'http://download.tensorflow.org/example_images/flower_photos.tgz'
@@ -42,9 +42,6 @@ _DATA_URL = 'http://download.tensorflow.org/example_images/flower_photos.tgz'
 # The number of images in the validation set.
 _NUM_VALIDATION = 350
 
-# Seed for repeatability.
-_RANDOM_SEED = 0
-
 # The number of shards per dataset split.
 _NUM_SHARDS = 5
 
@@ -107,6 +104,11 @@ def _get_dataset_filename(dataset_dir, split_name, shard_id):
 def _convert_dataset(split_name, filenames, class_names_to_ids, dataset_dir):
   """Converts the given filenames to a TFRecord dataset.
 
+  Images are assigned to shards by a hash of their path relative to the
+  flower_photos directory, so the assignment does not depend on where
+  dataset_dir is. Shards whose images did not change since the last conversion
+  are not written again.
+
   Args:
     split_name: The name of the dataset, either 'train' or 'validation'.
     filenames: A list of absolute paths to png or jpg images.
@@ -116,7 +118,10 @@ def _convert_dataset(split_name, filenames, class_names_to_ids, dataset_dir):
   """
   assert split_name in ['train', 'validation']
 
-  num_per_shard = int(math.ceil(len(filenames) / float(_NUM_SHARDS)))
+  photos_dir = os.path.join(dataset_dir, 'flower_photos')
+  shards = shard_writer.stable_partition(
+      [os.path.relpath(f, photos_dir) for f in filenames], _NUM_SHARDS)
+  config = json.dumps(sorted(class_names_to_ids.items()))
 
   with tf.Graph().as_default():
     image_reader = ImageReader()
@@ -126,20 +131,26 @@ def _convert_dataset(split_name, filenames, class_names_to_ids, dataset_dir):
       for shard_id in range(_NUM_SHARDS):
         output_filename = _get_dataset_filename(
             dataset_dir, split_name, shard_id)
+        shard_filenames = [filenames[i] for i in shards[shard_id]]
 
-        with tf.python_io.TFRecordWriter(output_filename) as tfrecord_writer:
-          start_ndx = shard_id * num_per_shard
-          end_ndx = min((shard_id+1) * num_per_shard, len(filenames))
-          for i in range(start_ndx, end_ndx):
+        shard = shard_writer.ShardWriter(output_filename, shard_filenames,
+                                         config)
+        if shard.is_current():
+          sys.stdout.write('\r>> Shard %d is up to date' % shard_id)
+          sys.stdout.flush()
+          continue
+
+        with shard as tfrecord_writer:
+          for i, filename in enumerate(shard_filenames):
             sys.stdout.write('\r>> Converting image %d/%d shard %d' % (
-                i+1, len(filenames), shard_id))
+                i+1, len(shard_filenames), shard_id))
             sys.stdout.flush()
 
             # Read the filename:
-            image_data = tf.gfile.FastGFile(filenames[i], 'rb').read()
+            image_data = tf.gfile.FastGFile(filename, 'rb').read()
             height, width = image_reader.read_image_dims(sess, image_data)
 
-            class_name = os.path.basename(os.path.dirname(filenames[i]))
+            class_name = os.path.basename(os.path.dirname(filename))
             class_id = class_names_to_ids[class_name]
 
             example = dataset_utils.image_to_tfexample(
@@ -158,7 +169,9 @@ def _clean_up_temporary_files(dataset_dir):
   """
   filename = _DATA_URL.split('/')[-1]
   filepath = os.path.join(dataset_dir, filename)
-  tf.gfile.Remove(filepath)
+  # The tarball is not downloaded again when the photos already exist.
+  if tf.gfile.Exists(filepath):
+    tf.gfile.Remove(filepath)
 
   tmp_dir = os.path.join(dataset_dir, 'flower_photos')
   tf.gfile.DeleteRecursively(tmp_dir)
@@ -183,19 +196,26 @@ def run(dataset_dir):
   if not tf.gfile.Exists(dataset_dir):
     tf.gfile.MakeDirs(dataset_dir)
 
-  if _dataset_exists(dataset_dir):
-    print('Dataset files already exist. Exiting without re-creating them.')
-    return
-
-  dataset_utils.download_and_uncompress_tarball(_DATA_URL, dataset_dir)
+  # Photos left from an interrupted run, or changed by hand, are converted
+  # again; only the shards whose photos changed are rewritten.
+  photos_dir = os.path.join(dataset_dir, 'flower_photos')
+  if not tf.gfile.Exists(photos_dir):
+    if _dataset_exists(dataset_dir):
+      print('Dataset files already exist. Exiting without re-creating them.')
+      return
+    dataset_utils.download_and_uncompress_tarball(_DATA_URL, dataset_dir)
   photo_filenames, class_names = _get_filenames_and_classes(dataset_dir)
   class_names_to_ids = dict(zip(class_names, range(len(class_names))))
 
-  # Divide into train and test:
-  random.seed(_RANDOM_SEED)
-  random.shuffle(photo_filenames)
-  training_filenames = photo_filenames[_NUM_VALIDATION:]
-  validation_filenames = photo_filenames[:_NUM_VALIDATION]
+  # Divide into train and test by a hash of the photo paths, so that adding or
+  # removing photos moves hardly any others between the splits:
+  validation_indices = set(shard_writer.stable_sample(
+      [os.path.relpath(f, photos_dir) for f in photo_filenames],
+      _NUM_VALIDATION))
+  training_filenames = [f for i, f in enumerate(photo_filenames)
+                        if i not in validation_indices]
+  validation_filenames = [photo_filenames[i]
+                          for i in sorted(validation_indices)]
 
   # First, convert the training and validation sets.
   _convert_dataset('train', training_filenames, class_names_to_ids,
@@ -0,0 +1,142 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for shard_writer."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import tensorflow as tf
+
+from datasets import shard_writer
+
+
+class StablePartitionTest(tf.test.TestCase):
+
+  def testPartitionIsStable(self):
+    keys = ['image_%d.jpg' % i for i in range(200)]
+    partitions = shard_writer.stable_partition(keys, 4)
+    self.assertEqual(sorted(sum(partitions, [])), list(range(200)))
+
+    # Adding keys does not move the existing ones.
+    more_partitions = shard_writer.stable_partition(
+        keys + ['new_%d.jpg' % i for i in range(10)], 4)
+    for partition, more_partition in zip(partitions, more_partitions):
+      self.assertEqual(partition, [i for i in more_partition if i < 200])
+
+
+class StableSampleTest(tf.test.TestCase):
+
+  def testSampleIsStable(self):
+    keys = ['image_%d.jpg' % i for i in range(200)]
+    sample = shard_writer.stable_sample(keys, 20)
+    self.assertEqual(len(sample), 20)
+    self.assertEqual(sample, sorted(sample))
+
+    # Removing a key that is not sampled keeps the sample.
+    removed = [i for i in range(200) if i not in sample][0]
+    fewer_keys = keys[:removed] + keys[removed + 1:]
+    self.assertEqual(
+        [fewer_keys[i] for i in shard_writer.stable_sample(fewer_keys, 20)],
+        [keys[i] for i in sample])
+
+    # Adding a key changes at most one sampled key.
+    more_sample = shard_writer.stable_sample(keys + ['new.jpg'], 20)
+    self.assertLessEqual(len(set(sample) - set(more_sample)), 1)
+
+    self.assertEqual(shard_writer.stable_sample(keys[:5], 20), list(range(5)))
+
+
+class ShardWriterTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._dir = self.get_temp_dir()
+    self._inputs = []
+    for i in range(3):
+      path = os.path.join(self._dir, 'input_%d.txt' % i)
+      with open(path, 'w') as f:
+        f.write('input %d' % i)
+      self._inputs.append(path)
+    self._output = os.path.join(self._dir, 'output-00000-of-00001')
+    for path in [self._output, shard_writer.manifest_filename(self._output)]:
+      if os.path.exists(path):
+        os.remove(path)
+
+  def _write(self, config='', records=(b'a', b'b')):
+    shard = shard_writer.ShardWriter(self._output, self._inputs, config)
+    if shard.is_current():
+      return False
+    with shard as writer:
+      for record in records:
+        writer.write(record)
+    return True
+
+  def _records(self):
+    return list(tf.python_io.tf_record_iterator(self._output))
+
+  def testSkipsUnchangedShard(self):
+    self.assertTrue(self._write())
+    self.assertEqual(self._records(), [b'a', b'b'])
+    self.assertFalse(self._write(records=[b'c']))
+    self.assertEqual(self._records(), [b'a', b'b'])
+
+  def testRewritesWhenInputChanges(self):
+    self.assertTrue(self._write())
+    with open(self._inputs[1], 'w') as f:
+      f.write('changed input')
+    self.assertTrue(self._write(records=[b'c']))
+    self.assertEqual(self._records(), [b'c'])
+    self.assertFalse(self._write())
+
+  def testRewritesWhenConfigChanges(self):
+    self.assertTrue(self._write(config='labels v1'))
+    self.assertTrue(self._write(config='labels v2'))
+    self.assertFalse(self._write(config='labels v2'))
+
+  def testTouchedInputWithSameContentIsCurrent(self):
+    self.assertTrue(self._write())
+    stat = os.stat(self._inputs[0])
+    os.utime(self._inputs[0], (stat.st_atime, stat.st_mtime + 10))
+    self.assertFalse(self._write())
+
+  def testRewritesMissingOrTruncatedOutput(self):
+    self.assertTrue(self._write())
+    with open(self._output, 'wb') as f:
+      f.write(b'partial')
+    self.assertTrue(self._write())
+    os.remove(self._output)
+    self.assertTrue(self._write())
+
+  def testFailedWriteKeepsPreviousShard(self):
+    self.assertTrue(self._write())
+    with open(self._inputs[2], 'w') as f:
+      f.write('changed input')
+    shard = shard_writer.ShardWriter(self._output, self._inputs)
+    with self.assertRaises(ValueError):
+      with shard as writer:
+        writer.write(b'c')
+        raise ValueError('conversion failed')
+    self.assertEqual(self._records(), [b'a', b'b'])
+    self.assertEqual(sorted(os.listdir(self._dir)),
+                     sorted([os.path.basename(p) for p in self._inputs] +
+                            ['output-00000-of-00001',
+                             'output-00000-of-00001.manifest.json']))
+    self.assertTrue(self._write())
+
+
+if __name__ == '__main__':
+  tf.test.main()
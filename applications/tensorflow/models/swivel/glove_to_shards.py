@@ -34,15 +34,17 @@ Options
 
   --shard_size <int>
       Specifies the shard size; default 4096.
+
+  --chunk_size <int>
+      The number of co-occurrences read and sharded at once; default 4M.
 """
 
 from __future__ import print_function
 
-import itertools
 import os
-import struct
 import sys
 
+import numpy as np
 import tensorflow as tf
 
 flags = tf.app.flags
@@ -51,11 +53,16 @@ flags.DEFINE_string('input', 'coocurrences.bin', 'Vocabulary file')
 flags.DEFINE_string('vocab', 'vocab.txt', 'Vocabulary file')
 flags.DEFINE_string('output_dir', '/tmp/swivel_data', 'Output directory')
 flags.DEFINE_integer('shard_size', 4096, 'Shard size')
+flags.DEFINE_integer('chunk_size', 4 * 1024 * 1024,
+                     'Number of co-occurrences read at once')
 
 FLAGS = tf.app.flags.FLAGS
 
-glove_cooc_fmt = struct.Struct('iid')
-shard_cooc_fmt = struct.Struct('if')
+# Glove writes (int row, int col, double count) records; the shard files hold
+# (int pos, float count) records.
+glove_cooc_dtype = np.dtype([('row', np.int32), ('col', np.int32),
+                             ('cnt', np.float64)])
+shard_cooc_dtype = np.dtype([('pos', np.int32), ('cnt', np.float32)])
 
 
 def make_shard_files(coocs, nshards, vocab_sz):
@@ -74,11 +81,11 @@ def make_shard_files(coocs, nshards, vocab_sz):
     shard ID to a file handle containing the co-occurrences for that shard; the
     marginals contain the marginal sums.
   """
-  row_sums = [0] * vocab_sz
-  col_sums = [0] * vocab_sz
+  row_sums = np.zeros(vocab_sz)
+  col_sums = np.zeros(vocab_sz)
 
   coocs.seek(0, os.SEEK_END)
-  ncoocs = coocs.tell() / glove_cooc_fmt.size
+  ncoocs = coocs.tell() // glove_cooc_dtype.itemsize
   coocs.seek(0, os.SEEK_SET)
 
   shard_files = {}
@@ -88,44 +95,47 @@ def make_shard_files(coocs, nshards, vocab_sz):
       filename = os.path.join(
           FLAGS.output_dir, 'shard-%03d-%03d.bin' % (row, col))
 
-      shard_files[(row, col)] = open(filename, 'w+')
+      shard_files[(row, col)] = open(filename, 'w+b')
 
-  for ix in xrange(ncoocs):
-    if ix % 1000000 == 0:
-      sys.stdout.write('\rsharding co-occurrences: %0.1f%% (%d/%d)' % (
-          100.0 * ix / ncoocs, ix, ncoocs))
+  # Read the co-occurrences in chunks and write every shard's slice of a
+  # chunk at once.
+  for ix in range(0, ncoocs, FLAGS.chunk_size):
+    sys.stdout.write('\rsharding co-occurrences: %0.1f%% (%d/%d)' % (
+        100.0 * ix / ncoocs, ix, ncoocs))
 
-      sys.stdout.flush()
+    sys.stdout.flush()
 
-    bits = coocs.read(glove_cooc_fmt.size)
-    if not bits:
+    chunk = np.fromfile(coocs, dtype=glove_cooc_dtype, count=FLAGS.chunk_size)
+    if not chunk.size:
       break
 
-    # Glove has 1-indexed IDs.
-    row_id, col_id, cnt = glove_cooc_fmt.unpack(bits)
-    if row_id > vocab_sz or col_id > vocab_sz:
-      continue
-
-    row_id -= 1
-    row_shard = row_id % nshards
-    row_off = row_id / nshards
+    chunk = chunk[(chunk['row'] <= vocab_sz) & (chunk['col'] <= vocab_sz)]
 
-    col_id -= 1
-    col_shard = col_id % nshards
-    col_off = col_id / nshards
-
-    shard_pos = row_off * FLAGS.shard_size + col_off  # row major
-
-    shard_files[(row_shard, col_shard)].write(
-        shard_cooc_fmt.pack(shard_pos, cnt))
+    # Glove has 1-indexed IDs.
+    row_ids = chunk['row'] - 1
+    col_ids = chunk['col'] - 1
+
+    shard_ids = (row_ids % nshards) * nshards + col_ids % nshards
+    shard_coocs = np.empty(chunk.size, dtype=shard_cooc_dtype)
+    shard_coocs['pos'] = (  # row major
+        (row_ids // nshards) * FLAGS.shard_size + col_ids // nshards)
+    shard_coocs['cnt'] = chunk['cnt']
+
+    # A stable sort keeps the file order of the co-occurrences in a shard.
+    order = np.argsort(shard_ids, kind='mergesort')
+    shard_coocs = shard_coocs[order]
+    bounds = np.searchsorted(shard_ids[order], np.arange(nshards * nshards + 1))
+    for shard_id in np.nonzero(np.diff(bounds))[0]:
+      shard_coocs[bounds[shard_id]:bounds[shard_id + 1]].tofile(
+          shard_files[divmod(int(shard_id), nshards)])
 
     # Accumulate marginals.
-    row_sums[row_id] += cnt
-    col_sums[col_id] += cnt
+    row_sums += np.bincount(row_ids, weights=chunk['cnt'], minlength=vocab_sz)
+    col_sums += np.bincount(col_ids, weights=chunk['cnt'], minlength=vocab_sz)
 
   sys.stdout.write('\n')
 
-  if any(abs(r - c) > 0.1 for r, c in itertools.izip(row_sums, col_sums)):
+  if np.any(np.abs(row_sums - col_sums) > 0.1):
     print('WARNING! Row and column marginals differ; is your matrix symmetric?',
           file=sys.stderr)
 
@@ -137,7 +147,7 @@ def main(_):
 
   shard_sz = FLAGS.shard_size
   vocab_sz = orig_vocab_sz - orig_vocab_sz % shard_sz
-  nshards = vocab_sz / shard_sz
+  nshards = vocab_sz // shard_sz
 
   print('vocab size is %d (originally %d), %d %dx%d-element shards' % (
       vocab_sz, orig_vocab_sz, nshards * nshards, shard_sz, shard_sz))
@@ -146,29 +156,25 @@ def main(_):
   if FLAGS.output_dir and not os.path.isdir(FLAGS.output_dir):
     os.makedirs(FLAGS.output_dir)
 
-  with open(FLAGS.input, 'r') as coocs:
+  with open(FLAGS.input, 'rb') as coocs:
     shard_files, marginals = make_shard_files(coocs, nshards, vocab_sz)
 
   # Now sort the shards and write the TFRecords.
   filename = os.path.join(FLAGS.output_dir, 'shards.recs')
   with tf.python_io.TFRecordWriter(filename) as writer:
     ix = 0
-    for (row, col), fh in shard_files.iteritems():
+    for (row, col), fh in shard_files.items():
       ix += 1
       sys.stdout.write('\rwriting shard %d/%d' % (ix, len(shard_files)))
       sys.stdout.flush()
 
       fh.seek(0)
-      buf = fh.read()
+      coocs = np.fromfile(fh, dtype=shard_cooc_dtype)
       os.unlink(fh.name)
       fh.close()
 
-      coocs = [
-          shard_cooc_fmt.unpack_from(buf, off)
-          for off in range(0, len(buf), shard_cooc_fmt.size)]
-
       # N.B. we assume that there aren't any duplicates here!
-      coocs.sort(key=lambda kv: kv[0])
+      coocs = coocs[np.argsort(coocs['pos'], kind='mergesort')]
 
       def _int64s(xs):
         return tf.train.Feature(int64_list=tf.train.Int64List(value=list(xs)))
@@ -179,9 +185,9 @@ def main(_):
       example = tf.train.Example(features=tf.train.Features(feature={
           'global_row': _int64s(row + nshards * i for i in range(shard_sz)),
           'global_col': _int64s(col + nshards * i for i in range(shard_sz)),
-          'sparse_local_row': _int64s(pos / shard_sz for pos, _ in coocs),
-          'sparse_local_col': _int64s(pos % shard_sz for pos, _ in coocs),
-          'sparse_value': _floats(cnt for _, cnt in coocs)}))
+          'sparse_local_row': _int64s((coocs['pos'] // shard_sz).tolist()),
+          'sparse_local_col': _int64s((coocs['pos'] % shard_sz).tolist()),
+          'sparse_value': _floats(coocs['cnt'].tolist())}))
 
       writer.write(example.SerializeToString())
 
@@ -23,22 +23,32 @@ from getopt import GetoptError, getopt
 from vecs import Vecs
 
 try:
-  opts, args = getopt(sys.argv[1:], 'v:e:', ['vocab=', 'embeddings='])
+  opts, args = getopt(sys.argv[1:], 'v:e:p:',
+                      ['vocab=', 'embeddings=', 'probes='])
 except GetoptError, e:
   print >> sys.stderr, e
   sys.exit(2)
 
 opt_vocab = 'vocab.txt'
 opt_embeddings = None
+opt_probes = None
 
 for o, a in opts:
   if o in ('-v', '--vocab'):
     opt_vocab = a
   if o in ('-e', '--embeddings'):
     opt_embeddings = a
+  if o in ('-p', '--probes'):
+    opt_probes = int(a)
 
 vecs = Vecs(opt_vocab, opt_embeddings)
 
+# With --probes, search that many clusters of the approximate index, which is
+# built once and saved next to the embeddings.
+if opt_probes and not vecs.load_index():
+  print 'building approximate index %s' % vecs.index_filename()
+  vecs.build_index()
+
 while True:
   sys.stdout.write('query> ')
   sys.stdout.flush()
@@ -50,7 +60,7 @@ while True:
   parts = re.split(r'\s+', query)
 
   if len(parts) == 1:
-    res = vecs.neighbors(parts[0])
+    res = vecs.neighbors(parts[0], k=20, num_probes=opt_probes)
 
   elif len(parts) == 3:
     vs = [vecs.lookup(w) for w in parts]
@@ -60,7 +70,7 @@ while True:
 
       continue
 
-    res = vecs.neighbors(vs[2] - vs[0] + vs[1])
+    res = vecs.neighbors(vs[2] - vs[0] + vs[1], k=20, num_probes=opt_probes)
 
   else:
     print 'use a single word to query neighbors, or three words for analogy'
@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prepare a corpus for processing by swivel, using all cores.
+
+Creates the same sharded word co-occurrence matrix as prep.py, but splits the
+work between processes and keeps its memory use bounded, so that it scales to
+corpora much larger than memory:
+
+  1. The corpus is split into byte ranges, each starting at a line boundary.
+     Unless --vocab is given, the vocabulary is counted over the ranges in
+     parallel.
+
+  2. Each range is read in blocks of lines. The co-occurrences of a block are
+     counted with numpy, one vectorized pass per window offset, and reduced
+     to a sparse array of (pair, count). Whenever the counts buffered by a
+     range exceed --run_size, they are written to disk as a run, sorted in
+     shard order.
+
+  3. Each shard is merged from the matching slice of every run, found by
+     binary search in the memory mapped runs, and written as a tf.Example.
+     Shards are merged in parallel and the runs are removed at the end.
+
+Usage:
+
+  parallel_prep.py --output_dir <output-dir> --input <text-file>
+
+Options:
+
+  --input <filename>
+      The input text.
+
+  --output_dir <directory>
+      Specifies the output directory where the various Swivel data
+      files should be placed.
+
+  --shard_size <int>
+      Specifies the shard size; default 4096.
+
+  --min_count <int>
+      Specifies the minimum number of times a word should appear
+      to be included in the vocabulary; default 5.
+
+  --max_vocab <int>
+      Specifies the maximum vocabulary size; default shard size
+      times 64.
+
+  --vocab <filename>
+      Use the specified unigram vocabulary instead of generating
+      it from the corpus.
+
+  --window_size <int>
+      Specifies the window size for computing co-occurrence stats;
+      default 10.
+
+  --num_workers <int>
+      The number of worker processes; default the number of CPUs.
+
+  --num_ranges <int>
+      The number of byte ranges the corpus is split into; default four
+      per worker.
+
+  --block_tokens <int>
+      The number of tokens counted in one numpy pass; default 1M.
+
+  --run_size <int>
+      The number of co-occurrences a range buffers before spilling a
+      sorted run to disk; default 16M.
+
+  --tmp_dir <directory>
+      Where the runs are written; default the output directory.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+flags = tf.app.flags
+
+flags.DEFINE_string('input', '', 'The input text.')
+flags.DEFINE_string('output_dir', '/tmp/swivel_data',
+                    'Output directory for Swivel data')
+flags.DEFINE_integer('shard_size', 4096, 'The size for each shard')
+flags.DEFINE_integer('min_count', 5,
+                     'The minimum number of times a word should occur to be '
+                     'included in the vocabulary')
+flags.DEFINE_integer('max_vocab', 4096 * 64, 'The maximum vocabulary size')
+flags.DEFINE_string('vocab', '', 'Vocabulary to use instead of generating one')
+flags.DEFINE_integer('window_size', 10, 'The window size')
+flags.DEFINE_integer('num_workers', 0,
+                     'The number of worker processes, 0 for one per CPU')
+flags.DEFINE_integer('num_ranges', 0,
+                     'The number of byte ranges, 0 for four per worker')
+flags.DEFINE_integer('block_tokens', 1024 * 1024,
+                     'The number of tokens counted in one numpy pass')
+flags.DEFINE_integer('run_size', 16 * 1024 * 1024,
+                     'The number of co-occurrences buffered before a sorted '
+                     'run is written')
+flags.DEFINE_string('tmp_dir', '', 'Directory for the runs')
+
+FLAGS = flags.FLAGS
+
+
+def words(line):
+  """Splits a line of text into tokens."""
+  return line.strip().split()
+
+
+def byte_ranges(filename, num_ranges):
+  """Splits a file into num_ranges (start, end) byte ranges."""
+  nbytes = os.path.getsize(filename)
+  bounds = np.linspace(0, nbytes, num_ranges + 1).astype(np.int64)
+  return [(int(start), int(end))
+          for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def range_lines(filename, start, end):
+  """Yields the lines of a file that start in [start, end)."""
+  with open(filename, 'rb') as lines:
+    if start:
+      # Skip the line started in the previous range.
+      lines.seek(start - 1)
+      lines.readline()
+    while lines.tell() < end:
+      line = lines.readline()
+      if not line:
+        break
+      yield line
+
+
+def count_words(args):
+  """Counts the words of a byte range."""
+  filename, start, end = args
+  counts = collections.Counter()
+  for line in range_lines(filename, start, end):
+    counts.update(words(line))
+  return counts
+
+
+def create_vocabulary(pool, ranges):
+  """Counts the words of the corpus in parallel and generates a vocabulary."""
+  vocab = collections.Counter()
+  for ix, counts in enumerate(pool.imap_unordered(count_words, ranges), 1):
+    vocab.update(counts)
+    sys.stdout.write('\rComputing vocabulary: %d/%d ranges...' % (
+        ix, len(ranges)))
+    sys.stdout.flush()
+
+  sys.stdout.write('\n')
+
+  vocab = [(tok, n) for tok, n in vocab.items() if n >= FLAGS.min_count]
+  vocab.sort(key=lambda kv: (-kv[1], kv[0]))
+
+  num_words = min(len(vocab), FLAGS.max_vocab)
+  if num_words % FLAGS.shard_size != 0:
+    num_words -= num_words % FLAGS.shard_size
+
+  if not num_words:
+    raise Exception('empty vocabulary')
+
+  print('vocabulary contains %d tokens' % num_words)
+
+  return [tok for tok, _ in vocab[:num_words]]
+
+
+class CoocCounter(object):
+  """Counts the co-occurrences of a byte range into sorted runs on disk.
+
+  Pairs (a, b) with a <= b are counted under the key a * vocab_size + b. A
+  run holds both (a, b) and (b, a), keyed in shard order: the key of a cell
+  is its shard index (row_shard * num_shards + col_shard) times shard_size^2
+  plus its local offset (row_off * shard_size + col_off).
+  """
+
+  def __init__(self, vocab_size, shard_size, window_size, run_size,
+               run_prefix):
+    self._vocab_size = vocab_size
+    self._num_shards = vocab_size // shard_size
+    self._shard_size = shard_size
+    self._window_size = window_size
+    self._run_size = run_size
+    self._run_prefix = run_prefix
+    self._pending = []
+    self._num_pending = 0
+    self.runs = []
+    self.sums = np.zeros(vocab_size, dtype=np.float64)
+
+  def add_block(self, wids, line_ids):
+    """Counts the co-occurrences of a block of in-vocabulary word ids.
+
+    Args:
+      wids: int64 array of word ids.
+      line_ids: int64 array with the line of every word; windows never
+        cross lines.
+    """
+    keys = [wids * self._vocab_size + wids]
+    counts = [np.full(len(wids), 0.5)]
+    self.sums += np.bincount(wids, minlength=self._vocab_size)
+    for off in range(1, self._window_size + 1):
+      same_line = line_ids[off:] == line_ids[:-off]
+      lids = wids[:-off][same_line]
+      rids = wids[off:][same_line]
+      count = 1.0 / off
+      self.sums += count * (
+          np.bincount(lids, minlength=self._vocab_size) +
+          np.bincount(rids, minlength=self._vocab_size))
+      keys.append(np.minimum(lids, rids) * self._vocab_size +
+                  np.maximum(lids, rids))
+      counts.append(np.full(len(lids), count))
+
+    self._add_counts(*_reduce(np.concatenate(keys), np.concatenate(counts)))
+    if self._num_pending >= self._run_size:
+      self.flush()
+
+  def _add_counts(self, keys, counts):
+    self._pending.append((keys, counts))
+    self._num_pending += len(keys)
+
+  def flush(self):
+    """Writes the buffered co-occurrences as a run."""
+    if not self._pending:
+      return
+    keys, counts = _reduce(np.concatenate([k for k, _ in self._pending]),
+                           np.concatenate([c for _, c in self._pending]))
+    self._pending = []
+    self._num_pending = 0
+
+    lids = keys // self._vocab_size
+    rids = keys % self._vocab_size
+    off_diagonal = lids != rids
+    # The diagonal got 1/2 per occurrence, like the (a, b) and (b, a) halves.
+    counts = np.where(off_diagonal, counts, 2 * counts)
+    rows = np.concatenate([lids, rids[off_diagonal]])
+    cols = np.concatenate([rids, lids[off_diagonal]])
+    counts = np.concatenate([counts, counts[off_diagonal]])
+    n, size = self._num_shards, self._shard_size
+    cells = (((rows % n) * n + cols % n) * size * size +
+             (rows // n) * size + cols // n)
+    order = np.argsort(cells, kind='mergesort')
+
+    run = '%s-%03d' % (self._run_prefix, len(self.runs))
+    np.save(run + '.keys.npy', cells[order])
+    np.save(run + '.counts.npy', counts[order].astype(np.float32))
+    self.runs.append(run)
+
+
+def _reduce(keys, counts):
+  """Sums the counts of equal keys, returning sorted unique keys."""
+  keys, inverse = np.unique(keys, return_inverse=True)
+  return keys, np.bincount(inverse.ravel(), weights=counts,
+                           minlength=len(keys))
+
+
+_worker_vocab = None
+
+
+def _init_cooc_worker(vocab):
+  global _worker_vocab
+  _worker_vocab = {tok: idx for idx, tok in enumerate(vocab)}
+
+
+def count_coocs(args):
+  """Counts the co-occurrences of a byte range into sorted runs.
+
+  Returns:
+    The run prefixes written and the marginal sums of the range.
+  """
+  (filename, start, end, range_id, vocab_size, shard_size, window_size,
+   block_tokens, run_size, tmp_dir) = args
+  counter = CoocCounter(vocab_size, shard_size, window_size, run_size,
+                        os.path.join(tmp_dir, 'run-%05d' % range_id))
+  word_to_id = _worker_vocab
+  wids = []
+  line_ids = []
+  for lineno, line in enumerate(range_lines(filename, start, end)):
+    # Dropping OOV tokens "stretches" the window past them, as in prep.py.
+    line_wids = [wid for wid in (word_to_id.get(w) for w in words(line))
+                 if wid is not None]
+    wids.extend(line_wids)
+    line_ids.extend([lineno] * len(line_wids))
+    if len(wids) >= block_tokens:
+      counter.add_block(np.array(wids, dtype=np.int64),
+                        np.array(line_ids, dtype=np.int64))
+      wids = []
+      line_ids = []
+
+  if wids:
+    counter.add_block(np.array(wids, dtype=np.int64),
+                      np.array(line_ids, dtype=np.int64))
+  counter.flush()
+  return counter.runs, counter.sums
+
+
+def merge_shard(args):
+  """Merges the runs of one shard and writes it as a tf.Example."""
+  row, col, num_shards, shard_size, runs, output_dir = args
+  cell_size = shard_size * shard_size
+  first = (row * num_shards + col) * cell_size
+  keys = []
+  counts = []
+  for run in runs:
+    run_keys = np.load(run + '.keys.npy', mmap_mode='r')
+    lo, hi = np.searchsorted(run_keys, [first, first + cell_size])
+    if hi > lo:
+      keys.append(np.array(run_keys[lo:hi]))
+      counts.append(np.load(run + '.counts.npy', mmap_mode='r')[lo:hi])
+
+  if keys:
+    keys, counts = _reduce(np.concatenate(keys) - first,
+                           np.concatenate(counts).astype(np.float64))
+  else:
+    keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0)
+
+  def _int64s(xs):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=list(xs)))
+
+  def _floats(xs):
+    return tf.train.Feature(float_list=tf.train.FloatList(value=list(xs)))
+
+  example = tf.train.Example(features=tf.train.Features(feature={
+      'global_row': _int64s(
+          row + num_shards * i for i in range(shard_size)),
+      'global_col': _int64s(
+          col + num_shards * i for i in range(shard_size)),
+
+      'sparse_local_row': _int64s((keys // shard_size).tolist()),
+      'sparse_local_col': _int64s((keys % shard_size).tolist()),
+      'sparse_value': _floats(counts.tolist()),
+  }))
+
+  filename = os.path.join(output_dir, 'shard-%03d-%03d.pb' % (row, col))
+  with open(filename, 'wb') as out:
+    out.write(example.SerializeToString())
+
+
+def write_vocab_and_sums(vocab, sums, vocab_filename, sums_filename):
+  """Writes vocabulary and marginal sum files."""
+  with open(os.path.join(FLAGS.output_dir, vocab_filename), 'wb') as vocab_out:
+    with open(os.path.join(FLAGS.output_dir, sums_filename), 'w') as sums_out:
+      for tok, cnt in zip(vocab, sums):
+        vocab_out.write(tok + b'\n')
+        sums_out.write('%s\n' % cnt)
+
+
+def main(_):
+  # Create the output directory, if necessary
+  if FLAGS.output_dir and not os.path.isdir(FLAGS.output_dir):
+    os.makedirs(FLAGS.output_dir)
+  tmp_dir = FLAGS.tmp_dir or FLAGS.output_dir
+  if not os.path.isdir(tmp_dir):
+    os.makedirs(tmp_dir)
+
+  num_workers = FLAGS.num_workers or multiprocessing.cpu_count()
+  ranges = byte_ranges(FLAGS.input, FLAGS.num_ranges or 4 * num_workers)
+  range_args = [(FLAGS.input, start, end) for start, end in ranges]
+
+  # Read the file once to create the vocabulary.
+  if FLAGS.vocab:
+    with open(FLAGS.vocab, 'rb') as lines:
+      vocab = [line.strip() for line in lines]
+  else:
+    pool = multiprocessing.Pool(num_workers)
+    vocab = create_vocabulary(pool, range_args)
+    pool.close()
+    pool.join()
+
+  num_shards = len(vocab) // FLAGS.shard_size
+
+  # Now read the file again to count the co-occurrences into sorted runs.
+  pool = multiprocessing.Pool(num_workers, _init_cooc_worker, (vocab,))
+  tasks = [args + (range_id, len(vocab), FLAGS.shard_size, FLAGS.window_size,
+                   FLAGS.block_tokens, FLAGS.run_size, tmp_dir)
+           for range_id, args in enumerate(range_args)]
+  runs = []
+  sums = np.zeros(len(vocab), dtype=np.float64)
+  for ix, (range_runs, range_sums) in enumerate(
+      pool.imap_unordered(count_coocs, tasks), 1):
+    runs.extend(range_runs)
+    sums += range_sums
+    sys.stdout.write('\rComputing co-occurrences: %d/%d ranges...' % (
+        ix, len(tasks)))
+    sys.stdout.flush()
+
+  sys.stdout.write('\n')
+  pool.close()
+  pool.join()
+
+  # Merge the runs into the shards.
+  pool = multiprocessing.Pool(num_workers)
+  shard_args = [(row, col, num_shards, FLAGS.shard_size, runs,
+                 FLAGS.output_dir)
+                for row in range(num_shards) for col in range(num_shards)]
+  for ix, _ in enumerate(pool.imap_unordered(merge_shard, shard_args), 1):
+    sys.stdout.write('\rwriting shard %d/%d' % (ix, len(shard_args)))
+    sys.stdout.flush()
+
+  sys.stdout.write('\n')
+  pool.close()
+  pool.join()
+
+  for run in runs:
+    os.unlink(run + '.keys.npy')
+    os.unlink(run + '.counts.npy')
+
+  # Now write the marginals.  They're symmetric for this application.
+  write_vocab_and_sums(vocab, sums, 'row_vocab.txt', 'row_sums.txt')
+  write_vocab_and_sums(vocab, sums, 'col_vocab.txt', 'col_sums.txt')
+
+  print('done!')
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -17,9 +17,125 @@ import numpy as np
 import os
 import struct
 
+
+def top_k(vecs, queries, k, batch_size=256):
+  """Exact top-k rows of vecs by dot product with each query.
+
+  Args:
+    vecs: [n, dim] array.
+    queries: [num_queries, dim] array.
+    k: number of neighbors returned per query.
+    batch_size: number of queries scored at once, bounding the
+      [batch_size, n] score matrix.
+
+  Returns:
+    A pair of [num_queries, k] arrays: the row indices of the neighbors of
+    each query, by decreasing similarity, and their similarities.
+  """
+  vecs = np.asarray(vecs)
+  queries = np.asarray(queries)
+  k = min(k, vecs.shape[0])
+  indices = np.empty((len(queries), k), dtype=np.int64)
+  sims = np.empty((len(queries), k), dtype=vecs.dtype)
+  for start in range(0, len(queries), batch_size):
+    scores = queries[start:start + batch_size].dot(vecs.T)
+    rows = np.arange(len(scores))[:, np.newaxis]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-scores[rows, top], axis=1, kind='mergesort')
+    indices[start:start + len(scores)] = top[rows, order]
+    sims[start:start + len(scores)] = scores[rows, top[rows, order]]
+  return indices, sims
+
+
+class IVFIndex(object):
+  """Inverted file index for approximate nearest neighbors of unit vectors.
+
+  The vectors are clustered with spherical k-means, and each query is only
+  scored against the vectors of the num_probes clusters whose centroids are
+  most similar to it. Recall grows with num_probes; probing every cluster is
+  an exact search.
+  """
+
+  def __init__(self, centroids, order, offsets):
+    """Creates the index.
+
+    Args:
+      centroids: [num_lists, dim] unit centroids.
+      order: vector indices, grouped by cluster.
+      offsets: [num_lists + 1] offsets of the clusters in order.
+    """
+    self.centroids = centroids
+    self.order = order
+    self.offsets = offsets
+
+  @classmethod
+  def build(cls, vecs, num_lists, num_iters=10, sample_size=100000, seed=0):
+    """Clusters the unit vectors vecs into num_lists lists."""
+    vecs = np.asarray(vecs)
+    num_lists = min(num_lists, len(vecs))
+    rng = np.random.RandomState(seed)
+    sample = vecs
+    if len(vecs) > sample_size:
+      sample = vecs[rng.choice(len(vecs), sample_size, replace=False)]
+
+    centroids = sample[rng.choice(len(sample), num_lists, replace=False)]
+    for _ in range(num_iters):
+      assignments = top_k(centroids, sample, 1)[0][:, 0]
+      sums = np.zeros_like(centroids)
+      np.add.at(sums, assignments, sample)
+      norms = np.linalg.norm(sums, axis=1)
+      # Clusters that lost all their vectors keep their centroid.
+      nonempty = norms > 0
+      centroids[nonempty] = sums[nonempty] / norms[nonempty, np.newaxis]
+
+    assignments = top_k(centroids, vecs, 1)[0][:, 0]
+    order = np.argsort(assignments, kind='mergesort')
+    offsets = np.searchsorted(assignments[order], np.arange(num_lists + 1))
+    return cls(centroids, order, offsets)
+
+  def save(self, filename, **metadata):
+    np.savez(filename, centroids=self.centroids, order=self.order,
+             offsets=self.offsets, **metadata)
+
+  @classmethod
+  def load(cls, filename):
+    """Returns the index and any metadata saved with it."""
+    with np.load(filename) as data:
+      arrays = dict((key, data[key]) for key in data.files)
+    index = cls(arrays.pop('centroids'), arrays.pop('order'),
+                arrays.pop('offsets'))
+    return index, arrays
+
+  def search(self, vecs, queries, k, num_probes):
+    """Approximate top-k rows of vecs by dot product with each query.
+
+    Returns:
+      The same pair of [num_queries, k] arrays as top_k. Queries with fewer
+      than k candidates in their probed clusters are padded with index -1
+      and similarity -inf.
+    """
+    vecs = np.asarray(vecs)
+    queries = np.asarray(queries)
+    num_probes = min(num_probes, len(self.centroids))
+    probes = top_k(self.centroids, queries, num_probes)[0]
+    indices = np.full((len(queries), k), -1, dtype=np.int64)
+    sims = np.full((len(queries), k), -np.inf, dtype=vecs.dtype)
+    for i, lists in enumerate(probes):
+      candidates = np.concatenate(
+          [self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+      if not candidates.size:
+        continue
+      top, top_sims = top_k(vecs[candidates], queries[i:i + 1], k)
+      indices[i, :top.shape[1]] = candidates[top[0]]
+      sims[i, :top.shape[1]] = top_sims[0]
+    return indices, sims
+
+
 class Vecs(object):
   def __init__(self, vocab_filename, rows_filename, cols_filename=None):
     """Initializes the vectors from a text vocabulary and binary data."""
+    self.rows_filename = rows_filename
+    self.index = None
     with open(vocab_filename, 'r') as lines:
       self.vocab = [line.split()[0] for line in lines]
       self.word_to_idx = {word: idx for idx, word in enumerate(self.vocab)}
@@ -36,7 +152,7 @@ class Vecs(object):
             'unexpected file size for binary vector file %s' % rows_filename)
 
       # Memory map the rows.
-      dim = size / (4 * n)
+      dim = size // (4 * n)
       rows_mm = mmap.mmap(rows_fh.fileno(), 0, prot=mmap.PROT_READ)
       rows = np.matrix(
           np.frombuffer(rows_mm, dtype=np.float32).reshape(n, dim))
@@ -69,20 +185,77 @@ class Vecs(object):
 
     return float(self.vecs[idx1] * self.vecs[idx2].transpose())
 
-  def neighbors(self, query):
-    """Returns the nearest neighbors to the query (a word or vector)."""
-    if isinstance(query, basestring):
+  def neighbors(self, query, k=None, num_probes=None):
+    """Returns the nearest neighbors to the query (a word or vector).
+
+    Args:
+      query: a word or vector.
+      k: the number of neighbors returned, all of the vocabulary if None.
+      num_probes: if set and an index is loaded, search that many clusters of
+        the approximate index instead of the whole vocabulary.
+
+    Returns:
+      A list of (word, similarity) pairs by decreasing similarity, or None if
+      the word is not in the vocabulary.
+    """
+    if not isinstance(query, np.ndarray):
       idx = self.word_to_idx.get(query)
       if idx is None:
         return None
 
       query = self.vecs[idx]
 
-    neighbors = self.vecs * query.transpose()
+    indices, sims = self.top_k(np.asarray(query).reshape(1, -1),
+                               k or len(self.vocab), num_probes)
+    return [(self.vocab[idx], float(sim))
+            for idx, sim in zip(indices[0], sims[0]) if idx >= 0]
+
+  def top_k(self, queries, k, num_probes=None):
+    """Batched nearest neighbors of [num_queries, dim] query vectors.
+
+    Returns:
+      The row indices and similarities of the k neighbors of each query, see
+      top_k and IVFIndex.search.
+    """
+    if num_probes and self.index is not None:
+      return self.index.search(self.vecs, queries, k, num_probes)
+    return top_k(self.vecs, queries, k)
+
+  def index_filename(self):
+    """The approximate index is stored next to the vector file."""
+    return self.rows_filename + '.ivf.npz'
+
+  def _index_metadata(self):
+    stat = os.stat(self.rows_filename)
+    return {'vecs_shape': np.array(self.vecs.shape),
+            'vecs_stat': np.array([stat.st_size, stat.st_mtime])}
+
+  def build_index(self, num_lists=None, num_iters=10):
+    """Builds the approximate index and saves it next to the vector file.
+
+    Args:
+      num_lists: number of clusters, about sqrt(vocabulary size) by default.
+      num_iters: number of k-means iterations.
+    """
+    num_lists = num_lists or max(1, int(np.sqrt(len(self.vocab))))
+    self.index = IVFIndex.build(self.vecs, num_lists, num_iters)
+    self.index.save(self.index_filename(), **self._index_metadata())
+
+  def load_index(self):
+    """Loads the saved approximate index.
 
-    return sorted(
-      zip(self.vocab, neighbors.flat),
-      key=lambda kv: kv[1], reverse=True)
+    Returns:
+      True if an index for the current vector file was found.
+    """
+    if not os.path.exists(self.index_filename()):
+      return False
+    index, metadata = IVFIndex.load(self.index_filename())
+    expected = self._index_metadata()
+    if any(not np.array_equal(metadata.get(key), value)
+           for key, value in expected.items()):
+      return False
+    self.index = index
+    return True
 
   def lookup(self, word):
     """Returns the embedding for a token, or None if no embedding exists."""
@@ -13,9 +13,17 @@
 # limitations under the License.
 # ==============================================================================
 
-"""Batch reader to seq2seq attention model, with bucketing support."""
+"""Batch reader to seq2seq attention model, with bucketing support.
+
+Batcher reads and tokenizes examples in threads. ProcessBatcher does the same
+work in worker processes, which is not limited by the GIL, and hands batches
+back through shared memory.
+"""
 
 from collections import namedtuple
+import multiprocessing
+from multiprocessing import sharedctypes
+import random
 from random import shuffle
 from threading import Thread
 import time
@@ -36,6 +44,127 @@ BUCKET_CACHE_BATCH = 100
 QUEUE_NUM_BATCH = 100
 
 
+def ToModelInput(article, abstract, vocab, hps, max_article_sentences,
+                 max_abstract_sentences, truncate_input):
+  """Converts an article and abstract into padded word ids.
+
+  Args:
+    article: article text.
+    abstract: abstract text.
+    vocab: Vocabulary.
+    hps: Seq2SeqAttention model hyperparameters.
+    max_article_sentences: Max number of sentences used from article.
+    max_abstract_sentences: Max number of sentences used from abstract.
+    truncate_input: Whether to truncate input that is too long. Alternative is
+      to discard such examples.
+
+  Returns:
+    A ModelInput, or None if the example is dropped.
+  """
+  start_id = vocab.WordToId(data.SENTENCE_START)
+  article_sentences = [sent.strip() for sent in
+                       data.ToSentences(article, include_token=False)]
+  abstract_sentences = [sent.strip() for sent in
+                        data.ToSentences(abstract, include_token=False)]
+
+  enc_inputs = []
+  # Use the <s> as the <GO> symbol for decoder inputs.
+  dec_inputs = [start_id]
+
+  # Convert first N sentences to word IDs, stripping existing <s> and </s>.
+  for i in xrange(min(max_article_sentences, len(article_sentences))):
+    enc_inputs += data.GetWordIds(article_sentences[i], vocab)
+  for i in xrange(min(max_abstract_sentences, len(abstract_sentences))):
+    dec_inputs += data.GetWordIds(abstract_sentences[i], vocab)
+  return IdsToModelInput(enc_inputs, dec_inputs, vocab, hps, truncate_input,
+                         ' '.join(article_sentences),
+                         ' '.join(abstract_sentences))
+
+
+def IdsToModelInput(enc_inputs, dec_inputs, vocab, hps, truncate_input,
+                    origin_article, origin_abstract):
+  """Filters, truncates and pads word ids into a ModelInput.
+
+  Args:
+    enc_inputs: list of article word ids.
+    dec_inputs: list of abstract word ids, starting with the <s> id.
+    vocab: Vocabulary.
+    hps: Seq2SeqAttention model hyperparameters.
+    truncate_input: Whether to truncate input that is too long. Alternative is
+      to discard such examples.
+    origin_article: original article text.
+    origin_abstract: original abstract text.
+
+  Returns:
+    A ModelInput, or None if the example is dropped.
+  """
+  end_id = vocab.WordToId(data.SENTENCE_END)
+  pad_id = vocab.WordToId(data.PAD_TOKEN)
+
+  # Filter out too-short input
+  if (len(enc_inputs) < hps.min_input_len or
+      len(dec_inputs) < hps.min_input_len):
+    tf.logging.warning('Drop an example - too short.\nenc:%d\ndec:%d',
+                       len(enc_inputs), len(dec_inputs))
+    return None
+
+  # If we're not truncating input, throw out too-long input
+  if not truncate_input:
+    if (len(enc_inputs) > hps.enc_timesteps or
+        len(dec_inputs) > hps.dec_timesteps):
+      tf.logging.warning('Drop an example - too long.\nenc:%d\ndec:%d',
+                         len(enc_inputs), len(dec_inputs))
+      return None
+  # If we are truncating input, do so if necessary
+  else:
+    if len(enc_inputs) > hps.enc_timesteps:
+      enc_inputs = enc_inputs[:hps.enc_timesteps]
+    if len(dec_inputs) > hps.dec_timesteps:
+      dec_inputs = dec_inputs[:hps.dec_timesteps]
+
+  # targets is dec_inputs without <s> at beginning, plus </s> at end
+  targets = dec_inputs[1:]
+  targets.append(end_id)
+
+  # Now len(enc_inputs) should be <= enc_timesteps, and
+  # len(targets) = len(dec_inputs) should be <= dec_timesteps
+
+  enc_input_len = len(enc_inputs)
+  dec_output_len = len(targets)
+
+  # Pad if necessary
+  while len(enc_inputs) < hps.enc_timesteps:
+    enc_inputs.append(pad_id)
+  while len(dec_inputs) < hps.dec_timesteps:
+    dec_inputs.append(end_id)
+  while len(targets) < hps.dec_timesteps:
+    targets.append(end_id)
+
+  return ModelInput(enc_inputs, dec_inputs, targets, enc_input_len,
+                    dec_output_len, origin_article, origin_abstract)
+
+
+def BucketBatches(inputs, batch_size, bucketing):
+  """Splits inputs into shuffled batches of inputs with similar enc_len.
+
+  Args:
+    inputs: list of ModelInput.
+    batch_size: number of inputs per batch.
+    bucketing: Whether bucket articles of similar length into the same batch.
+
+  Returns:
+    List of batches, each a list of ModelInput.
+  """
+  if bucketing:
+    inputs = sorted(inputs, key=lambda inp: inp.enc_len)
+
+  batches = []
+  for i in xrange(0, len(inputs), batch_size):
+    batches.append(inputs[i:i+batch_size])
+  shuffle(batches)
+  return batches
+
+
 class Batcher(object):
   """Batch reader with shuffling and bucketing support."""
 
@@ -129,72 +258,15 @@ class Batcher(object):
 
   def _FillInputQueue(self):
     """Fill input queue with ModelInput."""
-    start_id = self._vocab.WordToId(data.SENTENCE_START)
-    end_id = self._vocab.WordToId(data.SENTENCE_END)
-    pad_id = self._vocab.WordToId(data.PAD_TOKEN)
     input_gen = self._TextGenerator(data.ExampleGen(self._data_path))
     while True:
       (article, abstract) = six.next(input_gen)
-      article_sentences = [sent.strip() for sent in
-                           data.ToSentences(article, include_token=False)]
-      abstract_sentences = [sent.strip() for sent in
-                            data.ToSentences(abstract, include_token=False)]
-
-      enc_inputs = []
-      # Use the <s> as the <GO> symbol for decoder inputs.
-      dec_inputs = [start_id]
-
-      # Convert first N sentences to word IDs, stripping existing <s> and </s>.
-      for i in xrange(min(self._max_article_sentences,
-                          len(article_sentences))):
-        enc_inputs += data.GetWordIds(article_sentences[i], self._vocab)
-      for i in xrange(min(self._max_abstract_sentences,
-                          len(abstract_sentences))):
-        dec_inputs += data.GetWordIds(abstract_sentences[i], self._vocab)
-
-      # Filter out too-short input
-      if (len(enc_inputs) < self._hps.min_input_len or
-          len(dec_inputs) < self._hps.min_input_len):
-        tf.logging.warning('Drop an example - too short.\nenc:%d\ndec:%d',
-                           len(enc_inputs), len(dec_inputs))
-        continue
-
-      # If we're not truncating input, throw out too-long input
-      if not self._truncate_input:
-        if (len(enc_inputs) > self._hps.enc_timesteps or
-            len(dec_inputs) > self._hps.dec_timesteps):
-          tf.logging.warning('Drop an example - too long.\nenc:%d\ndec:%d',
-                             len(enc_inputs), len(dec_inputs))
-          continue
-      # If we are truncating input, do so if necessary
-      else:
-        if len(enc_inputs) > self._hps.enc_timesteps:
-          enc_inputs = enc_inputs[:self._hps.enc_timesteps]
-        if len(dec_inputs) > self._hps.dec_timesteps:
-          dec_inputs = dec_inputs[:self._hps.dec_timesteps]
-
-      # targets is dec_inputs without <s> at beginning, plus </s> at end
-      targets = dec_inputs[1:]
-      targets.append(end_id)
-
-      # Now len(enc_inputs) should be <= enc_timesteps, and
-      # len(targets) = len(dec_inputs) should be <= dec_timesteps
-
-      enc_input_len = len(enc_inputs)
-      dec_output_len = len(targets)
-
-      # Pad if necessary
-      while len(enc_inputs) < self._hps.enc_timesteps:
-        enc_inputs.append(pad_id)
-      while len(dec_inputs) < self._hps.dec_timesteps:
-        dec_inputs.append(end_id)
-      while len(targets) < self._hps.dec_timesteps:
-        targets.append(end_id)
-
-      element = ModelInput(enc_inputs, dec_inputs, targets, enc_input_len,
-                           dec_output_len, ' '.join(article_sentences),
-                           ' '.join(abstract_sentences))
-      self._input_queue.put(element)
+      element = ToModelInput(
+          article, abstract, self._vocab, self._hps,
+          self._max_article_sentences, self._max_abstract_sentences,
+          self._truncate_input)
+      if element is not None:
+        self._input_queue.put(element)
 
   def _FillBucketInputQueue(self):
     """Fill bucketed batches into the bucket_input_queue."""
@@ -202,14 +274,7 @@ class Batcher(object):
       inputs = []
       for _ in xrange(self._hps.batch_size * BUCKET_CACHE_BATCH):
         inputs.append(self._input_queue.get())
-      if self._bucketing:
-        inputs = sorted(inputs, key=lambda inp: inp.enc_len)
-
-      batches = []
-      for i in xrange(0, len(inputs), self._hps.batch_size):
-        batches.append(inputs[i:i+self._hps.batch_size])
-      shuffle(batches)
-      for b in batches:
+      for b in BucketBatches(inputs, self._hps.batch_size, self._bucketing):
         self._bucket_input_queue.put(b)
 
   def _WatchThreads(self):
@@ -263,3 +328,228 @@ class Batcher(object):
       feature: a feature text extracted.
     """
     return ex.features.feature[key].bytes_list.value[0]
+
+
+class _SharedBatches(object):
+  """Ring of padded batches in shared memory.
+
+  A slot holds the encoder inputs, decoder inputs, targets and both lengths of
+  one batch as int32. Free slots are handed out through a queue, so a worker
+  blocks in Put until the reader has released a slot.
+  """
+
+  def __init__(self, num_slots, hps):
+    self._batch_size = hps.batch_size
+    self._enc_timesteps = hps.enc_timesteps
+    self._dec_timesteps = hps.dec_timesteps
+    self._slot_size = hps.batch_size * (
+        hps.enc_timesteps + 2 * hps.dec_timesteps + 2)
+    self._buffer = sharedctypes.RawArray('i', num_slots * self._slot_size)
+    self._slots = None
+    self._free_slots = multiprocessing.Queue()
+    for slot in xrange(num_slots):
+      self._free_slots.put(slot)
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_slots'] = None
+    return state
+
+  def _Views(self, slot):
+    """Returns enc, dec, targets, enc_lens and dec_lens views of a slot."""
+    if self._slots is None:
+      self._slots = np.frombuffer(self._buffer, dtype=np.int32).reshape(
+          [-1, self._slot_size])
+    b = self._batch_size
+    splits = np.cumsum([b * self._enc_timesteps, b * self._dec_timesteps,
+                        b * self._dec_timesteps, b])
+    enc, dec, targets, enc_lens, dec_lens = np.split(self._slots[slot], splits)
+    return (enc.reshape([b, -1]), dec.reshape([b, -1]),
+            targets.reshape([b, -1]), enc_lens, dec_lens)
+
+  def Put(self, batch):
+    """Writes a list of ModelInput into a free slot and returns the slot."""
+    slot = self._free_slots.get()
+    enc, dec, targets, enc_lens, dec_lens = self._Views(slot)
+    for i, inp in enumerate(batch):
+      enc[i, :] = inp.enc_input
+      dec[i, :] = inp.dec_input
+      targets[i, :] = inp.target
+      enc_lens[i] = inp.enc_len
+      dec_lens[i] = inp.dec_len
+    return slot
+
+  def Get(self, slot):
+    """Returns copies of the arrays of a slot."""
+    return [view.copy() for view in self._Views(slot)]
+
+  def Release(self, slot):
+    self._free_slots.put(slot)
+
+
+def _FillSharedBatches(records, shard_id, num_shards, vocab, hps, article_key,
+                       abstract_key, max_article_sentences,
+                       max_abstract_sentences, bucketing, truncate_input,
+                       shared_batches, batch_queue):
+  """Worker process loop converting one shard of the records into batches.
+
+  Args:
+    records: data.RecordIndex, or data.TokenCache to skip tokenization.
+    shard_id: index of the shard of records read by this worker.
+    num_shards: number of worker processes.
+    vocab: Vocabulary.
+    hps: Seq2SeqAttention model hyperparameters.
+    article_key: article feature key in tf.Example.
+    abstract_key: abstract feature key in tf.Example.
+    max_article_sentences: Max number of sentences used from article.
+    max_abstract_sentences: Max number of sentences used from abstract.
+    bucketing: Whether bucket articles of similar length into the same batch.
+    truncate_input: Whether to truncate input that is too long.
+    shared_batches: _SharedBatches receiving the batches.
+    batch_queue: queue receiving the slot and original text of each batch.
+  """
+  random.seed()
+  rng = np.random.RandomState()
+  record_ids = records.Shard(shard_id, num_shards)
+  if not record_ids.size:
+    return
+  use_token_cache = isinstance(records, data.TokenCache)
+  start_id = vocab.WordToId(data.SENTENCE_START)
+  inputs = []
+  while True:
+    rng.shuffle(record_ids)
+    for i in record_ids:
+      if use_token_cache:
+        # The original text is not cached, as in NextBatch placeholders.
+        element = IdsToModelInput(
+            records.ArticleIds(i, max_article_sentences),
+            [start_id] + records.AbstractIds(i, max_abstract_sentences),
+            vocab, hps, truncate_input, 'None', 'None')
+      else:
+        e = records.Example(i)
+        try:
+          article = data.GetExFeatureText(e, article_key)
+          abstract = data.GetExFeatureText(e, abstract_key)
+        except ValueError:
+          tf.logging.error('Failed to get article or abstract from example')
+          continue
+        element = ToModelInput(article, abstract, vocab, hps,
+                               max_article_sentences, max_abstract_sentences,
+                               truncate_input)
+      if element is None:
+        continue
+      inputs.append(element)
+      if len(inputs) < hps.batch_size * BUCKET_CACHE_BATCH:
+        continue
+      for b in BucketBatches(inputs, hps.batch_size, bucketing):
+        slot = shared_batches.Put(b)
+        batch_queue.put((slot, [inp.origin_article for inp in b],
+                         [inp.origin_abstract for inp in b]))
+      inputs = []
+
+
+class ProcessBatcher(object):
+  """Batch reader tokenizing examples in worker processes.
+
+  The data files are indexed once with data.RecordIndex and every worker
+  process reads its own shard of the records. With a token_cache the workers
+  read pre-tokenized word ids from a data.TokenCache instead; the original
+  text is then not available, so the cache is meant for training. Workers
+  bucket their examples like Batcher and write each padded batch into shared
+  memory, so only the slot and the original text go through the batch queue.
+  """
+
+  def __init__(self, data_path, vocab, hps,
+               article_key, abstract_key, max_article_sentences,
+               max_abstract_sentences, bucketing=True, truncate_input=False,
+               num_processes=4, report_interval_secs=60, token_cache=None):
+    """ProcessBatcher constructor.
+
+    Args:
+      data_path: tf.Example filepattern.
+      vocab: Vocabulary.
+      hps: Seq2SeqAttention model hyperparameters.
+      article_key: article feature key in tf.Example.
+      abstract_key: abstract feature key in tf.Example.
+      max_article_sentences: Max number of sentences used from article.
+      max_abstract_sentences: Max number of sentences used from abstract.
+      bucketing: Whether bucket articles of similar length into the same batch.
+      truncate_input: Whether to truncate input that is too long. Alternative is
+        to discard such examples.
+      num_processes: Number of worker processes.
+      report_interval_secs: How often to log the examples/sec read.
+      token_cache: data.TokenCache of data_path, or None to tokenize the
+        examples.
+    """
+    self._hps = hps
+    if token_cache is not None:
+      self._records = token_cache
+    else:
+      self._records = data.RecordIndex(data_path)
+    tf.logging.info('Reading %d records in %s', self._records.NumRecords(),
+                    data_path)
+    self._shared_batches = _SharedBatches(QUEUE_NUM_BATCH, hps)
+    self._batch_queue = multiprocessing.Queue(QUEUE_NUM_BATCH)
+    self._num_processes = num_processes
+    self._worker_args = (vocab, hps, article_key, abstract_key,
+                         max_article_sentences, max_abstract_sentences,
+                         bucketing, truncate_input, self._shared_batches,
+                         self._batch_queue)
+    self._processes = [self._StartProcess(i) for i in xrange(num_processes)]
+
+    self._report_interval_secs = report_interval_secs
+    self._num_examples = 0
+    self._report_examples = 0
+    self._report_time = time.time()
+    self._examples_per_sec = 0.0
+
+    self._watch_thread = Thread(target=self._WatchProcesses)
+    self._watch_thread.daemon = True
+    self._watch_thread.start()
+
+  def _StartProcess(self, shard_id):
+    p = multiprocessing.Process(
+        target=_FillSharedBatches,
+        args=(self._records, shard_id, self._num_processes) + self._worker_args)
+    p.daemon = True
+    p.start()
+    return p
+
+  def NextBatch(self):
+    """Returns a batch of inputs for seq2seq attention model.
+
+    Returns:
+      The same values as Batcher.NextBatch.
+    """
+    slot, origin_articles, origin_abstracts = self._batch_queue.get()
+    (enc_batch, dec_batch, target_batch, enc_input_lens,
+     dec_output_lens) = self._shared_batches.Get(slot)
+    self._shared_batches.Release(slot)
+    loss_weights = (np.arange(self._hps.dec_timesteps)[np.newaxis, :] <
+                    dec_output_lens[:, np.newaxis]).astype(np.float32)
+
+    self._num_examples += self._hps.batch_size
+    now = time.time()
+    if now - self._report_time >= self._report_interval_secs:
+      self._examples_per_sec = (
+          (self._num_examples - self._report_examples) /
+          (now - self._report_time))
+      tf.logging.info('Read %.1f examples/sec', self._examples_per_sec)
+      self._report_examples = self._num_examples
+      self._report_time = now
+    return (enc_batch, dec_batch, target_batch, enc_input_lens, dec_output_lens,
+            loss_weights, origin_articles, origin_abstracts)
+
+  def ExamplesPerSec(self):
+    """Returns the examples/sec read over the last report interval."""
+    return self._examples_per_sec
+
+  def _WatchProcesses(self):
+    """Watch the worker processes and restart if dead."""
+    while True:
+      time.sleep(60)
+      for i, p in enumerate(self._processes):
+        # A worker without records in its shard exits cleanly.
+        if not p.is_alive() and p.exitcode != 0:
+          tf.logging.error('Found input process dead.')
+          self._processes[i] = self._StartProcess(i)
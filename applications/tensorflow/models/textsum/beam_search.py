@@ -19,8 +19,12 @@ Beam search takes the top K results from the model, predicts the K results for
 each of the previous K result, getting K*K results. Pick the top K results from
 K*K results, and start over again until certain number of results are fully
 decoded.
+
+BatchBeamSearch runs the same search for several articles at once, sharing
+every decode_topk call between them.
 """
 
+import numpy as np
 from six.moves import xrange
 import tensorflow as tf
 
@@ -154,3 +158,111 @@ class BeamSearch(object):
       return sorted(hyps, key=lambda h: h.log_prob/len(h.tokens), reverse=True)
     else:
       return sorted(hyps, key=lambda h: h.log_prob, reverse=True)
+
+
+class BatchBeamSearch(BeamSearch):
+  """Beam search over a batch of articles.
+
+  The K hypotheses of every article are decoded together, so the model must
+  have been built with a batch size of num_articles * K. Tokens and log probs
+  are kept in [num_articles, K, ...] arrays, and the candidates of all
+  articles are ranked with one argsort per step. Hypothesis objects are only
+  created for finished hypotheses. Articles whose results are complete are
+  retired: their rows are still fed to the fixed size decoder, but they are no
+  longer ranked or extended.
+  """
+
+  def BeamSearch(self, sess, enc_inputs, enc_seqlen):
+    """Performs beam search for decoding a batch of articles.
+
+    Args:
+      sess: tf.Session, session
+      enc_inputs: ndarray of shape (num_articles, enc_length), the document
+          ids to encode
+      enc_seqlen: ndarray of shape (num_articles), the lengths of the sequences
+
+    Returns:
+      hyps: for each article, a list of Hypothesis, the best hypotheses found by
+          beam search, ordered by score
+    """
+    num_articles = enc_inputs.shape[0]
+    beam_size = self._beam_size
+    num_candidates = beam_size * beam_size * 2
+
+    # Run the encoder on K copies of each article.
+    enc_top_states, dec_in_states = self._model.encode_top_states(
+        sess, np.repeat(enc_inputs, beam_size, axis=0),
+        np.repeat(enc_seqlen, beam_size, axis=0))
+    states = np.array(dec_in_states)
+    tokens = np.zeros([num_articles, beam_size, self._max_steps + 1],
+                      dtype=np.int64)
+    tokens[:, :, 0] = self._start_token
+    log_probs = np.zeros([num_articles, beam_size])
+    results = [[] for _ in xrange(num_articles)]
+    active = np.ones(num_articles, dtype=bool)
+    article_indices = np.arange(num_articles)[:, np.newaxis]
+
+    steps = 0
+    while steps < self._max_steps and active.any():
+      topk_ids, topk_log_probs, new_states = self._model.decode_topk(
+          sess, tokens[:, :, steps].reshape([-1]), enc_top_states,
+          [s for s in states])
+      new_states = np.array(new_states)
+
+      # Candidate j of hypothesis i is at index i * 2K + j. The first step
+      # takes the best K results from the first hypothesis only.
+      candidate_log_probs = (
+          log_probs[:, :, np.newaxis] +
+          np.reshape(topk_log_probs, [num_articles, beam_size, -1]))
+      if steps == 0:
+        candidate_log_probs[:, 1:] = -np.inf
+      candidate_log_probs = candidate_log_probs.reshape([num_articles, -1])
+      candidate_ids = np.reshape(topk_ids, [num_articles, -1])
+
+      # Walk the candidates by decreasing log prob, as _BestHyps does since
+      # all of them have the same length, until either K hypotheses or K
+      # results have been collected.
+      order = np.argsort(-candidate_log_probs, axis=1, kind='mergesort')
+      sorted_ids = candidate_ids[article_indices, order]
+      is_end = sorted_ids == self._end_token
+      num_results = np.array([len(r) for r in results])[:, np.newaxis]
+      hyp_counts = np.cumsum(~is_end, axis=1)
+      result_counts = num_results + np.cumsum(is_end, axis=1)
+      is_full = (hyp_counts >= beam_size) | (result_counts >= beam_size)
+      last = np.where(is_full.any(axis=1), np.argmax(is_full, axis=1),
+                      num_candidates - 1)
+      taken = np.arange(num_candidates)[np.newaxis, :] <= last[:, np.newaxis]
+
+      # Pull the hypotheses that reached the end token off the beam.
+      sources = order // (2 * beam_size)
+      for b, c in zip(*np.nonzero(taken & is_end & active[:, np.newaxis])):
+        source = sources[b, c]
+        results[b].append(Hypothesis(
+            tokens[b, source, :steps + 1].tolist() + [sorted_ids[b, c]],
+            candidate_log_probs[b, order[b, c]],
+            new_states[b * beam_size + source]))
+
+      # Otherwise continue to extend the hypotheses, in the order they were
+      # selected.
+      extend = taken & ~is_end
+      positions = np.argsort(~extend, axis=1, kind='mergesort')[:, :beam_size]
+      num_hyps = np.minimum(np.sum(extend, axis=1), beam_size)
+      selected = order[article_indices, positions]
+      selected_sources = sources[article_indices, positions]
+      tokens = tokens[article_indices, selected_sources]
+      tokens[:, :, steps + 1] = candidate_ids[article_indices, selected]
+      log_probs = candidate_log_probs[article_indices, selected]
+      states = new_states[(article_indices * beam_size +
+                           selected_sources).reshape([-1])]
+
+      steps += 1
+      if steps == self._max_steps:
+        # Out of steps, the unfinished hypotheses complete the results.
+        for b in np.nonzero(active)[0]:
+          for i in xrange(num_hyps[b]):
+            results[b].append(Hypothesis(
+                tokens[b, i, :steps + 1].tolist(), log_probs[b, i],
+                states[b * beam_size + i]))
+      active &= np.array([len(r) for r in results]) < beam_size
+
+    return [self._BestHyps(r) for r in results]
@@ -15,11 +15,17 @@
 
 """Data batchers for data described in ..//data_prep/README.md."""
 
+import array
 import glob
+import hashlib
+import json
+import mmap
+import os
 import random
 import struct
 import sys
 
+import numpy as np
 from tensorflow.core.example import example_pb2
 
 
@@ -110,6 +116,189 @@ def ExampleGen(data_path, num_epochs=None):
     epoch += 1
 
 
+class RecordIndex(object):
+  """Random access index over the <length><blob> data files.
+
+  The files are memory mapped and scanned once for record boundaries, so that
+  records can be read in any order and split between readers without parsing
+  the files again. The index can be pickled to other processes, which map the
+  files again on first access.
+  """
+
+  def __init__(self, data_path):
+    self._filelist = sorted(glob.glob(data_path))
+    assert self._filelist, 'Empty filelist.'
+    self._maps = {}
+    file_ids, offsets, lengths = [], [], []
+    for file_id, f in enumerate(self._filelist):
+      reader = self._Map(file_id)
+      if reader is None:
+        continue
+      pos = 0
+      while pos < len(reader):
+        if pos + 8 > len(reader):
+          raise ValueError('Truncated record length in %s.' % f)
+        str_len = struct.unpack_from('q', reader, pos)[0]
+        pos += 8
+        if pos + str_len > len(reader):
+          raise ValueError('Truncated record in %s.' % f)
+        file_ids.append(file_id)
+        offsets.append(pos)
+        lengths.append(str_len)
+        pos += str_len
+    self._file_ids = np.array(file_ids, dtype=np.int32)
+    self._offsets = np.array(offsets, dtype=np.int64)
+    self._lengths = np.array(lengths, dtype=np.int64)
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_maps'] = {}
+    return state
+
+  def _Map(self, file_id):
+    """Returns the memory map of a file, None for an empty file."""
+    if file_id not in self._maps:
+      with open(self._filelist[file_id], 'rb') as f:
+        f.seek(0, 2)
+        if not f.tell():
+          return None
+        self._maps[file_id] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return self._maps[file_id]
+
+  def NumRecords(self):
+    return len(self._offsets)
+
+  def Record(self, i):
+    """Returns the serialized record i."""
+    offset = self._offsets[i]
+    return self._Map(self._file_ids[i])[offset:offset + self._lengths[i]]
+
+  def Example(self, i):
+    """Returns record i as a deserialized tf.Example."""
+    return example_pb2.Example.FromString(self.Record(i))
+
+  def Shard(self, shard_id, num_shards):
+    """Returns the indices of the records in a shard, in file order."""
+    return np.arange(shard_id, self.NumRecords(), num_shards)
+
+
+def VocabHash(vocab_file):
+  """Returns the sha1 hex digest of a vocabulary file."""
+  sha1 = hashlib.sha1()
+  with open(vocab_file, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      sha1.update(chunk)
+  return sha1.hexdigest()
+
+
+def _TokenCacheMeta(vocab_file, article_key, abstract_key):
+  return {'vocab_sha1': VocabHash(vocab_file), 'article_key': article_key,
+          'abstract_key': abstract_key}
+
+
+def IsTokenCacheCurrent(cache_path, vocab_file, article_key, abstract_key):
+  """Whether a token cache exists and was built with this vocabulary."""
+  try:
+    with open(cache_path + '.meta', 'r') as f:
+      meta = json.load(f)
+  except (IOError, ValueError):
+    return False
+  return meta == _TokenCacheMeta(vocab_file, article_key, abstract_key)
+
+
+def BuildTokenCache(data_path, vocab, vocab_file, cache_path, article_key,
+                    abstract_key):
+  """Tokenizes the data files once into a token id cache.
+
+  The cache stores the word ids of every sentence of the articles and
+  abstracts, in RecordIndex order, as:
+    <cache_path>.ids.npy: int32 word ids of all sentences.
+    <cache_path>.sentences.npy: int64 offsets of the sentences in ids.
+    <cache_path>.paragraphs.npy: int64 offsets of the paragraphs in
+        sentences. Paragraph 2i is the article of record i and paragraph
+        2i+1 its abstract.
+    <cache_path>.meta: hash of the vocabulary and the feature keys, written
+        last so that an interrupted build is never used.
+
+  Args:
+    data_path: path to tf.Example data files.
+    vocab: Vocabulary.
+    vocab_file: path of the vocabulary file, hashed to invalidate the cache.
+    cache_path: path prefix of the cache files.
+    article_key: article feature key in tf.Example.
+    abstract_key: abstract feature key in tf.Example.
+  """
+  if os.path.exists(cache_path + '.meta'):
+    os.remove(cache_path + '.meta')
+  index = RecordIndex(data_path)
+  ids = array.array('i')
+  sentences = array.array('q', [0])
+  paragraphs = array.array('q', [0])
+  for i in range(index.NumRecords()):
+    e = index.Example(i)
+    for key in (article_key, abstract_key):
+      try:
+        text = GetExFeatureText(e, key)
+      except (IndexError, ValueError):
+        # Missing features leave an empty paragraph, dropped as too short.
+        text = ''
+      for sent in ToSentences(text, include_token=False):
+        ids.extend(GetWordIds(sent.strip(), vocab))
+        sentences.append(len(ids))
+      paragraphs.append(len(sentences) - 1)
+  np.save(cache_path + '.ids.npy', np.frombuffer(ids, dtype=np.int32))
+  np.save(cache_path + '.sentences.npy', np.frombuffer(sentences, np.int64))
+  np.save(cache_path + '.paragraphs.npy', np.frombuffer(paragraphs, np.int64))
+  with open(cache_path + '.meta', 'w') as f:
+    json.dump(_TokenCacheMeta(vocab_file, article_key, abstract_key), f)
+
+
+class TokenCache(object):
+  """Memory mapped word ids written by BuildTokenCache.
+
+  Pickling only keeps the path, the files are mapped again when unpickled.
+  """
+
+  def __init__(self, cache_path, vocab_file, article_key, abstract_key):
+    if not IsTokenCacheCurrent(cache_path, vocab_file, article_key,
+                               abstract_key):
+      raise ValueError('Token cache %s is missing or was built with another '
+                       'vocabulary.' % cache_path)
+    self._Load(cache_path)
+
+  def __getstate__(self):
+    return {'cache_path': self._cache_path}
+
+  def __setstate__(self, state):
+    self._Load(state['cache_path'])
+
+  def _Load(self, cache_path):
+    self._cache_path = cache_path
+    self._ids = np.load(cache_path + '.ids.npy', mmap_mode='r')
+    self._sentences = np.load(cache_path + '.sentences.npy', mmap_mode='r')
+    self._paragraphs = np.load(cache_path + '.paragraphs.npy', mmap_mode='r')
+
+  def NumRecords(self):
+    return (len(self._paragraphs) - 1) // 2
+
+  def Shard(self, shard_id, num_shards):
+    """Returns the indices of the records in a shard."""
+    return np.arange(shard_id, self.NumRecords(), num_shards)
+
+  def _ParagraphIds(self, paragraph, max_sentences):
+    start = self._paragraphs[paragraph]
+    end = min(self._paragraphs[paragraph + 1], start + max_sentences)
+    return self._ids[self._sentences[start]:self._sentences[end]].tolist()
+
+  def ArticleIds(self, i, max_sentences):
+    """Returns the word ids of the first max_sentences of article i."""
+    return self._ParagraphIds(2 * i, max_sentences)
+
+  def AbstractIds(self, i, max_sentences):
+    """Returns the word ids of the first max_sentences of abstract i."""
+    return self._ParagraphIds(2 * i + 1, max_sentences)
+
+
 def Pad(ids, pad_id, length):
   """Pad or trim list to len length.
 
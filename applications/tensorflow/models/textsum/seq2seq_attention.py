@@ -54,10 +54,21 @@ tf.app.flags.DEFINE_integer('max_abstract_sentences', 100,
                             'abstract')
 tf.app.flags.DEFINE_integer('beam_size', 4,
                             'beam size for beam search decoding.')
+tf.app.flags.DEFINE_integer('decode_articles', 1,
+                            'Number of articles beam searched together in '
+                            'decode mode.')
 tf.app.flags.DEFINE_integer('eval_interval_secs', 60, 'How often to run eval.')
 tf.app.flags.DEFINE_integer('checkpoint_secs', 60, 'How often to checkpoint.')
 tf.app.flags.DEFINE_bool('use_bucketing', False,
                          'Whether bucket articles of similar length.')
+tf.app.flags.DEFINE_integer('input_processes', 0,
+                            'Number of processes tokenizing the input. 0 '
+                            'reads the input with threads instead.')
+tf.app.flags.DEFINE_string('token_cache', '',
+                           'Path prefix of a cache of the tokenized data, '
+                           'built on first use and rebuilt when the vocab '
+                           'changes. Used with --input_processes in train '
+                           'and eval mode.')
 tf.app.flags.DEFINE_bool('truncate_input', False,
                          'Truncate inputs that are too long. If False, '
                          'examples that are too long are discarded.')
@@ -167,7 +178,7 @@ def main(unused_argv):
 
   batch_size = 4
   if FLAGS.mode == 'decode':
-    batch_size = FLAGS.beam_size
+    batch_size = FLAGS.beam_size * FLAGS.decode_articles
 
   hps = seq2seq_attention_model.HParams(
       mode=FLAGS.mode,  # train, eval, decode
@@ -183,11 +194,29 @@ def main(unused_argv):
       max_grad_norm=2,
       num_softmax_samples=4096)  # If 0, no sampled softmax.
 
-  batcher = batch_reader.Batcher(
-      FLAGS.data_path, vocab, hps, FLAGS.article_key,
-      FLAGS.abstract_key, FLAGS.max_article_sentences,
-      FLAGS.max_abstract_sentences, bucketing=FLAGS.use_bucketing,
-      truncate_input=FLAGS.truncate_input)
+  if FLAGS.input_processes:
+    token_cache = None
+    if FLAGS.token_cache and hps.mode != 'decode':
+      if not data.IsTokenCacheCurrent(FLAGS.token_cache, FLAGS.vocab_path,
+                                      FLAGS.article_key, FLAGS.abstract_key):
+        tf.logging.info('Building token cache %s', FLAGS.token_cache)
+        data.BuildTokenCache(FLAGS.data_path, vocab, FLAGS.vocab_path,
+                             FLAGS.token_cache, FLAGS.article_key,
+                             FLAGS.abstract_key)
+      token_cache = data.TokenCache(FLAGS.token_cache, FLAGS.vocab_path,
+                                    FLAGS.article_key, FLAGS.abstract_key)
+    batcher = batch_reader.ProcessBatcher(
+        FLAGS.data_path, vocab, hps, FLAGS.article_key,
+        FLAGS.abstract_key, FLAGS.max_article_sentences,
+        FLAGS.max_abstract_sentences, bucketing=FLAGS.use_bucketing,
+        truncate_input=FLAGS.truncate_input,
+        num_processes=FLAGS.input_processes, token_cache=token_cache)
+  else:
+    batcher = batch_reader.Batcher(
+        FLAGS.data_path, vocab, hps, FLAGS.article_key,
+        FLAGS.abstract_key, FLAGS.max_article_sentences,
+        FLAGS.max_abstract_sentences, bucketing=FLAGS.use_bucketing,
+        truncate_input=FLAGS.truncate_input)
   tf.set_random_seed(FLAGS.random_seed)
 
   if hps.mode == 'train':
@@ -204,8 +233,10 @@ def main(unused_argv):
     # we keep and feed in state for each step's output.
     decode_mdl_hps = hps._replace(dec_timesteps=1)
     model = seq2seq_attention_model.Seq2SeqAttentionModel(
-        decode_mdl_hps, vocab, num_gpus=FLAGS.num_gpus)
-    decoder = seq2seq_attention_decode.BSDecoder(model, batcher, hps, vocab)
+        decode_mdl_hps, vocab, num_gpus=FLAGS.num_gpus,
+        beam_size=FLAGS.beam_size)
+    decoder = seq2seq_attention_decode.BSDecoder(
+        model, batcher, hps, vocab, beam_size=FLAGS.beam_size)
     decoder.DecodeLoop()
 
 
@@ -76,7 +76,7 @@ class DecodeIO(object):
 class BSDecoder(object):
   """Beam search decoder."""
 
-  def __init__(self, model, batch_reader, hps, vocab):
+  def __init__(self, model, batch_reader, hps, vocab, beam_size=None):
     """Beam search decoding.
 
     Args:
@@ -84,12 +84,19 @@ class BSDecoder(object):
       batch_reader: The batch data reader.
       hps: Hyperparamters.
       vocab: Vocabulary
+      beam_size: Beam size, hps.batch_size must be a multiple of it. Defaults
+          to hps.batch_size. The articles of a batch are decoded together,
+          hps.batch_size / beam_size at a time.
     """
     self._model = model
     self._model.build_graph()
     self._batch_reader = batch_reader
     self._hps = hps
     self._vocab = vocab
+    self._beam_size = beam_size or hps.batch_size
+    if hps.batch_size % self._beam_size:
+      raise ValueError('batch_size %d is not a multiple of beam_size %d' %
+                       (hps.batch_size, self._beam_size))
     self._saver = tf.train.Saver()
     self._decode_io = DecodeIO(FLAGS.decode_dir)
 
@@ -127,21 +134,20 @@ class BSDecoder(object):
     for _ in xrange(FLAGS.decode_batches_per_ckpt):
       (article_batch, _, _, article_lens, _, _, origin_articles,
        origin_abstracts) = self._batch_reader.NextBatch()
-      for i in xrange(self._hps.batch_size):
-        bs = beam_search.BeamSearch(
-            self._model, self._hps.batch_size,
-            self._vocab.WordToId(data.SENTENCE_START),
-            self._vocab.WordToId(data.SENTENCE_END),
-            self._hps.dec_timesteps)
-
-        article_batch_cp = article_batch.copy()
-        article_batch_cp[:] = article_batch[i:i+1]
-        article_lens_cp = article_lens.copy()
-        article_lens_cp[:] = article_lens[i:i+1]
-        best_beam = bs.BeamSearch(sess, article_batch_cp, article_lens_cp)[0]
-        decode_output = [int(t) for t in best_beam.tokens[1:]]
-        self._DecodeBatch(
-            origin_articles[i], origin_abstracts[i], decode_output)
+      bs = beam_search.BatchBeamSearch(
+          self._model, self._beam_size,
+          self._vocab.WordToId(data.SENTENCE_START),
+          self._vocab.WordToId(data.SENTENCE_END),
+          self._hps.dec_timesteps)
+      num_articles = self._hps.batch_size // self._beam_size
+      for start in xrange(0, self._hps.batch_size, num_articles):
+        end = start + num_articles
+        best_beams = bs.BeamSearch(
+            sess, article_batch[start:end], article_lens[start:end])
+        for i, hyps in enumerate(best_beams):
+          decode_output = [int(t) for t in hyps[0].tokens[1:]]
+          self._DecodeBatch(origin_articles[start + i],
+                            origin_abstracts[start + i], decode_output)
     return True
 
   def _DecodeBatch(self, article, abstract, output_ids):
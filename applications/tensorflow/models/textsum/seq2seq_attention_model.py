@@ -61,10 +61,21 @@ def _extract_argmax_and_embed(embedding, output_projection=None,
 class Seq2SeqAttentionModel(object):
   """Wrapper for Tensorflow model graph for text sum vectors."""
 
-  def __init__(self, hps, vocab, num_gpus=0):
+  def __init__(self, hps, vocab, num_gpus=0, beam_size=None):
+    """Creates the model wrapper.
+
+    Args:
+      hps: HParams.
+      vocab: Vocab.
+      num_gpus: int, number of gpus to spread the graph over.
+      beam_size: int, beam size used in decode mode. Defaults to
+          hps.batch_size, i.e. one article per decode batch. A smaller value
+          decodes hps.batch_size / beam_size articles together.
+    """
     self._hps = hps
     self._vocab = vocab
     self._num_gpus = num_gpus
+    self._beam_size = beam_size or hps.batch_size
     self._cur_gpu = 0
 
   def run_train_step(self, sess, article_batch, abstract_batch, targets,
@@ -221,7 +232,7 @@ class Seq2SeqAttentionModel(object):
               axis=1, values=[tf.reshape(x, [hps.batch_size, 1]) for x in best_outputs])
 
           self._topk_log_probs, self._topk_ids = tf.nn.top_k(
-              tf.log(tf.nn.softmax(model_outputs[-1])), hps.batch_size*2)
+              tf.log(tf.nn.softmax(model_outputs[-1])), self._beam_size*2)
 
       with tf.variable_scope('loss'), tf.device(self._next_device()):
         def sampled_loss_func(inputs, labels):
@@ -273,6 +284,25 @@ class Seq2SeqAttentionModel(object):
                                   self._article_lens: enc_len})
     return results[0], results[1][0]
 
+  def encode_top_states(self, sess, enc_inputs, enc_len):
+    """Return the top states and initial states of every batch entry.
+
+    Unlike encode_top_state, the decoder initial state is returned for every
+    row, so that the batch can hold different articles.
+
+    Args:
+      sess: tensorflow session.
+      enc_inputs: encoder inputs of shape [batch_size, enc_timesteps].
+      enc_len: encoder input length of shape [batch_size]
+    Returns:
+      enc_top_states: The top level encoder states.
+      dec_in_states: The decoder layer initial states, [batch_size, state].
+    """
+    results = sess.run([self._enc_top_states, self._dec_in_state],
+                       feed_dict={self._articles: enc_inputs,
+                                  self._article_lens: enc_len})
+    return results[0], results[1]
+
   def decode_topk(self, sess, latest_tokens, enc_top_states, dec_init_states):
     """Return the topK results and new decoder states."""
     feed = {
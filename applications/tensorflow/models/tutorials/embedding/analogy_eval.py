@@ -0,0 +1,202 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Vectorized analogy evaluation and nearest neighbors for word embeddings.
+
+Everything here works on a [vocab_size, emb_dim] numpy array of L2 normalized
+embeddings, fetched once from the model, and scores whole batches of queries
+with a single matrix product:
+
+* An analogy question (a, b, c, d) is answered correctly when d is the most
+  similar word to c + (b - a), not counting a, b and c themselves. The
+  question words are excluded by masking their similarities, which gives the
+  same precision@1 as walking the top predictions and skipping them.
+* Questions are grouped by the ": category" header lines of the analogy file
+  so that accuracy can be reported per category.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+import numpy as np
+from six.moves import xrange  # pylint: disable=redefined-builtin
+
+
+AnalogyQuestions = collections.namedtuple(
+    "AnalogyQuestions", ["questions", "categories", "category_names",
+                         "skipped"])
+
+
+def read_analogies(filename, word2id):
+  """Reads an analogy question file like questions-words.txt.
+
+  Args:
+    filename: path of a file with four words per line. Lines starting with
+      ":" start a new category of questions.
+    word2id: dict from (lower case, bytes) words to ids.
+
+  Returns:
+    An AnalogyQuestions tuple with
+      questions: a [n, 4] int32 numpy array of the question word ids.
+      categories: a [n] int32 numpy array, the category of each question.
+      category_names: the names of the categories, in file order.
+      skipped: the number of questions skipped due to unknown words.
+  """
+  questions = []
+  categories = []
+  category_names = []
+  skipped = 0
+  with open(filename, "rb") as analogy_f:
+    for line in analogy_f:
+      if line.startswith(b":"):
+        category_names.append(line[1:].strip().decode("utf-8"))
+        continue
+      words = line.strip().lower().split(b" ")
+      ids = [word2id.get(w.strip()) for w in words]
+      if None in ids or len(ids) != 4:
+        skipped += 1
+      else:
+        if not category_names:
+          category_names.append("")
+        questions.append(ids)
+        categories.append(len(category_names) - 1)
+  return AnalogyQuestions(
+      np.array(questions, dtype=np.int32).reshape([-1, 4]),
+      np.array(categories, dtype=np.int32), category_names, skipped)
+
+
+def normalize(emb):
+  """Returns the rows of emb scaled to unit length, like tf.nn.l2_normalize."""
+  emb = np.asarray(emb, dtype=np.float32)
+  square_sum = np.sum(emb * emb, axis=1, keepdims=True)
+  return emb / np.sqrt(np.maximum(square_sum, 1e-12))
+
+
+def _masked_similarities(nemb, questions):
+  """Similarities of c + (b - a) to every word, -inf for a, b and c."""
+  target = (nemb[questions[:, 2]] +
+            (nemb[questions[:, 1]] - nemb[questions[:, 0]]))
+  dist = target.dot(nemb.T)
+  rows = np.arange(len(questions))[:, np.newaxis]
+  masked = dist[rows, questions[:, :3]]
+  dist[rows, questions[:, :3]] = -np.inf
+  return dist, masked
+
+
+def predict(nemb, questions, batch_size=2500):
+  """Answers analogy questions.
+
+  Args:
+    nemb: [vocab_size, emb_dim] normalized embeddings.
+    questions: [n, 3] or [n, 4] int array. The first three columns are the
+      ids of a, b and c.
+    batch_size: number of questions scored at once, bounding the size of the
+      [batch_size, vocab_size] similarity matrix.
+
+  Returns:
+    A [n] int array with the most similar word to c + (b - a) for every
+    question, other than a, b and c.
+  """
+  questions = np.asarray(questions)
+  predictions = np.empty(len(questions), dtype=np.int64)
+  for start in xrange(0, len(questions), batch_size):
+    dist, _ = _masked_similarities(nemb, questions[start:start + batch_size])
+    predictions[start:start + len(dist)] = np.argmax(dist, axis=1)
+  return predictions
+
+
+def evaluate(nemb, questions, categories=None, num_categories=None,
+             batch_size=2500):
+  """Computes analogy precision@1 overall and per category.
+
+  Args:
+    nemb: [vocab_size, emb_dim] normalized embeddings.
+    questions: [n, 4] int array of question word ids.
+    categories: optional [n] int array of question categories.
+    num_categories: number of categories, max(categories) + 1 by default.
+    batch_size: number of questions scored at once.
+
+  Returns:
+    correct: a [n] bool array, whether each question was answered correctly.
+    category_correct: a [num_categories] int array with the number of correct
+      answers in each category, or None if categories is None.
+    category_total: a [num_categories] int array with the number of questions
+      in each category, or None if categories is None.
+  """
+  questions = np.asarray(questions)
+  correct = np.empty(len(questions), dtype=bool)
+  for start in xrange(0, len(questions), batch_size):
+    sub = questions[start:start + batch_size]
+    dist, masked = _masked_similarities(nemb, sub)
+    # An answer that is also one of a, b or c still counts, as it did when
+    # the top predictions were walked in order.
+    rows = np.arange(len(sub))
+    for column in xrange(3):
+      is_answer = sub[:, column] == sub[:, 3]
+      dist[rows[is_answer], sub[is_answer, 3]] = masked[is_answer, column]
+    correct[start:start + len(sub)] = np.argmax(dist, axis=1) == sub[:, 3]
+  if categories is None:
+    return correct, None, None
+  minlength = num_categories or 0
+  category_correct = np.bincount(categories, weights=correct,
+                                 minlength=minlength).astype(np.int64)
+  category_total = np.bincount(categories, minlength=minlength)
+  return correct, category_correct, category_total
+
+
+def nearby(nemb, ids, num=20, batch_size=1024):
+  """Finds the nearest neighbors of words.
+
+  Args:
+    nemb: [vocab_size, emb_dim] normalized embeddings.
+    ids: [n] int array of word ids.
+    num: number of neighbors returned per word.
+    batch_size: number of words scored at once.
+
+  Returns:
+    idx: a [n, num] int array with the neighbors of every word, most similar
+      first. A word is its own nearest neighbor.
+    vals: a [n, num] float array with the cosine similarities.
+  """
+  ids = np.asarray(ids)
+  num = min(num, nemb.shape[0])
+  idx = np.empty([len(ids), num], dtype=np.int64)
+  vals = np.empty([len(ids), num], dtype=nemb.dtype)
+  for start in xrange(0, len(ids), batch_size):
+    dist = nemb[ids[start:start + batch_size]].dot(nemb.T)
+    rows = np.arange(len(dist))[:, np.newaxis]
+    top = np.argpartition(-dist, num - 1, axis=1)[:, :num]
+    order = np.argsort(-dist[rows, top], axis=1, kind="mergesort")
+    top = top[rows, order]
+    idx[start:start + len(dist)] = top
+    vals[start:start + len(dist)] = dist[rows, top]
+  return idx, vals
+
+
+def print_accuracy(correct, category_correct=None, category_total=None,
+                   category_names=None):
+  """Prints per category and overall accuracy as computed by evaluate()."""
+  if category_total is not None:
+    for name, num_correct, total in zip(category_names, category_correct,
+                                        category_total):
+      if total:
+        print("  %-30s %5d/%-5d accuracy = %4.1f%%" %
+              (name, num_correct, total, num_correct * 100.0 / total))
+  num_correct = np.sum(correct)
+  total = len(correct)
+  print("Eval %4d/%d accuracy = %4.1f%%" %
+        (num_correct, total, num_correct * 100.0 / max(total, 1)))
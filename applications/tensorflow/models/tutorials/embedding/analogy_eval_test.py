@@ -0,0 +1,103 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for analogy_eval module."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import analogy_eval
+
+
+def _loop_correct(nemb, questions):
+  """Precision@1 the way the word2vec models used to compute it."""
+  correct = []
+  for question in questions:
+    target = nemb[question[2]] + (nemb[question[1]] - nemb[question[0]])
+    top = np.argsort(-target.dot(nemb.T), kind="mergesort")[:4]
+    is_correct = False
+    for word in top:
+      if word == question[3]:
+        is_correct = True
+        break
+      elif word in question[:3]:
+        continue
+      else:
+        break
+    correct.append(is_correct)
+  return np.array(correct)
+
+
+class AnalogyEvalTest(tf.test.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(0)
+    self._nemb = analogy_eval.normalize(rng.randn(50, 8))
+    self._questions = rng.randint(0, 50, size=[400, 4])
+    # Make some of the questions answerable.
+    self._questions[::4, 3] = analogy_eval.predict(self._nemb,
+                                                   self._questions[::4])
+
+  def testNormalize(self):
+    nemb = analogy_eval.normalize([[3.0, 4.0], [0.0, 0.0]])
+    self.assertAllClose(nemb, [[0.6, 0.8], [0.0, 0.0]])
+
+  def testEvaluateMatchesLoop(self):
+    correct, _, _ = analogy_eval.evaluate(self._nemb, self._questions,
+                                          batch_size=7)
+    self.assertAllEqual(correct, _loop_correct(self._nemb, self._questions))
+    self.assertGreater(np.sum(correct), 0)
+
+  def testCategoryAccuracy(self):
+    categories = np.arange(400) % 3
+    correct, category_correct, category_total = analogy_eval.evaluate(
+        self._nemb, self._questions, categories, num_categories=4)
+    self.assertAllEqual(category_total, [134, 133, 133, 0])
+    self.assertAllEqual(category_correct,
+                        [np.sum(correct[categories == c]) for c in range(4)])
+
+  def testNearby(self):
+    ids = np.array([3, 10, 42])
+    idx, vals = analogy_eval.nearby(self._nemb, ids, num=5, batch_size=2)
+    dist = self._nemb[ids].dot(self._nemb.T)
+    self.assertAllEqual(idx, np.argsort(-dist, axis=1)[:, :5])
+    self.assertAllEqual(idx[:, 0], ids)
+    self.assertAllClose(vals, np.sort(dist, axis=1)[:, ::-1][:, :5])
+
+  def testReadAnalogies(self):
+    filename = os.path.join(self.get_temp_dir(), "analogies.txt")
+    with open(filename, "w") as f:
+      f.write(": capitals\n"
+              "Athens Greece Baghdad Iraq\n"
+              "athens greece madrid spain\n"
+              ": family\n"
+              "boy girl brother sister\n")
+    word2id = {b"athens": 0, b"greece": 1, b"baghdad": 2, b"iraq": 3,
+               b"boy": 4, b"girl": 5, b"brother": 6, b"sister": 7}
+    analogies = analogy_eval.read_analogies(filename, word2id)
+    self.assertAllEqual(analogies.questions, [[0, 1, 2, 3], [4, 5, 6, 7]])
+    self.assertAllEqual(analogies.categories, [0, 1])
+    self.assertEqual(analogies.category_names, ["capitals", "family"])
+    self.assertEqual(analogies.skipped, 1)
+
+
+if __name__ == "__main__":
+  tf.test.main()
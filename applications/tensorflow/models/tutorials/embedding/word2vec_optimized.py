@@ -41,6 +41,8 @@ from six.moves import xrange  # pylint: disable=redefined-builtin
 import numpy as np
 import tensorflow as tf
 
+import analogy_eval
+
 word2vec = tf.load_op_library(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'word2vec_ops.so'))
 
 flags = tf.app.flags
@@ -150,27 +152,17 @@ class Word2Vec(object):
   def read_analogies(self):
     """Reads through the analogy question file.
 
-    Returns:
-      questions: a [n, 4] numpy array containing the analogy question's
-                 word ids.
-      questions_skipped: questions skipped due to unknown words.
+    Sets the [n, 4] numpy array of analogy question word ids, the category of
+    every question and the category names, see analogy_eval.read_analogies.
     """
-    questions = []
-    questions_skipped = 0
-    with open(self._options.eval_data, "rb") as analogy_f:
-      for line in analogy_f:
-        if line.startswith(b":"):  # Skip comments.
-          continue
-        words = line.strip().lower().split(b" ")
-        ids = [self._word2id.get(w.strip()) for w in words]
-        if None in ids or len(ids) != 4:
-          questions_skipped += 1
-        else:
-          questions.append(np.array(ids))
+    analogies = analogy_eval.read_analogies(self._options.eval_data,
+                                            self._word2id)
     print("Eval analogy file: ", self._options.eval_data)
-    print("Questions: ", len(questions))
-    print("Skipped: ", questions_skipped)
-    self._analogy_questions = np.array(questions, dtype=np.int32)
+    print("Questions: ", len(analogies.questions))
+    print("Skipped: ", analogies.skipped)
+    self._analogy_questions = analogies.questions
+    self._analogy_categories = analogies.categories
+    self._analogy_category_names = analogies.category_names
 
   def build_graph(self):
     """Build the model graph."""
@@ -246,56 +238,14 @@ class Word2Vec(object):
   def build_eval_graph(self):
     """Build the evaluation graph."""
     # Eval graph
-    opts = self._options
 
     # Each analogy task is to predict the 4th word (d) given three
     # words: a, b, c.  E.g., a=italy, b=rome, c=france, we should
-    # predict d=paris.
-
-    # The eval feeds three vectors of word ids for a, b, c, each of
-    # which is of size N, where N is the number of analogies we want to
-    # evaluate in one batch.
-    analogy_a = tf.placeholder(dtype=tf.int32)  # [N]
-    analogy_b = tf.placeholder(dtype=tf.int32)  # [N]
-    analogy_c = tf.placeholder(dtype=tf.int32)  # [N]
+    # predict d=paris. Analogies and nearby words are scored in numpy by
+    # analogy_eval, which only needs the normalized embeddings.
 
     # Normalized word embeddings of shape [vocab_size, emb_dim].
-    nemb = tf.nn.l2_normalize(self._w_in, 1)
-
-    # Each row of a_emb, b_emb, c_emb is a word's embedding vector.
-    # They all have the shape [N, emb_dim]
-    a_emb = tf.gather(nemb, analogy_a)  # a's embs
-    b_emb = tf.gather(nemb, analogy_b)  # b's embs
-    c_emb = tf.gather(nemb, analogy_c)  # c's embs
-
-    # We expect that d's embedding vectors on the unit hyper-sphere is
-    # near: c_emb + (b_emb - a_emb), which has the shape [N, emb_dim].
-    target = c_emb + (b_emb - a_emb)
-
-    # Compute cosine distance between each pair of target and vocab.
-    # dist has shape [N, vocab_size].
-    dist = tf.matmul(target, nemb, transpose_b=True)
-
-    # For each question (row in dist), find the top 4 words.
-    _, pred_idx = tf.nn.top_k(dist, 4)
-
-    # Nodes for computing neighbors for a given word according to
-    # their cosine distance.
-    nearby_word = tf.placeholder(dtype=tf.int32)  # word id
-    nearby_emb = tf.gather(nemb, nearby_word)
-    nearby_dist = tf.matmul(nearby_emb, nemb, transpose_b=True)
-    nearby_val, nearby_idx = tf.nn.top_k(nearby_dist,
-                                         min(1000, opts.vocab_size))
-
-    # Nodes in the construct graph which are used by training and
-    # evaluation to run/feed/fetch.
-    self._analogy_a = analogy_a
-    self._analogy_b = analogy_b
-    self._analogy_c = analogy_c
-    self._analogy_pred_idx = pred_idx
-    self._nearby_word = nearby_word
-    self._nearby_val = nearby_val
-    self._nearby_idx = nearby_idx
+    self._nemb = tf.nn.l2_normalize(self._w_in, 1)
 
     # Properly initialize all variables.
     tf.global_variables_initializer().run()
@@ -339,63 +289,37 @@ class Word2Vec(object):
     for t in workers:
       t.join()
 
+  def _normalized_embeddings(self):
+    """Fetches the [vocab_size, emb_dim] normalized embeddings."""
+    return self._session.run(self._nemb)
+
   def _predict(self, analogy):
-    """Predict the top 4 answers for analogy questions."""
-    idx, = self._session.run([self._analogy_pred_idx], {
-        self._analogy_a: analogy[:, 0],
-        self._analogy_b: analogy[:, 1],
-        self._analogy_c: analogy[:, 2]
-    })
-    return idx
+    """Predict the answers for analogy questions, excluding the question."""
+    return analogy_eval.predict(self._normalized_embeddings(), analogy)
 
   def eval(self):
     """Evaluate analogy questions and reports accuracy."""
 
-    # How many questions we get right at precision@1.
-    correct = 0
-
-    try:
-      total = self._analogy_questions.shape[0]
-    except AttributeError as e:
+    if not hasattr(self, "_analogy_questions"):
       raise AttributeError("Need to read analogy questions.")
 
-    start = 0
-    while start < total:
-      limit = start + 2500
-      sub = self._analogy_questions[start:limit, :]
-      idx = self._predict(sub)
-      start = limit
-      for question in xrange(sub.shape[0]):
-        for j in xrange(4):
-          if idx[question, j] == sub[question, 3]:
-            # Bingo! We predicted correctly. E.g., [italy, rome, france, paris].
-            correct += 1
-            break
-          elif idx[question, j] in sub[question, :3]:
-            # We need to skip words already in the question.
-            continue
-          else:
-            # The correct label is not the precision@1
-            break
+    correct, category_correct, category_total = analogy_eval.evaluate(
+        self._normalized_embeddings(), self._analogy_questions,
+        self._analogy_categories, len(self._analogy_category_names))
     print()
-    print("Eval %4d/%d accuracy = %4.1f%%" % (correct, total,
-                                              correct * 100.0 / total))
+    analogy_eval.print_accuracy(correct, category_correct, category_total,
+                                self._analogy_category_names)
 
   def analogy(self, w0, w1, w2):
     """Predict word w3 as in w0:w1 vs w2:w3."""
     wid = np.array([[self._word2id.get(w, 0) for w in [w0, w1, w2]]])
     idx = self._predict(wid)
-    for c in [self._id2word[i] for i in idx[0, :]]:
-      if c not in [w0, w1, w2]:
-        print(c)
-        break
-    print("unknown")
+    print(self._id2word[idx[0]])
 
   def nearby(self, words, num=20):
     """Prints out nearby words given a list of words."""
     ids = np.array([self._word2id.get(x, 0) for x in words])
-    vals, idx = self._session.run(
-        [self._nearby_val, self._nearby_idx], {self._nearby_word: ids})
+    idx, vals = analogy_eval.nearby(self._normalized_embeddings(), ids, num)
     for i in xrange(len(words)):
       print("\n%s\n=====================================" % (words[i]))
       for (neighbor, distance) in zip(idx[i, :num], vals[i, :num]):
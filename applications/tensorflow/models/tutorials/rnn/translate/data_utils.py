@@ -18,11 +18,14 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import array
 import gzip
+import hashlib
 import os
 import re
 import tarfile
 
+import numpy as np
 from six.moves import urllib
 
 from tensorflow.python.platform import gfile
@@ -263,7 +266,94 @@ def data_to_token_ids(data_path, target_path, vocabulary_path,
           tokens_file.write(" ".join([str(tok) for tok in token_ids]) + "\n")
 
 
-def prepare_wmt_data(data_dir, en_vocabulary_size, fr_vocabulary_size, tokenizer=None):
+def vocabulary_hash(vocabulary_path):
+  """Returns the sha1 hex digest of a vocabulary file."""
+  sha1 = hashlib.sha1()
+  with gfile.GFile(vocabulary_path, mode="rb") as f:
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+      sha1.update(chunk)
+  return sha1.hexdigest()
+
+
+def _token_id_cache_key(vocabulary_path, normalize_digits):
+  return "%s normalize_digits=%d\n" % (vocabulary_hash(vocabulary_path),
+                                        normalize_digits)
+
+
+def token_id_cache_is_current(cache_path, vocabulary_path,
+                              normalize_digits=True):
+  """Whether a token-id cache exists and was built with this vocabulary."""
+  if not gfile.Exists(cache_path + ".vocab"):
+    return False
+  with gfile.GFile(cache_path + ".vocab", mode="r") as f:
+    return f.read() == _token_id_cache_key(vocabulary_path, normalize_digits)
+
+
+def create_token_id_cache(data_path, cache_path, vocabulary_path,
+                          tokenizer=None, normalize_digits=True):
+  """Tokenize data file once into a binary token-id cache.
+
+  Unlike data_to_token_ids, which writes the token-ids as text, the cache is
+  made of two numpy files that load_token_id_cache memory maps:
+    cache_path.ids.npy: the int32 token-ids of all sentences.
+    cache_path.offsets.npy: int64 offsets, sentence i is
+      ids[offsets[i]:offsets[i + 1]].
+  The sha1 of the vocabulary is written last to cache_path.vocab, and the
+  cache is rebuilt when the vocabulary file changes.
+
+  Args:
+    data_path: path to the data file in one-sentence-per-line format.
+    cache_path: path prefix of the local cache files.
+    vocabulary_path: path to the vocabulary file.
+    tokenizer: a function to use to tokenize each sentence;
+      if None, basic_tokenizer will be used.
+    normalize_digits: Boolean; if true, all digits are replaced by 0s.
+  """
+  if token_id_cache_is_current(cache_path, vocabulary_path, normalize_digits):
+    return
+  if gfile.Exists(cache_path + ".vocab"):
+    gfile.Remove(cache_path + ".vocab")
+  print("Caching token-ids of %s" % data_path)
+  vocab, _ = initialize_vocabulary(vocabulary_path)
+  ids = array.array("i")
+  offsets = array.array("q", [0])
+  with gfile.GFile(data_path, mode="rb") as data_file:
+    for line in data_file:
+      if len(offsets) % 100000 == 0:
+        print("  tokenizing line %d" % len(offsets))
+      ids.extend(sentence_to_token_ids(tf.compat.as_bytes(line), vocab,
+                                       tokenizer, normalize_digits))
+      offsets.append(len(ids))
+  np.save(cache_path + ".ids.npy", np.frombuffer(ids, dtype=np.int32))
+  np.save(cache_path + ".offsets.npy", np.frombuffer(offsets, dtype=np.int64))
+  with gfile.GFile(cache_path + ".vocab", mode="w") as f:
+    f.write(_token_id_cache_key(vocabulary_path, normalize_digits))
+
+
+def load_token_id_cache(cache_path, vocabulary_path, normalize_digits=True):
+  """Memory maps a token-id cache written by create_token_id_cache.
+
+  Args:
+    cache_path: path prefix of the cache files.
+    vocabulary_path: path to the vocabulary file the cache must match.
+    normalize_digits: Boolean; the value the cache was built with.
+
+  Returns:
+    a pair of read-only arrays: the int32 token-ids and the int64 sentence
+    offsets.
+
+  Raises:
+    ValueError: if the cache is missing or was built with another vocabulary.
+  """
+  if not token_id_cache_is_current(cache_path, vocabulary_path,
+                                   normalize_digits):
+    raise ValueError("Token-id cache %s is missing or stale." % cache_path)
+  return (np.load(cache_path + ".ids.npy", mmap_mode="r"),
+          np.load(cache_path + ".offsets.npy", mmap_mode="r"))
+
+
+def prepare_wmt_data(data_dir, en_vocabulary_size, fr_vocabulary_size,
+                     tokenizer=None, token_id_cache=False):
   """Get WMT data into data_dir, create vocabularies and tokenize data.
 
   Args:
@@ -272,6 +362,8 @@ def prepare_wmt_data(data_dir, en_vocabulary_size, fr_vocabulary_size, tokenizer
     fr_vocabulary_size: size of the French vocabulary to create and use.
     tokenizer: a function to use to tokenize each data sentence;
       if None, basic_tokenizer will be used.
+    token_id_cache: if True, the data is tokenized with create_token_id_cache
+      and the returned token-id paths are cache prefixes.
 
   Returns:
     A tuple of 6 elements:
@@ -291,11 +383,11 @@ def prepare_wmt_data(data_dir, en_vocabulary_size, fr_vocabulary_size, tokenizer
   from_dev_path = dev_path + ".en"
   to_dev_path = dev_path + ".fr"
   return prepare_data(data_dir, from_train_path, to_train_path, from_dev_path, to_dev_path, en_vocabulary_size,
-                      fr_vocabulary_size, tokenizer)
+                      fr_vocabulary_size, tokenizer, token_id_cache)
 
 
 def prepare_data(data_dir, from_train_path, to_train_path, from_dev_path, to_dev_path, from_vocabulary_size,
-                 to_vocabulary_size, tokenizer=None):
+                 to_vocabulary_size, tokenizer=None, token_id_cache=False):
   """Preapre all necessary files that are required for the training.
 
     Args:
@@ -308,6 +400,8 @@ def prepare_data(data_dir, from_train_path, to_train_path, from_dev_path, to_dev
       to_vocabulary_size: size of the "to language" vocabulary to create and use.
       tokenizer: a function to use to tokenize each data sentence;
         if None, basic_tokenizer will be used.
+      token_id_cache: if True, the data is tokenized with create_token_id_cache
+        and the returned token-id paths are cache prefixes.
 
     Returns:
       A tuple of 6 elements:
@@ -324,17 +418,21 @@ def prepare_data(data_dir, from_train_path, to_train_path, from_dev_path, to_dev
   create_vocabulary(to_vocab_path, to_train_path , to_vocabulary_size, tokenizer)
   create_vocabulary(from_vocab_path, from_train_path , from_vocabulary_size, tokenizer)
 
+  to_token_ids = data_to_token_ids
+  if token_id_cache:
+    to_token_ids = create_token_id_cache
+
   # Create token ids for the training data.
   to_train_ids_path = to_train_path + (".ids%d" % to_vocabulary_size)
   from_train_ids_path = from_train_path + (".ids%d" % from_vocabulary_size)
-  data_to_token_ids(to_train_path, to_train_ids_path, to_vocab_path, tokenizer)
-  data_to_token_ids(from_train_path, from_train_ids_path, from_vocab_path, tokenizer)
+  to_token_ids(to_train_path, to_train_ids_path, to_vocab_path, tokenizer)
+  to_token_ids(from_train_path, from_train_ids_path, from_vocab_path, tokenizer)
 
   # Create token ids for the development data.
   to_dev_ids_path = to_dev_path + (".ids%d" % to_vocabulary_size)
   from_dev_ids_path = from_dev_path + (".ids%d" % from_vocabulary_size)
-  data_to_token_ids(to_dev_path, to_dev_ids_path, to_vocab_path, tokenizer)
-  data_to_token_ids(from_dev_path, from_dev_ids_path, from_vocab_path, tokenizer)
+  to_token_ids(to_dev_path, to_dev_ids_path, to_vocab_path, tokenizer)
+  to_token_ids(from_dev_path, from_dev_ids_path, from_vocab_path, tokenizer)
 
   return (from_train_ids_path, to_train_ids_path,
           from_dev_ids_path, to_dev_ids_path,
@@ -73,6 +73,9 @@ tf.app.flags.DEFINE_boolean("self_test", False,
                             "Run a self-test if this is set to True.")
 tf.app.flags.DEFINE_boolean("use_fp16", False,
                             "Train using fp16 instead of fp32.")
+tf.app.flags.DEFINE_boolean("token_id_cache", False,
+                            "Tokenize the data once into binary token-id "
+                            "caches and memory map them at training time.")
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -119,6 +122,50 @@ def read_data(source_path, target_path, max_size=None):
   return data_set
 
 
+def read_cached_data(source_path, target_path, source_vocab_path,
+                     target_vocab_path, max_size=None):
+  """Read data from token-id caches and put into buckets.
+
+  Same as read_data, for caches written by data_utils.create_token_id_cache.
+  Sentence lengths and buckets are computed on the memory mapped offsets, so
+  only the sentences that fit a bucket are converted to lists.
+
+  Args:
+    source_path: cache prefix of the token-ids for the source language.
+    target_path: cache prefix of the token-ids for the target language.
+    source_vocab_path: path to the source vocabulary the cache must match.
+    target_vocab_path: path to the target vocabulary the cache must match.
+    max_size: maximum number of lines to read, all other will be ignored;
+      if 0 or None, data files will be read completely (no limit).
+
+  Returns:
+    data_set: the same buckets of (source, target) pairs as read_data.
+  """
+  source_ids, source_offsets = data_utils.load_token_id_cache(
+      source_path, source_vocab_path)
+  target_ids, target_offsets = data_utils.load_token_id_cache(
+      target_path, target_vocab_path)
+  num_lines = min(len(source_offsets), len(target_offsets)) - 1
+  if max_size:
+    num_lines = min(num_lines, max_size)
+  source_lengths = np.diff(source_offsets[:num_lines + 1])
+  # The target gets an EOS_ID appended.
+  target_lengths = np.diff(target_offsets[:num_lines + 1]) + 1
+  line_buckets = np.full(num_lines, len(_buckets), dtype=np.int64)
+  for bucket_id in reversed(xrange(len(_buckets))):
+    source_size, target_size = _buckets[bucket_id]
+    fits = (source_lengths < source_size) & (target_lengths < target_size)
+    line_buckets[fits] = bucket_id
+
+  data_set = [[] for _ in _buckets]
+  for line in np.where(line_buckets < len(_buckets))[0]:
+    source = source_ids[source_offsets[line]:source_offsets[line + 1]]
+    target = target_ids[target_offsets[line]:target_offsets[line + 1]]
+    data_set[line_buckets[line]].append(
+        [source.tolist(), target.tolist() + [data_utils.EOS_ID]])
+  return data_set
+
+
 def create_model(session, forward_only):
   """Create translation model and initialize or load parameters in session."""
   dtype = tf.float16 if FLAGS.use_fp16 else tf.float32
@@ -158,19 +205,23 @@ def train():
     if FLAGS.from_dev_data and FLAGS.to_dev_data:
       from_dev_data = FLAGS.from_dev_data
       to_dev_data = FLAGS.to_dev_data
-    from_train, to_train, from_dev, to_dev, _, _ = data_utils.prepare_data(
-        FLAGS.data_dir,
-        from_train_data,
-        to_train_data,
-        from_dev_data,
-        to_dev_data,
-        FLAGS.from_vocab_size,
-        FLAGS.to_vocab_size)
+    (from_train, to_train, from_dev, to_dev, from_vocab,
+     to_vocab) = data_utils.prepare_data(
+         FLAGS.data_dir,
+         from_train_data,
+         to_train_data,
+         from_dev_data,
+         to_dev_data,
+         FLAGS.from_vocab_size,
+         FLAGS.to_vocab_size,
+         token_id_cache=FLAGS.token_id_cache)
   else:
       # Prepare WMT data.
       print("Preparing WMT data in %s" % FLAGS.data_dir)
-      from_train, to_train, from_dev, to_dev, _, _ = data_utils.prepare_wmt_data(
-          FLAGS.data_dir, FLAGS.from_vocab_size, FLAGS.to_vocab_size)
+      (from_train, to_train, from_dev, to_dev, from_vocab,
+       to_vocab) = data_utils.prepare_wmt_data(
+           FLAGS.data_dir, FLAGS.from_vocab_size, FLAGS.to_vocab_size,
+           token_id_cache=FLAGS.token_id_cache)
 
   with tf.Session() as sess:
     # Create model.
@@ -180,8 +231,13 @@ def train():
     # Read data into buckets and compute their sizes.
     print ("Reading development and training data (limit: %d)."
            % FLAGS.max_train_data_size)
-    dev_set = read_data(from_dev, to_dev)
-    train_set = read_data(from_train, to_train, FLAGS.max_train_data_size)
+    if FLAGS.token_id_cache:
+      dev_set = read_cached_data(from_dev, to_dev, from_vocab, to_vocab)
+      train_set = read_cached_data(from_train, to_train, from_vocab, to_vocab,
+                                   FLAGS.max_train_data_size)
+    else:
+      dev_set = read_data(from_dev, to_dev)
+      train_set = read_data(from_train, to_train, FLAGS.max_train_data_size)
     train_bucket_sizes = [len(train_set[b]) for b in xrange(len(_buckets))]
     train_total_size = float(sum(train_bucket_sizes))
 
@@ -0,0 +1,76 @@
+import mmap
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+# Parsed GraphDefs keyed by file path, size and modification time. Loading the
+# graph in the parent process before the workers are forked lets every worker
+# reuse it without reading or parsing the file again.
+_GRAPH_DEFS = {}
+
+
+def load_graph_def(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _GRAPH_DEFS:
+        graph_def = tf.GraphDef()
+        with open(path, 'rb') as fid:
+            # Map the file instead of reading it through a Python buffer, the
+            # protobuf parser needs a bytes object so the mapping is copied once.
+            with mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as serialized_graph:
+                graph_def.ParseFromString(serialized_graph[:])
+        _GRAPH_DEFS[key] = graph_def
+    return _GRAPH_DEFS[key]
+
+
+class DetectionModel:
+    INPUT_TENSOR = 'image_tensor:0'
+    OUTPUT_TENSORS = ['detection_boxes:0', 'detection_scores:0',
+                      'detection_classes:0', 'num_detections:0']
+
+    def __init__(self, path, num_warmup_runs=1, warmup_shape=(360, 480, 3),
+                 warmup_batch_size=1, config=None):
+        # import the frozen graph into a session and resolve the input and
+        # output tensors once, so each inference is a single sess.run
+        start = time.monotonic()
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(load_graph_def(path), name='')
+        self.sess = tf.Session(graph=self.graph, config=config)
+        self.image_tensor = self.graph.get_tensor_by_name(self.INPUT_TENSOR)
+        self.output_tensors = [self.graph.get_tensor_by_name(name)
+                               for name in self.OUTPUT_TENSORS]
+        self.load_time = time.monotonic() - start
+
+        # the first sess.run is much slower than the next ones, run it before
+        # any real frame arrives
+        self.warmup_times = self.warmup(num_warmup_runs, warmup_shape, warmup_batch_size)
+
+    def run(self, images):
+        # run the detection on a [batch, height, width, 3] uint8 array and
+        # return the boxes, scores, classes and number of detections
+        return self.sess.run(self.output_tensors, feed_dict={self.image_tensor: images})
+
+    def warmup(self, num_runs, shape, batch_size=1):
+        # run inference on blank images and return the duration of each run
+        images = np.zeros((batch_size,) + tuple(shape), dtype=np.uint8)
+        times = []
+        for _ in range(num_runs):
+            start = time.monotonic()
+            self.run(images)
+            times.append(time.monotonic() - start)
+        return times
+
+    def report(self):
+        # describe the cold start cost of the model
+        report = '[INFO] model loaded in {:.2f}s'.format(self.load_time)
+        if self.warmup_times:
+            report += ', first inference {:.2f}s'.format(self.warmup_times[0])
+        if len(self.warmup_times) > 1:
+            report += ', warm inference {:.3f}s'.format(min(self.warmup_times[1:]))
+        return report
+
+    def close(self):
+        self.sess.close()
@@ -18,6 +18,11 @@
 These functions often receive an image, perform some visualization on the image.
 The functions do not return a value, instead they modify the image itself.
 
+The *_on_image_array functions round-trip the numpy image through PIL for every
+call. NumpyRenderer draws directly into the numpy buffer instead and can be
+passed to visualize_boxes_and_labels_on_image_array to render a whole frame
+without any conversion.
+
 """
 import collections
 import numpy as np
@@ -31,6 +36,7 @@ import tensorflow as tf
 
 _TITLE_LEFT_MARGIN = 10
 _TITLE_TOP_MARGIN = 10
+_FONTS = {}
 STANDARD_COLORS = [
     'AliceBlue', 'Chartreuse', 'Aqua', 'Aquamarine', 'Azure', 'Beige', 'Bisque',
     'BlanchedAlmond', 'BlueViolet', 'BurlyWood', 'CadetBlue', 'AntiqueWhite',
@@ -58,6 +64,25 @@ STANDARD_COLORS = [
 ]
 
 
+def _get_font(font_path='arial.ttf', font_size=24):
+  """Returns a cached font, falling back to the PIL default font."""
+  key = (font_path, font_size)
+  if key not in _FONTS:
+    try:
+      _FONTS[key] = ImageFont.truetype(font_path, font_size)
+    except IOError:
+      _FONTS[key] = ImageFont.load_default()
+  return _FONTS[key]
+
+
+def _get_text_size(font, text):
+  """Returns the (width, height) of text, for old and new PIL versions."""
+  if hasattr(font, 'getbbox'):
+    _, _, right, bottom = font.getbbox(text)
+    return right, bottom
+  return font.getsize(text)
+
+
 def save_image_array_as_png(image, output_path):
   """Saves an image (represented as a numpy array) to PNG.
 
@@ -156,15 +181,12 @@ def draw_bounding_box_on_image(image,
     (left, right, top, bottom) = (xmin, xmax, ymin, ymax)
   draw.line([(left, top), (left, bottom), (right, bottom),
              (right, top), (left, top)], width=thickness, fill=color)
-  try:
-    font = ImageFont.truetype('arial.ttf', 24)
-  except IOError:
-    font = ImageFont.load_default()
+  font = _get_font()
 
   text_bottom = top
   # Reverse list and print from bottom to top.
   for display_str in display_str_list[::-1]:
-    text_width, text_height = font.getsize(display_str)
+    text_width, text_height = _get_text_size(font, display_str)
     margin = np.ceil(0.05 * text_height)
     draw.rectangle(
         [(left, text_bottom - text_height - 2 * margin), (left + text_width,
@@ -320,6 +342,186 @@ def draw_mask_on_image_array(image, mask, color='red', alpha=0.7):
   np.copyto(image, np.array(pil_image.convert('RGB')))
 
 
+class NumpyRenderer(object):
+  """Draws boxes, labels, masks and keypoints in place on uint8 numpy images.
+
+  The layout follows the PIL based functions of this module, but every
+  primitive is written into the image buffer with numpy slicing, so drawing a
+  frame never converts the image. Glyphs are rasterized once with PIL into an
+  atlas of alpha masks, and label strings are composed from the atlas and kept
+  in a small LRU cache since the same labels recur from frame to frame.
+  """
+
+  def __init__(self, font_path='arial.ttf', font_size=24,
+               max_cached_labels=1024):
+    """Constructor.
+
+    Args:
+      font_path: path of the TrueType font used for labels. The PIL default
+        font is used if it cannot be loaded.
+      font_size: font size in pixels.
+      max_cached_labels: number of composed label strings kept in the cache.
+    """
+    self._font = _get_font(font_path, font_size)
+    self._line_height = _get_text_size(
+        self._font, 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+        '0123456789%:/()')[1]
+    self._max_cached_labels = max_cached_labels
+    self._glyphs = {}
+    self._labels = collections.OrderedDict()
+    self._colors = {}
+    self._discs = {}
+
+  def _get_color(self, color):
+    if color not in self._colors:
+      self._colors[color] = np.array(ImageColor.getrgb(color)[:3],
+                                     dtype=np.uint8)
+    return self._colors[color]
+
+  def _get_glyph(self, char):
+    """Returns the float alpha mask of a character, rasterizing it once."""
+    if char not in self._glyphs:
+      width = max(_get_text_size(self._font, char)[0], 1)
+      glyph = Image.new('L', (width, self._line_height), 0)
+      ImageDraw.Draw(glyph).text((0, 0), char, fill=255, font=self._font)
+      self._glyphs[char] = np.asarray(glyph, dtype=np.float32) / 255.0
+    return self._glyphs[char]
+
+  def _get_label(self, display_str):
+    """Returns the alpha mask of a label string composed from glyphs."""
+    label = self._labels.pop(display_str, None)
+    if label is None:
+      if display_str:
+        label = np.hstack([self._get_glyph(char) for char in display_str])
+      else:
+        label = np.zeros([self._line_height, 0], dtype=np.float32)
+      if len(self._labels) >= self._max_cached_labels:
+        self._labels.popitem(last=False)
+    self._labels[display_str] = label
+    return label
+
+  def _fill(self, image, top, bottom, left, right, color):
+    """Fills image[top:bottom, left:right] with color, clipped to the image."""
+    height, width = image.shape[:2]
+    top, bottom = max(int(top), 0), min(int(bottom), height)
+    left, right = max(int(left), 0), min(int(right), width)
+    if top < bottom and left < right:
+      image[top:bottom, left:right] = color
+
+  def _blend(self, image, alpha, top, left, color):
+    """Blends color into image with an alpha mask placed at (top, left)."""
+    height, width = image.shape[:2]
+    top, left = int(top), int(left)
+    y0, x0 = max(top, 0), max(left, 0)
+    y1 = min(top + alpha.shape[0], height)
+    x1 = min(left + alpha.shape[1], width)
+    if y0 >= y1 or x0 >= x1:
+      return
+    alpha = alpha[y0 - top:y1 - top, x0 - left:x1 - left, np.newaxis]
+    region = image[y0:y1, x0:x1]
+    region[...] = (region * (1.0 - alpha) + color * alpha + 0.5).astype(
+        np.uint8)
+
+  def draw_bounding_box(self,
+                        image,
+                        ymin,
+                        xmin,
+                        ymax,
+                        xmax,
+                        color='red',
+                        thickness=4,
+                        display_str_list=(),
+                        use_normalized_coordinates=True):
+    """Adds a bounding box to an image (numpy array) in place.
+
+    Same arguments as draw_bounding_box_on_image_array.
+    """
+    im_height, im_width = image.shape[:2]
+    if use_normalized_coordinates:
+      (left, right, top, bottom) = (xmin * im_width, xmax * im_width,
+                                    ymin * im_height, ymax * im_height)
+    else:
+      (left, right, top, bottom) = (xmin, xmax, ymin, ymax)
+    left, right, top, bottom = [
+        int(round(v)) for v in (left, right, top, bottom)]
+    rgb = self._get_color(color)
+    half = thickness // 2
+    self._fill(image, top - half, top - half + thickness, left - half,
+               right - half + thickness, rgb)
+    self._fill(image, bottom - half, bottom - half + thickness, left - half,
+               right - half + thickness, rgb)
+    self._fill(image, top - half, bottom - half + thickness, left - half,
+               left - half + thickness, rgb)
+    self._fill(image, top - half, bottom - half + thickness, right - half,
+               right - half + thickness, rgb)
+
+    black = np.zeros(3, dtype=np.uint8)
+    text_bottom = top
+    # Reverse list and print from bottom to top.
+    for display_str in display_str_list[::-1]:
+      label = self._get_label(display_str)
+      text_height, text_width = label.shape
+      margin = int(np.ceil(0.05 * text_height))
+      self._fill(image, text_bottom - text_height - 2 * margin, text_bottom + 1,
+                 left, left + text_width + 1, rgb)
+      self._blend(image, label, text_bottom - text_height - margin,
+                  left + margin, black)
+      text_bottom -= text_height - 2 * margin
+
+  def draw_mask(self, image, mask, color='red', alpha=0.7):
+    """Draws mask on an image in place.
+
+    Same arguments as draw_mask_on_image_array. Only the bounding region of
+    the non-zero mask pixels is touched.
+
+    Raises:
+      ValueError: On incorrect data type for image or masks.
+    """
+    if image.dtype != np.uint8:
+      raise ValueError('`image` not of type np.uint8')
+    if mask.dtype != np.float32:
+      raise ValueError('`mask` not of type np.float32')
+    if np.any(np.logical_or(mask > 1.0, mask < 0.0)):
+      raise ValueError('`mask` elements should be in [0, 1]')
+    rows = np.where(np.any(mask > 0, axis=1))[0]
+    if not rows.size:
+      return
+    cols = np.where(np.any(mask > 0, axis=0))[0]
+    roi = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+    # Quantize the mask like the PIL 'L' mode mask in draw_mask_on_image_array.
+    weight = np.uint8(255.0 * alpha * mask[roi]).astype(np.uint32)[
+        ..., np.newaxis]
+    region = image[roi]
+    region[...] = ((self._get_color(color).astype(np.uint32) * weight +
+                    region * (255 - weight) + 127) // 255).astype(np.uint8)
+
+  def draw_keypoints(self,
+                     image,
+                     keypoints,
+                     color='red',
+                     radius=2,
+                     use_normalized_coordinates=True):
+    """Draws keypoints on an image (numpy array) in place.
+
+    Same arguments as draw_keypoints_on_image_array.
+    """
+    radius = int(radius)
+    if radius not in self._discs:
+      offsets = np.arange(-radius, radius + 1)
+      self._discs[radius] = (
+          offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2 <=
+          radius * radius).astype(np.float32)
+    disc = self._discs[radius]
+    im_height, im_width = image.shape[:2]
+    rgb = self._get_color(color)
+    for keypoint in keypoints:
+      keypoint_y, keypoint_x = keypoint[0], keypoint[1]
+      if use_normalized_coordinates:
+        keypoint_y, keypoint_x = keypoint_y * im_height, keypoint_x * im_width
+      self._blend(image, disc, int(round(keypoint_y)) - radius,
+                  int(round(keypoint_x)) - radius, rgb)
+
+
 def visualize_boxes_and_labels_on_image_array(image,
                                               boxes,
                                               classes,
@@ -331,7 +533,8 @@ def visualize_boxes_and_labels_on_image_array(image,
                                               max_boxes_to_draw=20,
                                               min_score_thresh=.5,
                                               agnostic_mode=False,
-                                              line_thickness=4):
+                                              line_thickness=4,
+                                              renderer=None):
   """Overlay labeled boxes on an image with formatted scores and label names.
 
   This function groups boxes that correspond to the same location
@@ -361,6 +564,8 @@ def visualize_boxes_and_labels_on_image_array(image,
       class-agnostic mode or not.  This mode will display scores but ignore
       classes.
     line_thickness: integer (default: 4) controlling line width of the boxes.
+    renderer: optional NumpyRenderer. If given, the boxes, labels, masks and
+      keypoints are drawn directly on the image buffer instead of through PIL.
   """
   # Create a display string (and color) for every box location, group any boxes
   # that correspond to the same location.
@@ -397,16 +602,25 @@ def visualize_boxes_and_labels_on_image_array(image,
           box_to_color_map[box] = STANDARD_COLORS[
               classes[i] % len(STANDARD_COLORS)]
 
+  if renderer is not None:
+    draw_mask = renderer.draw_mask
+    draw_bounding_box = renderer.draw_bounding_box
+    draw_keypoints = renderer.draw_keypoints
+  else:
+    draw_mask = draw_mask_on_image_array
+    draw_bounding_box = draw_bounding_box_on_image_array
+    draw_keypoints = draw_keypoints_on_image_array
+
   # Draw all boxes onto image.
   for box, color in six.iteritems(box_to_color_map):
     ymin, xmin, ymax, xmax = box
     if instance_masks is not None:
-      draw_mask_on_image_array(
+      draw_mask(
           image,
           box_to_instance_masks_map[box],
           color=color
       )
-    draw_bounding_box_on_image_array(
+    draw_bounding_box(
         image,
         ymin,
         xmin,
@@ -417,7 +631,7 @@ def visualize_boxes_and_labels_on_image_array(image,
         display_str_list=box_to_display_str_map[box],
         use_normalized_coordinates=use_normalized_coordinates)
     if keypoints is not None:
-      draw_keypoints_on_image_array(
+      draw_keypoints(
           image,
           box_to_keypoints_map[box],
           color=color,
@@ -0,0 +1,90 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+r"""Frame rate benchmark for visualize_boxes_and_labels_on_image_array.
+
+Renders the same random detections with the PIL based drawing functions and
+with visualization_utils.NumpyRenderer, and reports frames per second.
+
+To run, use:
+  python object_detection/utils/visualization_utils_benchmark.py \
+      --image_size=360,480 --num_boxes=5,20,50
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from object_detection.utils import visualization_utils
+
+
+def random_detections(num_boxes, num_classes=90, seed=0):
+  """Generates normalized boxes, classes and scores of random detections."""
+  rng = np.random.RandomState(seed)
+  corners = rng.uniform(0.0, 0.8, size=[num_boxes, 2])
+  sizes = rng.uniform(0.05, 0.2, size=[num_boxes, 2])
+  boxes = np.hstack([corners, corners + sizes]).astype(np.float32)
+  classes = rng.randint(1, num_classes + 1, size=num_boxes)
+  scores = rng.uniform(0.5, 1.0, size=num_boxes).astype(np.float32)
+  category_index = {i: {'id': i, 'name': 'class_%d' % i}
+                    for i in range(1, num_classes + 1)}
+  return boxes, classes, scores, category_index
+
+
+def frames_per_second(image, detections, num_frames, renderer=None):
+  """Returns the frame rate of drawing detections on copies of image."""
+  boxes, classes, scores, category_index = detections
+  start_time = time.time()
+  for _ in range(num_frames):
+    visualization_utils.visualize_boxes_and_labels_on_image_array(
+        np.copy(image), boxes, classes, scores, category_index,
+        use_normalized_coordinates=True, line_thickness=8,
+        renderer=renderer)
+  return num_frames / (time.time() - start_time)
+
+
+def run_benchmark(flags):
+  """Runs both drawing paths for every requested number of boxes."""
+  height, width = [int(n) for n in flags.image_size.split(',')]
+  image = np.random.RandomState(0).randint(
+      0, 256, size=[height, width, 3]).astype(np.uint8)
+  renderer = visualization_utils.NumpyRenderer()
+  print('%8s %12s %12s %8s' % ('boxes', 'PIL (fps)', 'numpy (fps)',
+                               'speedup'))
+  for num_boxes in [int(n) for n in flags.num_boxes.split(',')]:
+    detections = random_detections(num_boxes)
+    # Warm up the font and label caches.
+    frames_per_second(image, detections, 1)
+    frames_per_second(image, detections, 1, renderer)
+    pil_fps = frames_per_second(image, detections, flags.num_frames)
+    numpy_fps = frames_per_second(image, detections, flags.num_frames,
+                                  renderer)
+    print('%8d %12.1f %12.1f %7.1fx' % (num_boxes, pil_fps, numpy_fps,
+                                        numpy_fps / pil_fps))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--image_size', type=str, default='360,480',
+                      help='Comma separated image height and width.')
+  parser.add_argument('--num_boxes', type=str, default='1,5,20,50',
+                      help='Comma separated numbers of boxes to draw.')
+  parser.add_argument('--num_frames', type=int, default=50,
+                      help='Number of frames rendered per measurement.')
+  run_benchmark(parser.parse_args())
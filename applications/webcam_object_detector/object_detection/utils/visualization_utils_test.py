@@ -147,5 +147,78 @@ class VisualizationUtilsTest(tf.test.TestCase):
     self.assertAllEqual(test_image, expected_result)
 
 
+class NumpyRendererTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._renderer = visualization_utils.NumpyRenderer()
+
+  def test_draw_bounding_box(self):
+    test_image = np.zeros([100, 200, 3], dtype=np.uint8)
+    self._renderer.draw_bounding_box(test_image, 20, 40, 60, 160,
+                                     color='Blue', thickness=4,
+                                     use_normalized_coordinates=False)
+    self.assertAllEqual(test_image[20, 100], [0, 0, 255])
+    self.assertAllEqual(test_image[60, 100], [0, 0, 255])
+    self.assertAllEqual(test_image[40, 40], [0, 0, 255])
+    self.assertAllEqual(test_image[40, 160], [0, 0, 255])
+    self.assertAllEqual(test_image[40, 100], [0, 0, 0])
+    self.assertAllEqual(test_image[10, 100], [0, 0, 0])
+
+  def test_draw_bounding_box_with_labels(self):
+    test_image = np.zeros([100, 200, 3], dtype=np.uint8)
+    self._renderer.draw_bounding_box(test_image, 0.5, 0.2, 0.9, 0.8,
+                                     color='White',
+                                     display_str_list=['first', 'second'])
+    label_area = test_image[:48, 40:]
+    self.assertTrue(np.any(np.all(label_area == 255, axis=2)))
+    self.assertTrue(np.any(np.all(label_area == 0, axis=2)))
+
+  def test_draw_bounding_box_outside_image(self):
+    test_image = np.zeros([100, 200, 3], dtype=np.uint8)
+    self._renderer.draw_bounding_box(test_image, -0.5, -0.5, 1.5, 1.5,
+                                     display_str_list=['label'])
+    self.assertAllEqual(test_image, np.zeros([100, 200, 3]))
+
+  def test_draw_keypoints(self):
+    test_image = np.zeros([100, 200, 3], dtype=np.uint8)
+    keypoints = np.array([[0.25, 0.75], [0.4, 0.6]])
+    self._renderer.draw_keypoints(test_image, keypoints, color='Blue')
+    self.assertAllEqual(test_image[25, 150], [0, 0, 255])
+    self.assertAllEqual(test_image[40, 120], [0, 0, 255])
+    self.assertEqual(np.count_nonzero(test_image[..., 2]), 26)
+
+  def test_draw_mask_matches_pil(self):
+    rng = np.random.RandomState(0)
+    test_image = rng.randint(0, 256, size=[30, 40, 3]).astype(np.uint8)
+    mask = np.zeros([30, 40], dtype=np.float32)
+    mask[5:20, 10:35] = rng.uniform(size=[15, 25])
+    expected_result = np.copy(test_image)
+    visualization_utils.draw_mask_on_image_array(expected_result, mask,
+                                                 color='Orange', alpha=.6)
+    self._renderer.draw_mask(test_image, mask, color='Orange', alpha=.6)
+    self.assertAllEqual(test_image, expected_result)
+
+  def test_draw_mask_raises_on_invalid_mask(self):
+    test_image = np.zeros([2, 2, 3], dtype=np.uint8)
+    with self.assertRaises(ValueError):
+      self._renderer.draw_mask(test_image, np.full([2, 2], 2.0, np.float32))
+
+  def test_visualize_boxes_and_labels_with_renderer(self):
+    test_image = np.zeros([100, 200, 3], dtype=np.uint8)
+    boxes = np.array([[0.2, 0.2, 0.8, 0.8], [0.3, 0.1, 0.5, 0.4]])
+    classes = np.array([1, 2])
+    scores = np.array([0.9, 0.3])
+    category_index = {1: {'id': 1, 'name': 'dog'},
+                      2: {'id': 2, 'name': 'cat'}}
+    visualization_utils.visualize_boxes_and_labels_on_image_array(
+        test_image, boxes, classes, scores, category_index,
+        use_normalized_coordinates=True, renderer=self._renderer)
+    # Only the first box passes the default score threshold.
+    self.assertTrue(np.all(np.any(test_image[80, 40:160], axis=1)))
+    self.assertTrue(np.all(np.any(test_image[20:80, 40], axis=1)))
+    self.assertFalse(np.any(test_image[30:50, 20:38]))
+    self.assertFalse(np.any(test_image[25:75, 45:155]))
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -10,9 +10,10 @@ import time
 import argparse
 import multiprocessing
 import numpy as np
-import tensorflow as tf
 
-from utils import FPS, WebcamVideoStream
+from detection_model import DetectionModel, load_graph_def
+from utils import (FPS, LatencyRecorder, ReorderBuffer, SharedFrameBuffer, WebcamVideoStream, drain_results,
+                   get_batch, timed)
 from multiprocessing import Process, Queue, Pool
 from object_detection.utils import label_map_util
 from object_detection.utils import visualization_utils as vis_util
@@ -29,6 +30,9 @@ PATH_TO_LABELS = os.path.join(CWD_PATH, 'object_detection', 'data', 'mscoco_labe
 
 NUM_CLASSES = 90
 
+# Stages of the per-frame latency breakdown, in pipeline order.
+LATENCY_STAGES = ['capture', 'queue_wait', 'preprocess', 'inference', 'visualization', 'display', 'total']
+
 # Loading label map
 label_map = label_map_util.load_labelmap(PATH_TO_LABELS)
 categories = label_map_util.convert_label_map_to_categories(label_map, max_num_classes=NUM_CLASSES,
@@ -36,59 +40,76 @@ categories = label_map_util.convert_label_map_to_categories(label_map, max_num_c
 category_index = label_map_util.create_category_index(categories)
 
 
-def detect_objects(image_np, sess, detection_graph):
+def detect_objects_batch(frames, model, renderer=None, timings=None):
+    # Time spent in every stage is added to timings when it is given.
+    if timings is None:
+        timings = {}
 
-    # Expand dimensions since the model expects images to have shape: [1, None, None, 3]
-    image_np_expanded = np.expand_dims(image_np, axis=0)
-    image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
+    # Frames of different sizes can't be stacked, run them one at a time.
+    if any(frame.shape != frames[0].shape for frame in frames):
+        return [detect_objects(frame, model, renderer, timings) for frame in frames]
 
-    # Each box represents a part of the image where a particular object was detected.
-    boxes = detection_graph.get_tensor_by_name('detection_boxes:0')
+    # Stack the frames into one batch since the model accepts images of shape [None, None, None, 3]
+    with timed(timings, 'preprocess'):
+        image_batch = np.stack(frames)
 
+    # Actual detection, one sess.run for the whole batch.
+    # Each box represents a part of the image where a particular object was detected.
     # Each score represent how level of confidence for each of the objects.
     # Score is shown on the result image, together with the class label.
-    scores = detection_graph.get_tensor_by_name('detection_scores:0')
-    classes = detection_graph.get_tensor_by_name('detection_classes:0')
-    num_detections = detection_graph.get_tensor_by_name('num_detections:0')
-
-    # Actual detection.
-    (boxes, scores, classes, num_detections) = sess.run(
-        [boxes, scores, classes, num_detections],
-        feed_dict={image_tensor: image_np_expanded})
-
-    # Visualization of the results of a detection.
-    vis_util.visualize_boxes_and_labels_on_image_array(
-        image_np,
-        np.squeeze(boxes),
-        np.squeeze(classes).astype(np.int32),
-        np.squeeze(scores),
-        category_index,
-        use_normalized_coordinates=True,
-        line_thickness=8)
-    return image_np
-
-
-def worker(input_q, output_q):
-    # Load a (frozen) Tensorflow model into memory.
-    detection_graph = tf.Graph()
-    with detection_graph.as_default():
-        od_graph_def = tf.GraphDef()
-        with tf.gfile.GFile(PATH_TO_CKPT, 'rb') as fid:
-            serialized_graph = fid.read()
-            od_graph_def.ParseFromString(serialized_graph)
-            tf.import_graph_def(od_graph_def, name='')
-
-        sess = tf.Session(graph=detection_graph)
+    with timed(timings, 'inference'):
+        (boxes, scores, classes, num_detections) = model.run(image_batch)
+
+    # Visualization of the results of a detection, split back out per frame in batch order.
+    with timed(timings, 'visualization'):
+        for image_np, frame_boxes, frame_classes, frame_scores in zip(frames, boxes, classes, scores):
+            vis_util.visualize_boxes_and_labels_on_image_array(
+                image_np,
+                frame_boxes,
+                frame_classes.astype(np.int32),
+                frame_scores,
+                category_index,
+                use_normalized_coordinates=True,
+                line_thickness=8,
+                renderer=renderer)
+    return frames
+
+
+def detect_objects(image_np, model, renderer=None, timings=None):
+    return detect_objects_batch([image_np], model, renderer, timings)[0]
+
+
+def worker(input_q, output_q, frame_buffer, batch_size=1, batch_timeout=0.0, num_warmup_runs=1):
+    # Load a (frozen) Tensorflow model into memory, warmed up on blank batches of
+    # the frame size so the first real frames don't pay for the cold start.
+    model = DetectionModel(PATH_TO_CKPT, num_warmup_runs=num_warmup_runs,
+                           warmup_shape=frame_buffer.shape, warmup_batch_size=batch_size)
+    print(model.report())
+
+    # Draw the detections directly on the frame buffer, reusing the glyph and
+    # label caches across frames.
+    renderer = vis_util.NumpyRenderer()
 
     fps = FPS().start()
     while True:
-        fps.update()
-        frame = input_q.get()
-        # output_q.put(frame)
-        output_q.put(detect_objects(frame, sess, detection_graph))
+        # Collect up to batch_size frames, waiting at most batch_timeout seconds
+        # once the first one has arrived. Only frame sequence numbers and slot
+        # indices go through the queues, the frames are read and drawn on in
+        # shared memory.
+        batch = get_batch(input_q, batch_size, batch_timeout)
+        received = time.monotonic()
+        batch_timings = {}
+        detect_objects_batch([frame_buffer.get(slot) for _, slot, _ in batch],
+                             model, renderer, batch_timings)
+        for sequence, slot, sent in batch:
+            fps.update()
+            # time.monotonic is system wide, so it can be compared with the
+            # timestamp taken by the main process when the frame was queued.
+            timings = dict(batch_timings, queue_wait=received - sent)
+            output_q.put((sequence, slot, timings))
 
     fps.stop()
-    sess.close()
+    model.close()
 
 
 if __name__ == '__main__':
@@ -103,6 +124,21 @@ if __name__ == '__main__':
                         default=1, help='Number of workers.')
     parser.add_argument('-q-size', '--queue-size', dest='queue_size', type=int,
                         default=5, help='Size of the queue.')
+    parser.add_argument('-bs', '--batch-size', dest='batch_size', type=int,
+                        default=4, help='Maximum number of frames per inference batch.')
+    parser.add_argument('-bt', '--batch-timeout', dest='batch_timeout', type=float,
+                        default=10, help='Milliseconds a worker waits to fill a batch.')
+    parser.add_argument('-drop', '--drop-policy', dest='drop_policy', type=str,
+                        default='latest', choices=['latest', 'queue'],
+                        help='Frames kept when behind: only the latest one, or a bounded queue.')
+    parser.add_argument('-cq-size', '--capture-queue-size', dest='capture_queue_size', type=int,
+                        default=5, help='Size of the capture queue for the queue drop policy.')
+    parser.add_argument('-ld', '--latency-dump', dest='latency_dump', type=str,
+                        default=None, help='Path of a .csv or .json file to dump the stage latencies to on exit.')
+    parser.add_argument('-lw', '--latency-window', dest='latency_window', type=int,
+                        default=1000, help='Number of recent frames the latency percentiles are computed over.')
+    parser.add_argument('-wu', '--warmup-runs', dest='warmup_runs', type=int,
+                        default=2, help='Number of blank inferences each worker runs before the first frame.')
     args = parser.parse_args()
 
     logger = multiprocessing.log_to_stderr()
@@ -111,32 +147,82 @@ if __name__ == '__main__':
     input_q = Queue(maxsize=args.queue_size)
     output_q = Queue(maxsize=args.queue_size)
 
-    process = Process(target=worker, args=(input_q, output_q))
-    process.daemon = True
-    pool = Pool(args.num_workers, worker, (input_q, output_q))
-
+    max_queue_size = 1 if args.drop_policy == 'latest' else args.capture_queue_size
     video_capture = WebcamVideoStream(src=args.video_source,
                                       width=args.width,
-                                      height=args.height).start()
-    fps = FPS().start()
+                                      height=args.height,
+                                      max_queue_size=max_queue_size).start()
 
-    while True:  # fps._numFrames < 120
-        frame = video_capture.read()
-        input_q.put(frame)
+    # Keep enough frames in flight for every worker to fill its batches, but no
+    # more than the queues can hold so the workers never block on a full output_q.
+    max_in_flight = max(min(args.num_workers * args.batch_size, args.queue_size), 1)
 
-        t = time.time()
+    # Frames are exchanged through a ring of shared memory slots sized from the
+    # first captured frame, with one extra slot for the frame being displayed.
+    capture_timings = {}
+    with timed(capture_timings, 'capture'):
+        sequence, frame = video_capture.read()
+    frame_buffer = SharedFrameBuffer(max_in_flight + 1, frame.shape)
 
-        cv2.imshow('Video', output_q.get())
-        fps.update()
+    # Workers can finish frames out of order, results are held back until every
+    # frame captured before them has been displayed.
+    reorder_buffer = ReorderBuffer()
 
-        print('[INFO] elapsed time: {:.2f}'.format(time.time() - t))
+    # Parse the frozen graph once here, forked workers inherit the parsed GraphDef.
+    load_graph_def(PATH_TO_CKPT)
+
+    process = Process(target=worker, args=(input_q, output_q, frame_buffer))
+    process.daemon = True
+    pool = Pool(args.num_workers, worker,
+                (input_q, output_q, frame_buffer, args.batch_size, args.batch_timeout / 1000.0,
+                 args.warmup_runs))
+
+    # Rolling per stage latencies, and the capture timings of the frames that
+    # haven't been displayed yet.
+    latency = LatencyRecorder(window=args.latency_window, stages=LATENCY_STAGES)
+    captured = {}
+
+    fps = FPS().start()
 
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    key = None
+    while frame is not None and key != ord('q'):  # fps._numFrames < 120
+        captured[sequence] = (time.monotonic(), capture_timings)
+        input_q.put((sequence, frame_buffer.put(frame), time.monotonic()))
+        reorder_buffer.submit(sequence)
+
+        # Frames held in the reorder buffer still occupy their slots, so they
+        # count as in flight too. Keep reading results until one of them is
+        # released, otherwise the next put would wait for a free slot forever.
+        if len(reorder_buffer) >= max_in_flight or not output_q.empty():
+            t = time.time()
+
+            for done_sequence, slot, timings in drain_results(output_q, reorder_buffer,
+                                                              max_in_flight):
+                with timed(timings, 'display'):
+                    cv2.imshow('Video', frame_buffer.get(slot))
+                    key = cv2.waitKey(1) & 0xFF
+                frame_buffer.release(slot)
+                fps.update()
+
+                captured_time, frame_capture_timings = captured.pop(done_sequence)
+                timings.update(frame_capture_timings)
+                timings['total'] = time.monotonic() - captured_time
+                latency.add(timings)
+
+            print('[INFO] elapsed time: {:.2f}'.format(time.time() - t))
+
+        # Blocks until the camera delivers a frame that hasn't been read yet.
+        capture_timings = {}
+        with timed(capture_timings, 'capture'):
+            sequence, frame = video_capture.read()
 
     fps.stop()
     print('[INFO] elapsed time (total): {:.2f}'.format(fps.elapsed()))
     print('[INFO] approx. FPS: {:.2f}'.format(fps.fps()))
+    print('[INFO] dropped frames: {}'.format(video_capture.dropped))
+    print(latency.report())
+    if args.latency_dump:
+        latency.dump(args.latency_dump)
 
     video_capture.stop()
     cv2.destroyAllWindows()
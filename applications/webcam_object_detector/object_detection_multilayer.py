@@ -1,3 +1,4 @@
+import argparse
 import cv2
 import multiprocessing
 import time
@@ -5,9 +6,9 @@ import time
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 import numpy as np
-import tensorflow as tf
 
-from utils import FPS
+from detection_model import DetectionModel
+from utils import FPS, LatencyRecorder, timed
 from object_detection.utils import label_map_util
 from object_detection.utils import visualization_utils as vis_util
 
@@ -22,6 +23,9 @@ PATH_TO_LABELS = os.path.join(CWD_PATH, 'object_detection', 'data', 'mscoco_labe
 
 NUM_CLASSES = 90
 
+# Stages of the per-frame latency breakdown, in pipeline order.
+LATENCY_STAGES = ['capture', 'queue_wait', 'preprocess', 'inference', 'visualization', 'blend', 'display', 'total']
+
 # Loading label map
 label_map = label_map_util.load_labelmap(PATH_TO_LABELS)
 categories = label_map_util.convert_label_map_to_categories(label_map, max_num_classes=NUM_CLASSES,
@@ -29,34 +33,33 @@ categories = label_map_util.convert_label_map_to_categories(label_map, max_num_c
 category_index = label_map_util.create_category_index(categories)
 
 
-def detect_objects(image_np, sess, detection_graph):
+def detect_objects(image_np, model, renderer=None, timings=None):
+    # Time spent in every stage is added to timings when it is given.
+    if timings is None:
+        timings = {}
+
     # Expand dimensions since the model expects images to have shape: [1, None, None, 3]
-    image_np_expanded = np.expand_dims(image_np, axis=0)
-    image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
+    with timed(timings, 'preprocess'):
+        image_np_expanded = np.expand_dims(image_np, axis=0)
 
+    # Actual detection.
     # Each box represents a part of the image where a particular object was detected.
-    boxes = detection_graph.get_tensor_by_name('detection_boxes:0')
-
     # Each score represent how level of confidence for each of the objects.
     # Score is shown on the result image, together with the class label.
-    scores = detection_graph.get_tensor_by_name('detection_scores:0')
-    classes = detection_graph.get_tensor_by_name('detection_classes:0')
-    num_detections = detection_graph.get_tensor_by_name('num_detections:0')
-
-    # Actual detection.
-    (boxes, scores, classes, num_detections) = sess.run(
-        [boxes, scores, classes, num_detections],
-        feed_dict={image_tensor: image_np_expanded})
+    with timed(timings, 'inference'):
+        (boxes, scores, classes, num_detections) = model.run(image_np_expanded)
 
     # Visualization of the results of a detection.
-    vis_util.visualize_boxes_and_labels_on_image_array(
-        image_np,
-        np.squeeze(boxes),
-        np.squeeze(classes).astype(np.int32),
-        np.squeeze(scores),
-        category_index,
-        use_normalized_coordinates=True,
-        line_thickness=8)
+    with timed(timings, 'visualization'):
+        vis_util.visualize_boxes_and_labels_on_image_array(
+            image_np,
+            np.squeeze(boxes),
+            np.squeeze(classes).astype(np.int32),
+            np.squeeze(scores),
+            category_index,
+            use_normalized_coordinates=True,
+            line_thickness=8,
+            renderer=renderer)
 
     return image_np
 
@@ -90,30 +93,36 @@ def blend_non_transparent(face_img, overlay_img):
 def main_process(input, output):
     while True:
         time.sleep(0.5)
-        image = input.get()
-        output.put(image)
+        sent, image = input.get()
+        # time.monotonic is system wide, so it can be compared with the
+        # timestamp taken by the capture loop when the frame was queued.
+        output.put((sent, image, {'queue_wait': time.monotonic() - sent}))
 
 
 def child_process(input, output):
-    # Load a (frozen) Tensorflow model into memory.
-    detection_graph = tf.Graph()
-    with detection_graph.as_default():
-        od_graph_def = tf.GraphDef()
-        with tf.gfile.GFile(PATH_TO_CKPT, 'rb') as fid:
-            serialized_graph = fid.read()
-            od_graph_def.ParseFromString(serialized_graph)
-            tf.import_graph_def(od_graph_def, name='')
+    # Load a (frozen) Tensorflow model into memory, warmed up on a blank frame.
+    model = DetectionModel(PATH_TO_CKPT, warmup_shape=(360, 480, 3))
+    print(model.report())
 
-        sess = tf.Session(graph=detection_graph)
+    renderer = vis_util.NumpyRenderer()
 
     while True:
-        image = input.get()
-        image2 = detect_objects(image, sess, detection_graph)
-        result = blend_non_transparent(image, image2)
-        output.put(result)
+        sent, image = input.get()
+        timings = {'queue_wait': time.monotonic() - sent}
+        image2 = detect_objects(image, model, renderer, timings)
+        with timed(timings, 'blend'):
+            result = blend_non_transparent(image, image2)
+        output.put((sent, result, timings))
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-ld', '--latency-dump', dest='latency_dump', type=str,
+                        default=None, help='Path of a .csv or .json file to dump the stage latencies to on exit.')
+    parser.add_argument('-lw', '--latency-window', dest='latency_window', type=int,
+                        default=1000, help='Number of recent frames the latency percentiles are computed over.')
+    args = parser.parse_args()
+
     input = multiprocessing.Queue(5)
     output = multiprocessing.Queue(5)
 
@@ -129,12 +138,28 @@ if __name__ == '__main__':
     video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 480)
     video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 360)
 
-    while True:
-        _, frame = video_capture.read()
-
-        input.put(frame)
+    latency = LatencyRecorder(window=args.latency_window, stages=LATENCY_STAGES)
 
-        cv2.imshow('Video', output.get())
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+    while True:
+        capture_timings = {}
+        with timed(capture_timings, 'capture'):
+            _, frame = video_capture.read()
+        latency.add(capture_timings)
+
+        input.put((time.monotonic(), frame))
+
+        # The output can come from either process, so the total latency is
+        # measured from the time the displayed frame itself was queued.
+        sent, result, timings = output.get()
+        with timed(timings, 'display'):
+            cv2.imshow('Video', result)
+            key = cv2.waitKey(1) & 0xFF
+        timings['total'] = time.monotonic() - sent
+        latency.add(timings)
+
+        if key == ord('q'):
             break
+
+    print(latency.report())
+    if args.latency_dump:
+        latency.dump(args.latency_dump)
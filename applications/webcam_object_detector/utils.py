@@ -1,8 +1,16 @@
 # From http://www.pyimagesearch.com/2015/12/21/increasing-webcam-fps-with-python-and-opencv/
 
+import collections
+import contextlib
+import csv
+import ctypes
 import cv2
-import datetime
-from threading import Thread
+import json
+import multiprocessing
+import numpy as np
+import time
+from queue import Empty
+from threading import Condition, Thread
 
 
 class FPS:
@@ -15,12 +23,12 @@ class FPS:
 
     def start(self):
         # start the timer
-        self._start = datetime.datetime.now()
+        self._start = time.monotonic()
         return self
 
     def stop(self):
         # stop the timer
-        self._end = datetime.datetime.now()
+        self._end = time.monotonic()
 
     def update(self):
         # increment the total number of frames examined during the
@@ -30,7 +38,7 @@ class FPS:
     def elapsed(self):
         # return the total number of seconds between the start and
         # end interval
-        return (self._end - self._start).total_seconds()
+        return self._end - self._start
 
     def fps(self):
         # compute the (approximate) frames per second
@@ -38,17 +46,27 @@ class FPS:
 
 
 class WebcamVideoStream:
-    def __init__(self, src, width, height):
+    def __init__(self, src, width, height, max_queue_size=1):
         # initialize the video camera stream and read the first frame
         # from the stream
         self.stream = cv2.VideoCapture(src)
         self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-        (self.grabbed, self.frame) = self.stream.read()
+        (self.grabbed, frame) = self.stream.read()
+
+        # frames are numbered in capture order and kept in a bounded
+        # queue; when the consumer falls behind the oldest frames are
+        # dropped, so a queue size of 1 always hands out the latest frame
+        self.frames = collections.deque(maxlen=max_queue_size)
+        self.sequence = 0
+        self.dropped = 0
+        self.condition = Condition()
+        if self.grabbed:
+            self.frames.append((self.sequence, frame))
 
         # initialize the variable used to indicate if the thread should
         # be stopped
-        self.stopped = False
+        self.stopped = not self.grabbed
 
     def start(self):
         # start the thread to read frames from the video stream
@@ -56,19 +74,210 @@ class WebcamVideoStream:
         return self
 
     def update(self):
-        # keep looping infinitely until the thread is stopped
-        while True:
-            # if the thread indicator variable is set, stop the thread
-            if self.stopped:
-                return
+        # keep looping until the thread is stopped, each read blocks
+        # until the camera delivers the next frame
+        while not self.stopped:
+            (grabbed, frame) = self.stream.read()
 
-            # otherwise, read the next frame from the stream
-            (self.grabbed, self.frame) = self.stream.read()
+            with self.condition:
+                self.grabbed = grabbed
+                if not grabbed:
+                    self.stopped = True
+                else:
+                    self.sequence += 1
+                    if len(self.frames) == self.frames.maxlen:
+                        self.dropped += 1
+                    self.frames.append((self.sequence, frame))
+                # wake up the consumer waiting in read
+                self.condition.notify_all()
 
-    def read(self):
-        # return the frame most recently read
-        return self.frame
+    def read(self, timeout=None):
+        # wait for a frame that has not been returned yet and return it
+        # with its sequence number, or (None, None) once the stream has
+        # ended or the timeout has expired
+        with self.condition:
+            self.condition.wait_for(lambda: self.frames or self.stopped, timeout)
+            if not self.frames:
+                return None, None
+            return self.frames.popleft()
 
     def stop(self):
         # indicate that the thread should be stopped
-        self.stopped = True
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+class ReorderBuffer:
+    def __init__(self):
+        # sequence numbers in submission order, and the results that
+        # came back before all the frames submitted earlier did
+        self._pending = collections.deque()
+        self._done = {}
+
+    def __len__(self):
+        # number of frames submitted but not popped yet
+        return len(self._pending)
+
+    def submit(self, sequence):
+        self._pending.append(sequence)
+
+    def complete(self, sequence, item):
+        self._done[sequence] = item
+
+    def pop_ready(self):
+        # return the completed items that no earlier submitted frame is
+        # still waiting for, in submission order
+        ready = []
+        while self._pending and self._pending[0] in self._done:
+            ready.append(self._done.pop(self._pending.popleft()))
+        return ready
+
+
+def drain_results(output_q, reorder_buffer, max_in_flight):
+    # collect results until fewer than max_in_flight frames are held in
+    # the reorder buffer, and whatever results are already waiting; the
+    # held frames keep their slots, so only popping the head frame frees
+    # one, which can take several results when they arrive out of order.
+    # Returns the results that are ready, in submission order
+    ready = []
+    while len(reorder_buffer) >= max_in_flight or not output_q.empty():
+        result = output_q.get()
+        reorder_buffer.complete(result[0], result)
+        ready.extend(reorder_buffer.pop_ready())
+    return ready
+
+
+def get_batch(queue, max_size, timeout):
+    # block until the first item is available, then keep collecting
+    # items until max_size of them are gathered or timeout seconds
+    # have passed since the first one arrived
+    batch = [queue.get()]
+    deadline = time.time() + timeout
+    while len(batch) < max_size:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(queue.get(timeout=remaining))
+        except Empty:
+            break
+    return batch
+
+
+class SharedFrameBuffer:
+    def __init__(self, num_slots, shape, dtype=np.uint8):
+        # allocate a ring of num_slots frames in shared memory; it has
+        # to be created before the worker processes so they inherit it
+        self.num_slots = num_slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = num_slots * int(np.prod(self.shape)) * self.dtype.itemsize
+        self._array = multiprocessing.RawArray(ctypes.c_uint8, nbytes)
+        self._frames = None
+
+        # indices of the slots that are not in use by any process
+        self._free_slots = multiprocessing.Queue()
+        for slot in range(num_slots):
+            self._free_slots.put(slot)
+
+    def __getstate__(self):
+        # the numpy view is rebuilt lazily in the receiving process
+        state = self.__dict__.copy()
+        state['_frames'] = None
+        return state
+
+    def frames(self):
+        # return a numpy view of all the slots of the ring
+        if self._frames is None:
+            self._frames = np.frombuffer(self._array, dtype=self.dtype).reshape(
+                (self.num_slots,) + self.shape)
+        return self._frames
+
+    def put(self, frame):
+        # copy the frame into a free slot, blocking until one is released,
+        # and return the slot index to send to the other processes
+        if frame.shape != self.shape:
+            raise ValueError('Frame of shape {} does not fit slots of shape {}'.format(
+                frame.shape, self.shape))
+        slot = self._free_slots.get()
+        self.frames()[slot] = frame
+        return slot
+
+    def get(self, slot):
+        # return the frame stored in a slot, without copying it
+        return self.frames()[slot]
+
+    def release(self, slot):
+        # hand the slot back to the ring once the frame has been consumed
+        self._free_slots.put(slot)
+
+
+@contextlib.contextmanager
+def timed(timings, stage):
+    # add the monotonic time spent in the block to timings[stage]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+class LatencyRecorder:
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, window=1000, stages=()):
+        # keep the last window samples (in seconds) of every stage; stages
+        # fixes the order of the known stages, others follow in the order
+        # they are first recorded
+        self.window = window
+        self.samples = collections.OrderedDict(
+            (stage, collections.deque(maxlen=window)) for stage in stages)
+
+    def record(self, stage, seconds):
+        if stage not in self.samples:
+            self.samples[stage] = collections.deque(maxlen=self.window)
+        self.samples[stage].append(seconds)
+
+    def add(self, timings):
+        # record a dict of stage timings, e.g. one filled in with timed()
+        for stage, seconds in timings.items():
+            self.record(stage, seconds)
+
+    def summary(self):
+        # return the sample count, mean and rolling percentiles of every
+        # stage, in milliseconds
+        summary = collections.OrderedDict()
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            samples_ms = 1000.0 * np.array(samples)
+            stats = collections.OrderedDict([('count', len(samples)),
+                                             ('mean_ms', float(np.mean(samples_ms)))])
+            for percentile, value in zip(self.PERCENTILES,
+                                         np.percentile(samples_ms, self.PERCENTILES)):
+                stats['p{}_ms'.format(percentile)] = float(value)
+            summary[stage] = stats
+        return summary
+
+    def report(self):
+        # format the summary as a table, one line per stage
+        lines = ['{:>14} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+            'stage (ms)', 'count', 'mean', 'p50', 'p95', 'p99')]
+        for stage, stats in self.summary().items():
+            lines.append('{:>14} {:>7d} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                stage, *stats.values()))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        # write the summary to a .json file, or to a csv file otherwise
+        summary = self.summary()
+        with open(path, 'w') as f:
+            if path.endswith('.json'):
+                json.dump(summary, f, indent=2)
+            else:
+                writer = csv.writer(f)
+                for i, (stage, stats) in enumerate(summary.items()):
+                    if i == 0:
+                        writer.writerow(['stage'] + list(stats.keys()))
+                    writer.writerow([stage] + list(stats.values()))
@@ -0,0 +1,72 @@
+import queue
+import threading
+import unittest
+
+import numpy as np
+
+from utils import ReorderBuffer, SharedFrameBuffer, drain_results
+
+
+def out_of_order_worker(input_q, output_q, group_size, order):
+    # answer every group of group_size frames in the given order, like
+    # several workers finishing their frames at different times
+    while True:
+        group = [input_q.get() for _ in range(group_size)]
+        if None in group:
+            return
+        for i in order:
+            sequence, slot = group[i]
+            output_q.put((sequence, slot, {}))
+
+
+class DrainResultsTest(unittest.TestCase):
+
+    def test_waits_for_head_of_line_result(self):
+        output_q = queue.Queue()
+        reorder_buffer = ReorderBuffer()
+        for sequence in range(4):
+            reorder_buffer.submit(sequence)
+        for sequence in [1, 2, 3, 0]:
+            output_q.put((sequence, sequence, {}))
+
+        ready = drain_results(output_q, reorder_buffer, max_in_flight=4)
+        self.assertEqual([result[0] for result in ready], [0, 1, 2, 3])
+        self.assertEqual(len(reorder_buffer), 0)
+
+    def test_out_of_order_results_do_not_exhaust_slots(self):
+        max_in_flight = 4
+        num_frames = 40
+        frame_buffer = SharedFrameBuffer(max_in_flight + 1, (2, 2, 3))
+        reorder_buffer = ReorderBuffer()
+        input_q = queue.Queue()
+        output_q = queue.Queue()
+        worker = threading.Thread(target=out_of_order_worker,
+                                  args=(input_q, output_q, max_in_flight, [1, 2, 3, 0]))
+        worker.daemon = True
+        worker.start()
+
+        displayed = []
+
+        def main_loop():
+            # the capture loop of object_detection_app.main
+            for sequence in range(num_frames):
+                frame = np.full((2, 2, 3), sequence, dtype=np.uint8)
+                input_q.put((sequence, frame_buffer.put(frame)))
+                reorder_buffer.submit(sequence)
+                if len(reorder_buffer) >= max_in_flight or not output_q.empty():
+                    for done_sequence, slot, _ in drain_results(output_q, reorder_buffer,
+                                                                max_in_flight):
+                        displayed.append((done_sequence, int(frame_buffer.get(slot)[0, 0, 0])))
+                        frame_buffer.release(slot)
+
+        loop = threading.Thread(target=main_loop)
+        loop.daemon = True
+        loop.start()
+        loop.join(timeout=10)
+        input_q.put(None)
+        self.assertFalse(loop.is_alive(), 'main loop deadlocked')
+        self.assertEqual(displayed, [(i, i) for i in range(num_frames)])
+
+
+if __name__ == '__main__':
+    unittest.main()